@@ -1,50 +1,37 @@
 import streamlit as st
-import pandas as pd
-import pickle
+import importlib
 from datetime import datetime
-from shared import persistence
+from shared import persistence, assets
 from shared.auto_backup import AutoBackup
 from modules.keep_alive import add_keep_alive_settings
-import base64
-from pathlib import Path
 
-# Fonction pour charger le logo en base64
-def get_logo_base64():
-    """Charge le logo GREENLOG en base64 pour l'affichage"""
-    logo_path = Path(__file__).parent / "logo_greenlog.jpg"
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    return None
+# Modules de l'application (clé de st.session_state.current_module → module),
+# importés au premier affichage seulement : la page d'accueil ne charge ni
+# pandas ni openpyxl tant qu'elle n'en a pas besoin
+MODULES = {
+    'retours': 'modules.retours',
+    'dpd': 'modules.dpd',
+    'mondial_relay': 'modules.mondial_relay',
+    'colissimo': 'modules.colissimo',
+    'chronopost': 'modules.chronopost',
+    'dhl': 'modules.dhl',
+    'colis_prive': 'modules.colis_prive',
+    'indemnisations': 'modules.indemnisations',
+    'bibliotheque': 'modules.bibliotheque',
+    'logisticiens_library': 'modules.logisticiens_library',
+    'backup_restore': 'modules.backup_restore',
+    'attendus': 'modules.attendus'
+}
 
-def get_carrier_logo_base64(carrier_name):
-    """Charge un logo de transporteur en base64"""
-    logo_mapping = {
-        'dpd': 'dpd.svg',
-        'mondial_relay': 'mondial_relay.svg',
-        'colissimo': 'colissimo.webp',
-        'chronopost': 'chronopost.png',
-        'colis_prive': 'colis_prive.png',
-        'dhl': 'dhl.png'
-    }
-    
-    logo_file = logo_mapping.get(carrier_name)
-    if not logo_file:
-        return None
-    
-    logo_path = Path(__file__).parent / "logos" / logo_file
-    if logo_path.exists():
-        with open(logo_path, "rb") as f:
-            content = f.read()
-            # Détecter le type MIME
-            if logo_file.endswith('.svg'):
-                mime_type = 'image/svg+xml'
-            elif logo_file.endswith('.webp'):
-                mime_type = 'image/webp'
-            else:
-                mime_type = 'image/png'
-            return base64.b64encode(content).decode(), mime_type
-    return None
+# Données de session exploitées par l'export global
+EXPORT_DATA_KEYS = (
+    'dpd_data', 'mondial_relay_data', 'colissimo_data',
+    'chronopost_data', 'colis_prive_data', 'retours_data'
+)
+
+def load_module(name):
+    """Module d'une page (importé au premier appel, ensuite repris de sys.modules)"""
+    return importlib.import_module(MODULES[name])
 
 # Configuration
 st.set_page_config(
@@ -216,10 +203,10 @@ if not st.session_state.auto_loaded:
 
 # En-tête avec bandeau GREENLOG
 # Bandeau principal GREENLOG
-logo_base64 = get_logo_base64()
+logo_uri = assets.logo_data_uri()
 
-if logo_base64:
-    logo_html = f'<img src="data:image/jpeg;base64,{logo_base64}" width="120" class="greenlog-logo">'
+if logo_uri:
+    logo_html = f'<img src="{logo_uri}" width="120" class="greenlog-logo">'
 else:
     logo_html = '<div style="width: 120px; height: 60px; background: var(--greenlog-green); border-radius: 8px;"></div>'
 
@@ -356,12 +343,8 @@ if st.session_state.current_module is None:
     st.markdown("*Analyse des factures et croisements par transporteur*")
     st.markdown("")
     
-    # Charger tous les logos en base64
-    logos = {}
-    for carrier in ['dpd', 'mondial_relay', 'colissimo', 'colis_prive', 'chronopost', 'dhl']:
-        logo_data = get_carrier_logo_base64(carrier)
-        if logo_data:
-            logos[carrier] = logo_data
+    # Logos en base64 (encodés une fois par processus)
+    logos = {carrier for carrier in assets.CARRIER_LOGOS if assets.carrier_logo_data_uri(carrier)}
     
     # Injecter CSS global pour tous les boutons-logos
     st.markdown("""
@@ -392,14 +375,13 @@ if st.session_state.current_module is None:
     }
     </style>
     """, unsafe_allow_html=True)
+    st.markdown(assets.carrier_buttons_css(), unsafe_allow_html=True)
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
         # DPD
         if 'dpd' in logos:
-            logo_b64, mime = logos['dpd']
-            st.markdown(f'<style>button[key="btn_dpd"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("DPD", key="btn_dpd", type="primary", use_container_width=True):
                 st.session_state.current_module = 'dpd'
                 st.rerun()
@@ -409,8 +391,6 @@ if st.session_state.current_module is None:
         
         # Colis Privé
         if 'colis_prive' in logos:
-            logo_b64, mime = logos['colis_prive']
-            st.markdown(f'<style>button[key="btn_cp"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("Colis Privé", key="btn_cp", type="primary", use_container_width=True):
                 st.session_state.current_module = 'colis_prive'
                 st.rerun()
@@ -419,8 +399,6 @@ if st.session_state.current_module is None:
     with col2:
         # Mondial Relay
         if 'mondial_relay' in logos:
-            logo_b64, mime = logos['mondial_relay']
-            st.markdown(f'<style>button[key="btn_mr"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("Mondial Relay", key="btn_mr", type="primary", use_container_width=True):
                 st.session_state.current_module = 'mondial_relay'
                 st.rerun()
@@ -430,8 +408,6 @@ if st.session_state.current_module is None:
         
         # Colissimo
         if 'colissimo' in logos:
-            logo_b64, mime = logos['colissimo']
-            st.markdown(f'<style>button[key="btn_col"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("Colissimo", key="btn_col", type="primary", use_container_width=True):
                 st.session_state.current_module = 'colissimo'
                 st.rerun()
@@ -440,8 +416,6 @@ if st.session_state.current_module is None:
     with col3:
         # Chronopost
         if 'chronopost' in logos:
-            logo_b64, mime = logos['chronopost']
-            st.markdown(f'<style>button[key="btn_chrono"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("Chronopost", key="btn_chrono", type="primary", use_container_width=True):
                 st.session_state.current_module = 'chronopost'
                 st.rerun()
@@ -451,8 +425,6 @@ if st.session_state.current_module is None:
         
         # DHL
         if 'dhl' in logos:
-            logo_b64, mime = logos['dhl']
-            st.markdown(f'<style>button[key="btn_dhl"] {{ background-image: url("data:{mime};base64,{logo_b64}") !important; }}</style>', unsafe_allow_html=True)
             if st.button("DHL", key="btn_dhl", type="primary", use_container_width=True):
                 st.session_state.current_module = 'dhl'
                 st.rerun()
@@ -467,16 +439,20 @@ if st.session_state.current_module is None:
         st.metric("Modules disponibles", "10")
     with col2:
         # Compter les fichiers dans la bibliothèque logisticiens
-        from modules.logisticiens_library import get_all_available_periods
-        nb_files = len(get_all_available_periods())
+        nb_files = persistence.count_logisticiens_entries()
         st.metric("Fichiers logisticiens", nb_files)
     with col3:
         modules_data = len([k for k in st.session_state.module_data.keys()])
         st.metric("Modules avec données", modules_data)
     
-    # Export global multi-transporteurs
-    from modules import export_global
-    export_global.run_export_interface()
+    # Export global multi-transporteurs (module chargé seulement s'il y a des données)
+    if any(st.session_state.get(key) for key in EXPORT_DATA_KEYS):
+        from modules import export_global
+        export_global.run_export_interface()
+    else:
+        st.markdown("---")
+        st.subheader("💰 Export Refacturation Multi-Transporteurs")
+        st.info("ℹ️ Aucune donnée disponible. Analysez au moins un module transporteur pour pouvoir exporter.")
     
     # Zone dangereuse - Réinitialisation
     st.markdown("---")
@@ -558,50 +534,5 @@ if st.session_state.current_module is None:
             st.rerun()
 
 # Modules
-elif st.session_state.current_module == 'retours':
-    from modules import retours
-    retours.run()
-
-elif st.session_state.current_module == 'dpd':
-    from modules import dpd
-    dpd.run()
-
-elif st.session_state.current_module == 'mondial_relay':
-    from modules import mondial_relay
-    mondial_relay.run()
-
-elif st.session_state.current_module == 'colissimo':
-    from modules import colissimo
-    colissimo.run()
-
-elif st.session_state.current_module == 'chronopost':
-    from modules import chronopost
-    chronopost.run()
-
-elif st.session_state.current_module == 'dhl':
-    from modules import dhl
-    dhl.run()
-
-elif st.session_state.current_module == 'colis_prive':
-    from modules import colis_prive
-    colis_prive.run()
-
-elif st.session_state.current_module == 'indemnisations':
-    from modules import indemnisations
-    indemnisations.run()
-
-elif st.session_state.current_module == 'bibliotheque':
-    from modules import bibliotheque
-    bibliotheque.run()
-
-elif st.session_state.current_module == 'logisticiens_library':
-    from modules import logisticiens_library
-    logisticiens_library.run()
-
-elif st.session_state.current_module == 'backup_restore':
-    from modules import backup_restore
-    backup_restore.run()
-
-elif st.session_state.current_module == 'attendus':
-    from modules import attendus
-    attendus.run()
+elif st.session_state.current_module in MODULES:
+    load_module(st.session_state.current_module).run()
@@ -7,145 +7,110 @@ pour faciliter les mises à jour sans perte de données
 import streamlit as st
 import pickle
 import zipfile
-from io import BytesIO
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
-import json
+from shared import persistence
+from shared.auto_backup import (
+    create_snapshot, snapshot_path, snapshot_chain, read_snapshot_metadata, replay_snapshots,
+    verify_snapshot
+)
+
+def get_data_file_type(relative_path):
+    """
+    Identifie le type de données d'un fichier de .greenlog_data
+    
+    Args:
+        relative_path: Chemin relatif (ex: 'dpd_files.pkl', 'library/2026_01_DPD_ab12cd34.pkl')
+    """
+    # Pour les stockages par clé, le dossier porte le nom de la structure
+    name = relative_path.split('/')[0].lower()
+    
+    if name == persistence.BLOB_DIR:
+        return "🧩 Contenus de fichiers"
+    elif 'indemnisation' in name:
+        return "💶 Indemnisations"
+    elif 'library' in name and 'logisticien' not in name:
+        return "📚 Bibliothèque Analyses"
+    elif 'logisticien' in name:
+        return "📋 Fichiers Logisticiens"
+    elif name.endswith('_files.pkl'):
+        return f"📁 Fichiers {name.replace('_files.pkl', '').upper()}"
+    elif name.endswith('_data.pkl') or name.endswith('_data'):
+        return f"📊 Données {name.replace('_data.pkl', '').replace('_data', '').upper()}"
+    return "Autre"
 
 def export_all_data():
     """
     Exporte TOUTES les données de l'application dans un fichier ZIP
     Inclut : bibliothèque, indemnisations, fichiers logisticiens, tous les modules
     
+    La sauvegarde est complète (se restaure seule) et devient la base des
+    sauvegardes automatiques incrémentales suivantes. Le ZIP est écrit en
+    flux sur disque ; son contenu n'est lu qu'au téléchargement.
+    
     Returns:
-        tuple: (BytesIO: zip_buffer, int: files_count, list: files_details)
+        tuple: (callable renvoyant les octets du ZIP, int: files_count, list: files_details)
     """
-    zip_buffer = BytesIO()
-    files_details = []
+    entry = create_snapshot('manual', full=True)
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        # Dossier des données
-        data_dir = Path(".greenlog_data")
-        
-        files_added = 0
-        total_size = 0
-        
-        if not data_dir.exists():
-            # Aucune donnée
-            zip_file.writestr('README.txt', 'Aucune donnée à sauvegarder - dossier .greenlog_data vide')
-        else:
-            # Lister TOUS les fichiers .pkl
-            all_pkl_files = sorted(data_dir.glob("*.pkl"))
-            
-            if not all_pkl_files:
-                zip_file.writestr('README.txt', 'Aucun fichier .pkl trouvé dans .greenlog_data')
-            
-            # Sauvegarder CHAQUE fichier .pkl trouvé
-            for pkl_file in all_pkl_files:
-                try:
-                    # Lire le fichier
-                    with open(pkl_file, 'rb') as f:
-                        data = f.read()
-                    
-                    file_size = len(data)
-                    
-                    # Ajouter au ZIP avec le chemin complet
-                    zip_path = f"data/{pkl_file.name}"
-                    zip_file.writestr(zip_path, data)
-                    
-                    files_added += 1
-                    total_size += file_size
-                    
-                    # Identifier le type de données
-                    file_type = "Autre"
-                    if 'indemnisation' in pkl_file.name.lower():
-                        file_type = "💶 Indemnisations"
-                    elif 'library' in pkl_file.name.lower() and 'logisticien' not in pkl_file.name.lower():
-                        file_type = "📚 Bibliothèque Analyses"
-                    elif 'logisticien' in pkl_file.name.lower():
-                        file_type = "📋 Fichiers Logisticiens"
-                    elif pkl_file.name.endswith('_files.pkl'):
-                        module = pkl_file.name.replace('_files.pkl', '')
-                        file_type = f"📁 Fichiers {module.upper()}"
-                    elif pkl_file.name.endswith('_data.pkl'):
-                        module = pkl_file.name.replace('_data.pkl', '')
-                        file_type = f"📊 Données {module.upper()}"
-                    
-                    files_details.append({
-                        'name': pkl_file.name,
-                        'type': file_type,
-                        'size': file_size,
-                        'size_kb': round(file_size / 1024, 2)
-                    })
-                    
-                except Exception as e:
-                    error_msg = f"Erreur sauvegarde {pkl_file.name}: {str(e)}"
-                    zip_file.writestr(f"errors/{pkl_file.name}.txt", error_msg)
-                    files_details.append({
-                        'name': pkl_file.name,
-                        'type': '❌ ERREUR',
-                        'size': 0,
-                        'size_kb': 0,
-                        'error': str(e)
-                    })
-        
-        # Ajouter métadonnées complètes
-        metadata = {
-            'export_date': datetime.now().isoformat(),
-            'version': 'pilot by GREENLOG v1.0',
-            'files_count': files_added,
-            'total_size_bytes': total_size,
-            'total_size_mb': round(total_size / (1024 * 1024), 2),
-            'data_directory': str(data_dir),
-            'files_details': files_details,
-            'categories': {
-                'indemnisations': len([f for f in files_details if 'indemnisation' in f['name'].lower()]),
-                'bibliotheque': len([f for f in files_details if 'library' in f['name'].lower() and 'logisticien' not in f['name'].lower()]),
-                'logisticiens': len([f for f in files_details if 'logisticien' in f['name'].lower()]),
-                'modules_data': len([f for f in files_details if f['name'].endswith('_data.pkl')]),
-                'modules_files': len([f for f in files_details if f['name'].endswith('_files.pkl')])
-            }
+    files_details = [
+        {
+            'name': relative_path,
+            'type': get_data_file_type(relative_path),
+            'size': info['size'],
+            'size_kb': round(info['size'] / 1024, 2)
         }
-        
-        zip_file.writestr('metadata.json', json.dumps(metadata, indent=2, ensure_ascii=False))
-        
-        # Ajouter un README explicatif
-        readme = f"""
-SAUVEGARDE PILOT BY GREENLOG
-=============================
-
-Date de création: {datetime.now().strftime('%d/%m/%Y à %H:%M:%S')}
-Nombre de fichiers: {files_added}
-Taille totale: {round(total_size / (1024 * 1024), 2)} MB
-
-CONTENU:
---------
-{chr(10).join([f"- {f['type']}: {f['name']} ({f['size_kb']} KB)" for f in files_details])}
+        for relative_path, info in entry['files'].items()
+    ]
+    for relative_path, error in entry['errors'].items():
+        files_details.append({
+            'name': relative_path,
+            'type': '❌ ERREUR',
+            'size': 0,
+            'size_kb': 0,
+            'error': error
+        })
+    
+    return snapshot_path(entry).read_bytes, entry['files_count'], files_details
 
-RESTAURATION:
--------------
-1. Ouvrir pilot by GREENLOG
-2. Aller dans "Sauvegarde & Restauration"
-3. Onglet "Restaurer"
-4. Upload de ce fichier ZIP
-5. Cliquer "Restaurer les données"
-6. Recharger la page (F5)
-"""
-        zip_file.writestr('README.txt', readme)
+def _import_legacy_zip(zip_file, data_dir):
+    """Restaure une sauvegarde sans inventaire (format antérieur aux incrémentales)"""
+    files_restored = 0
     
-    zip_buffer.seek(0)
-    return zip_buffer, files_added, files_details
+    # Restaurer tous les fichiers .pkl (manifestes des stockages par clé, contenus .bin)
+    for file_info in zip_file.namelist():
+        if file_info.startswith('data/') and file_info.endswith(('.pkl', '.json', '.bin')):
+            # Chemin relatif (sans remontée hors du dossier)
+            relative_parts = [p for p in Path(file_info).parts[1:] if p not in ('..', '')]
+            if not relative_parts:
+                continue
+            target = data_dir.joinpath(*relative_parts)
+            
+            # Copier par blocs dans le dossier .greenlog_data (atomique)
+            with zip_file.open(file_info) as content:
+                persistence.atomic_write_stream(target, content)
+            
+            files_restored += 1
+    
+    return files_restored
 
-def import_all_data(uploaded_file):
+def import_all_data(uploaded_files):
     """
-    Importe toutes les données depuis un fichier ZIP de sauvegarde
+    Importe toutes les données depuis une ou plusieurs sauvegardes ZIP
+    
+    Une sauvegarde incrémentale se restaure avec sa sauvegarde complète et
+    les incrémentales intermédiaires (fichiers fournis dans n'importe quel ordre).
     
     Args:
-        uploaded_file: Fichier ZIP uploadé
+        uploaded_files: Fichier ZIP uploadé, ou liste de fichiers ZIP
         
     Returns:
         tuple: (success: bool, message: str, files_count: int)
     """
+    if not isinstance(uploaded_files, (list, tuple)):
+        uploaded_files = [uploaded_files]
+    
     try:
         # Créer dossier .greenlog_data s'il n'existe pas
         data_dir = Path(".greenlog_data")
@@ -153,31 +118,27 @@ def import_all_data(uploaded_file):
         
         files_restored = 0
         
-        with zipfile.ZipFile(uploaded_file, 'r') as zip_file:
-            # Lire métadonnées
-            try:
-                metadata_content = zip_file.read('metadata.json')
-                metadata = json.loads(metadata_content)
-                export_date = metadata.get('export_date', 'Inconnue')
-                original_files = metadata.get('files_count', 0)
-            except:
-                export_date = 'Inconnue'
-                original_files = 0
+        with ExitStack() as stack:
+            zip_files = [stack.enter_context(zipfile.ZipFile(f, 'r')) for f in uploaded_files]
+            metadatas = [read_snapshot_metadata(zip_file) for zip_file in zip_files]
             
-            # Restaurer tous les fichiers .pkl
-            for file_info in zip_file.namelist():
-                if file_info.startswith('data/') and file_info.endswith('.pkl'):
-                    # Extraire le nom du fichier
-                    filename = Path(file_info).name
-                    
-                    # Lire le contenu
-                    content = zip_file.read(file_info)
-                    
-                    # Écrire dans le dossier .greenlog_data
-                    with open(data_dir / filename, 'wb') as f:
-                        f.write(content)
-                    
-                    files_restored += 1
+            # Intégrité (CRC + SHA-256) vérifiée avant d'écrire quoi que ce soit
+            for uploaded, zip_file in zip(uploaded_files, zip_files):
+                problems = verify_snapshot(zip_file)
+                if problems:
+                    name = getattr(uploaded, 'name', 'sauvegarde')
+                    return False, f"❌ Archive {name} endommagée : " + " ; ".join(problems[:5]), 0
+            
+            if any(metadata.get('snapshot_id') for metadata in metadatas):
+                # Base complète + incrémentales
+                files_restored, metadata = replay_snapshots(
+                    [z for z, m in zip(zip_files, metadatas) if m.get('snapshot_id')], data_dir
+                )
+                export_date = metadata.get('export_date', 'Inconnue')
+            else:
+                export_date = next((m['export_date'] for m in metadatas if 'export_date' in m), 'Inconnue')
+                for zip_file in zip_files:
+                    files_restored += _import_legacy_zip(zip_file, data_dir)
         
         if files_restored == 0:
             return False, "❌ Aucun fichier de données trouvé dans la sauvegarde", 0
@@ -293,7 +254,7 @@ def run():
                 st.warning("⚠️ Le dossier `.greenlog_data` n'existe pas encore")
                 st.info("Utilisez d'abord les modules pour créer des données")
             else:
-                all_pkl = sorted(data_dir.glob("*.pkl"))
+                all_pkl = persistence.list_data_files()
                 if not all_pkl:
                     st.warning("⚠️ Aucun fichier .pkl trouvé")
                 else:
@@ -301,31 +262,12 @@ def run():
                     
                     for pkl_file in all_pkl:
                         size_kb = pkl_file.stat().st_size / 1024
+                        relative_path = pkl_file.relative_to(data_dir).as_posix()
                         
-                        # Identifier le type
-                        if 'indemnisation' in pkl_file.name.lower():
-                            icon = "💶"
-                            label = "Indemnisations"
-                        elif 'library' in pkl_file.name and 'logisticien' not in pkl_file.name:
-                            icon = "📚"
-                            label = "Bibliothèque"
-                        elif 'logisticien' in pkl_file.name:
-                            icon = "📋"
-                            label = "Logisticiens"
-                        elif '_data.pkl' in pkl_file.name:
-                            icon = "📊"
-                            label = "Données module"
-                        elif '_files.pkl' in pkl_file.name:
-                            icon = "📁"
-                            label = "Fichiers module"
-                        else:
-                            icon = "📄"
-                            label = "Autre"
-                        
-                        st.write(f"{icon} `{pkl_file.name}` - {size_kb:.2f} KB - {label}")
+                        st.write(f"`{relative_path}` - {size_kb:.2f} KB - {get_data_file_type(relative_path)}")
                     
                     # Vérification spécifique indemnisations
-                    has_indemnisations = any('indemnisation' in f.name.lower() for f in all_pkl)
+                    has_indemnisations = any('indemnisation' in f.as_posix().lower() for f in all_pkl)
                     if has_indemnisations:
                         st.success("✅ **Indemnisations présentes - elles SERONT sauvegardées**")
                     else:
@@ -333,6 +275,28 @@ def run():
         
         st.markdown("---")
         
+        # Chaîne de sauvegardes enregistrées (complète + incrémentales)
+        chain = snapshot_chain()
+        if chain:
+            with st.expander(f"🗂️ Sauvegardes enregistrées ({len(chain)})"):
+                st.caption("Pour restaurer l'état le plus récent, téléchargez la sauvegarde complète et toutes les incrémentales")
+                
+                def describe(entry):
+                    kind = "Complète" if entry['kind'] == 'full' else "Incrémentale"
+                    date = datetime.fromisoformat(entry['date']).strftime('%d/%m/%Y %H:%M:%S')
+                    return f"{kind} du {date} - {entry['added_count']} fichier(s), {entry['size'] / 1024:.1f} KB"
+                
+                selected = st.selectbox("Sauvegarde", chain, format_func=describe, index=len(chain) - 1)
+                zip_path = snapshot_path(selected)
+                if zip_path.exists():
+                    st.download_button(
+                        label="📥 Télécharger cette sauvegarde",
+                        data=zip_path.read_bytes,  # lu au clic seulement
+                        file_name=selected['filename'],
+                        mime="application/zip",
+                        key=f"snapshot_{selected['id']}"
+                    )
+        
         # Bouton de sauvegarde
         if st.button("💾 Créer la sauvegarde", type="primary", use_container_width=True):
             with st.spinner("Création de la sauvegarde..."):
@@ -422,20 +386,37 @@ def run():
         
         st.markdown("---")
         
-        # Upload du fichier
-        uploaded_file = st.file_uploader(
+        # Upload des fichiers
+        uploaded_files = st.file_uploader(
             "📁 Sélectionnez votre fichier de sauvegarde (.zip)",
             type=['zip'],
-            help="Fichier ZIP créé avec l'onglet 'Sauvegarder'"
+            accept_multiple_files=True,
+            help="Fichier ZIP créé avec l'onglet 'Sauvegarder'. Pour une sauvegarde incrémentale, "
+                 "sélectionnez aussi la sauvegarde complète (FULL) et les incrémentales (INCR) précédentes"
         )
         
-        if uploaded_file is not None:
-            st.success(f"✅ Fichier chargé : {uploaded_file.name}")
+        if uploaded_files:
+            st.success(f"✅ Fichier(s) chargé(s) : {', '.join(f.name for f in uploaded_files)}")
+            
+            # Vérification seule (aucune donnée modifiée)
+            if st.button("🔍 Vérifier l'archive", use_container_width=True):
+                with st.spinner("Vérification en cours..."):
+                    for uploaded in uploaded_files:
+                        try:
+                            with zipfile.ZipFile(uploaded, 'r') as zip_file:
+                                problems = verify_snapshot(zip_file)
+                        except zipfile.BadZipFile as e:
+                            problems = [f"Archive illisible : {str(e)}"]
+                        uploaded.seek(0)
+                        if problems:
+                            st.error(f"❌ {uploaded.name} : " + " ; ".join(problems))
+                        else:
+                            st.success(f"✅ {uploaded.name} : archive intacte")
             
             # Bouton de restauration
             if st.button("🔄 Restaurer les données", type="primary", use_container_width=True):
                 with st.spinner("Restauration en cours..."):
-                    success, message, files_count = import_all_data(uploaded_file)
+                    success, message, files_count = import_all_data(uploaded_files)
                     
                     if success:
                         st.success(message)
@@ -29,8 +29,8 @@ def format_file_size(size_bytes):
     return f"{size_bytes:.1f} TB"
 
 def get_library_stats():
-    """Retourne les statistiques de la bibliothèque"""
-    library = persistence.load_library()
+    """Retourne les statistiques de la bibliothèque (depuis le catalogue)"""
+    library = persistence.load_library_catalogue()
     if not library:
         return {
             'total_analyses': 0,
@@ -53,26 +53,29 @@ def get_library_stats():
     }
 
 def get_analyses_by_period(period_year, period_month):
-    """Récupère toutes les analyses d'une période"""
-    library = persistence.load_library()
+    """Récupère le catalogue des analyses d'une période (sans les DataFrames)"""
+    library = persistence.load_library_catalogue()
     if not library:
         return {}
     
     period_key = f"{period_year}_{period_month:02d}"
     return library.get(period_key, {})
 
+def load_analysis(period_year, period_month, transporteur, index):
+    """Matérialise une analyse archivée (DataFrames compris)"""
+    period_key = f"{period_year}_{period_month:02d}"
+    return persistence.load_library_analysis(period_key, transporteur, index)
+
 def delete_period(period_year, period_month):
     """Supprime tous les fichiers d'une période"""
-    library = persistence.load_library()
+    library = persistence.load_library_catalogue()
     if not library:
         return False
     
     period_key = f"{period_year}_{period_month:02d}"
     
     if period_key in library:
-        del library[period_key]
-        persistence.save_library(library)
-        return True
+        return persistence.delete_library_period(period_key)
     
     return False
 
@@ -136,7 +139,7 @@ def run():
     with tab1:
         st.subheader("📋 Consulter les Analyses par Période")
         
-        library = persistence.load_library()
+        library = persistence.load_library_catalogue()
         
         if not library:
             st.info("📚 Aucune analyse archivée")
@@ -216,6 +219,9 @@ def run():
                                     st.caption(f"📅 Analysé le : {analyse.get('analyzed_at', 'Date inconnue')}")
                                     st.caption(f"📊 Lignes : {analyse.get('nb_rows', 'N/A')}")
                                     
+                                    if analyse.get('match_rate') not in (None, 'N/A'):
+                                        st.caption(f"🎯 Taux de correspondance : {analyse['match_rate']}")
+                                    
                                     # Afficher la plage de dates si disponible
                                     if analyse.get('date_range'):
                                         st.caption(f"📆 Période des dates : {analyse['date_range']}")
@@ -226,8 +232,9 @@ def run():
                                 with col2:
                                     # Bouton pour charger l'analyse
                                     if st.button("📂 Charger", key=f"load_{year}_{month}_{transporteur}_{idx}"):
-                                        # Charger les données dans le session_state du module correspondant
-                                        module_data = analyse.get('data', {})
+                                        # Matérialiser l'analyse (seul moment où ses DataFrames sont lus)
+                                        analyse_data = load_analysis(year, month, transporteur, idx)
+                                        module_data = (analyse_data or {}).get('data', {})
                                         
                                         # Mapper le nom du transporteur au module
                                         module_mapping = {
@@ -401,7 +408,7 @@ def run():
     with tab2:
         st.subheader("🗑️ Gérer l'Espace de Stockage")
         
-        library = persistence.load_library()
+        library = persistence.load_library_catalogue()
         
         if not library:
             st.info("📚 Aucune analyse archivée")
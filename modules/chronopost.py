@@ -8,35 +8,98 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime
-from io import BytesIO
-from openpyxl import Workbook
+from pathlib import Path
+import json
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
 from openpyxl.styles import Font, PatternFill, Alignment
 from shared import persistence
+from shared.ingestion import parse_files
+from shared.excel_export import CellStyle, new_workbook, save_workbook, write_dataframe
 
 # ============================================================================
-# GRILLES TARIFAIRES INTÉGRÉES
+# GRILLES TARIFAIRES (fichiers versionnés modules/tarifs/chronopost_<version>.json)
 # ============================================================================
+# Chaque zone définit ses bornes de tranches de poids (kg, intervalles
+# ]min, max]) et un prix par tranche pour chacun de ses pays. Une nouvelle
+# grille annuelle = un nouveau fichier : la version la plus récente est
+# utilisée.
 
-TARIFS_FRANCE = {
-    '0.00 - 0.50': 2.45, '0.50 - 1.00': 2.54, '1.00 - 2.00': 2.87,
-    '2.00 - 3.00': 3.30, '3.00 - 4.00': 3.80, '4.00 - 5.00': 4.25,
-    '5.00 - 6.00': 4.70, '6.00 - 7.00': 5.20, '7.00 - 8.00': 5.60,
-    '8.00 - 9.00': 7.26, '9.00 - 10.00': 6.55, '10.00 - 11.00': 7.00,
-    '11.00 - 12.00': 7.50, '12.00 - 13.00': 7.95, '13.00 - 14.00': 8.40,
-    '14.00 - 15.00': 8.85, '15.00 - 16.00': 9.35, '16.00 - 17.00': 9.80,
-    '17.00 - 18.00': 10.25, '18.00 - 19.00': 10.75, '19.00 - 20.00': 11.20
-}
+TARIFS_DIR = Path(__file__).parent / 'tarifs'
 
-TARIFS_EUROPE = {
-    '0.00 - 0.50': {'AT': 9.00, 'BE': 3.68, 'BG': 8.72, 'CH': 9.00, 'CZ': 8.72, 'DE': 4.45, 'DK': 8.72, 'EE': 8.72, 'ES': 6.01, 'FI': 8.72, 'HR': 8.72, 'HU': 8.72, 'IE': 8.72, 'IT': 6.01, 'LT': 8.72, 'LU': 4.45, 'LV': 8.72, 'NL': 4.45, 'PL': 8.72, 'PT': 8.72, 'RO': 8.72, 'SE': 9.89, 'SI': 9.00, 'SK': 9.00},
-    '0.50 - 1.00': {'AT': 9.23, 'BE': 3.80, 'BG': 9.00, 'CH': 9.23, 'CZ': 9.00, 'DE': 4.75, 'DK': 9.00, 'EE': 9.00, 'ES': 6.36, 'FI': 9.00, 'HR': 9.00, 'HU': 9.00, 'IE': 9.00, 'IT': 6.36, 'LT': 9.00, 'LU': 4.75, 'LV': 9.00, 'NL': 4.75, 'PL': 9.00, 'PT': 9.00, 'RO': 9.00, 'SE': 10.12, 'SI': 9.23, 'SK': 9.23},
-    '1.00 - 2.00': {'AT': 9.58, 'BE': 4.15, 'BG': 10.00, 'CH': 10.23, 'CZ': 10.00, 'DE': 5.50, 'DK': 10.00, 'EE': 10.00, 'ES': 8.97, 'FI': 10.00, 'HR': 10.00, 'HU': 10.00, 'IE': 10.00, 'IT': 8.97, 'LT': 10.00, 'LU': 5.50, 'LV': 10.00, 'NL': 5.50, 'PL': 10.00, 'PT': 10.00, 'RO': 10.00, 'SE': 10.47, 'SI': 9.58, 'SK': 9.58},
-    '2.00 - 3.00': {'AT': 12.19, 'BE': 6.88, 'BG': 11.70, 'CH': 12.00, 'CZ': 11.70, 'DE': 7.36, 'DK': 11.70, 'EE': 11.70, 'ES': 9.66, 'FI': 11.70, 'HR': 11.70, 'HU': 11.70, 'IE': 11.70, 'IT': 9.66, 'LT': 11.70, 'LU': 8.05, 'LV': 11.70, 'NL': 7.36, 'PL': 11.70, 'PT': 11.70, 'RO': 11.70, 'SE': 13.08, 'SI': 12.19, 'SK': 12.19},
-    '3.00 - 5.00': {'AT': 12.88, 'BE': 7.57, 'BG': 14.40, 'CH': 15.00, 'CZ': 14.40, 'DE': 8.74, 'DK': 14.40, 'EE': 14.40, 'ES': 10.35, 'FI': 14.40, 'HR': 14.40, 'HU': 14.40, 'IE': 14.40, 'IT': 10.35, 'LT': 14.40, 'LU': 9.43, 'LV': 14.40, 'NL': 8.74, 'PL': 14.40, 'PT': 14.40, 'RO': 14.40, 'SE': 13.77, 'SI': 12.88, 'SK': 12.88},
-    '5.00 - 7.00': {'AT': 14.95, 'BE': 9.64, 'BG': 17.15, 'CH': 18.00, 'CZ': 17.15, 'DE': 10.12, 'DK': 17.15, 'EE': 17.15, 'ES': 11.73, 'FI': 17.15, 'HR': 17.15, 'HU': 17.15, 'IE': 17.15, 'IT': 11.73, 'LT': 17.15, 'LU': 11.50, 'LV': 17.15, 'NL': 10.12, 'PL': 17.15, 'PT': 17.15, 'RO': 17.15, 'SE': 15.84, 'SI': 14.95, 'SK': 14.95},
-    '7.00 - 10.00': {'AT': 16.33, 'BE': 11.02, 'BG': 21.25, 'CH': 22.50, 'CZ': 21.25, 'DE': 11.50, 'DK': 21.25, 'EE': 21.25, 'ES': 13.11, 'FI': 21.25, 'HR': 21.25, 'HU': 21.25, 'IE': 21.25, 'IT': 13.11, 'LT': 21.25, 'LU': 13.88, 'LV': 21.25, 'NL': 11.50, 'PL': 21.25, 'PT': 21.25, 'RO': 21.25, 'SE': 17.22, 'SI': 16.33, 'SK': 16.33},
-    '10.00 - 15.00': {'AT': 20.47, 'BE': 15.16, 'BG': 26.75, 'CH': 28.50, 'CZ': 26.75, 'DE': 16.33, 'DK': 26.75, 'EE': 26.75, 'ES': 17.94, 'FI': 26.75, 'HR': 26.75, 'HU': 26.75, 'IE': 26.75, 'IT': 17.94, 'LT': 26.75, 'LU': 20.16, 'LV': 26.75, 'NL': 16.33, 'PL': 26.75, 'PT': 26.75, 'RO': 26.75, 'SE': 21.36, 'SI': 20.47, 'SK': 20.47}
-}
+_tariff_table = None
+
+def load_tariff_table(filepath=None):
+    """
+    Charge une grille tarifaire et la compile en table de tarifs
+    
+    Les bornes de toutes les zones sont fusionnées ; chaque pays reçoit une
+    ligne de prix sur ces tranches communes (NaN hors de sa grille).
+    
+    Args:
+        filepath: fichier de grille (None = version la plus récente de TARIFS_DIR)
+    
+    Returns:
+        dict: {'version', 'edges' (bornes), 'countries' (pd.Index), 'prices' (matrice pays × tranche)}
+    """
+    if filepath is None:
+        filepath = max(TARIFS_DIR.glob('chronopost_*.json'), key=lambda f: f.stem)
+    
+    with open(filepath, encoding='utf-8') as f:
+        grid = json.load(f)
+    
+    edges = np.unique(np.concatenate([zone['tranches'] for zone in grid['zones'].values()]))
+    countries = []
+    rows = []
+    for zone in grid['zones'].values():
+        zone_edges = np.asarray(zone['tranches'], dtype=float)
+        # Tranche de la zone couvrant chaque tranche commune (par sa borne haute)
+        bracket = np.searchsorted(zone_edges, edges[1:], side='left') - 1
+        covered = (bracket >= 0) & (bracket < len(zone_edges) - 1)
+        for country, prices in zone['pays'].items():
+            row = np.full(len(edges) - 1, np.nan)
+            row[covered] = np.asarray(prices, dtype=float)[bracket[covered]]
+            countries.append(country)
+            rows.append(row)
+    
+    return {
+        'version': grid.get('version', Path(filepath).stem),
+        'edges': edges,
+        'countries': pd.Index(countries),
+        'prices': np.vstack(rows) if rows else np.empty((0, len(edges) - 1))
+    }
+
+def get_tariff_table():
+    """Table de tarifs en vigueur (compilée une fois par processus)"""
+    global _tariff_table
+    if _tariff_table is None:
+        _tariff_table = load_tariff_table()
+    return _tariff_table
+
+def get_theoretical_prices(weights_kg, countries, table=None):
+    """
+    Prix théoriques HT pour des colonnes entières (poids en kg, code pays)
+    
+    Tranche trouvée par np.searchsorted sur les bornes, prix lu dans la
+    matrice pays × tranche. Poids manquant, nul, hors grille ou pays
+    inconnu → NaN.
+    
+    Returns:
+        np.ndarray de float
+    """
+    if table is None:
+        table = get_tariff_table()
+    
+    weights = pd.to_numeric(pd.Series(weights_kg), errors='coerce').to_numpy(dtype=float)
+    edges = table['edges']
+    
+    bracket = np.searchsorted(edges, weights, side='left') - 1
+    country = table['countries'].get_indexer(pd.Series(countries, dtype=object))
+    valid = (weights > edges[0]) & (weights <= edges[-1]) & (country >= 0)
+    
+    prices = np.full(len(weights), np.nan)
+    prices[valid] = table['prices'][country[valid], bracket[valid]]
+    return prices
 
 # ============================================================================
 # FONCTIONS UTILITAIRES
@@ -44,210 +107,205 @@ TARIFS_EUROPE = {
 
 def get_theoretical_price(weight_kg, country):
     """Calcul du prix théorique selon le poids et le pays"""
-    if pd.isna(weight_kg) or weight_kg <= 0:
+    price = get_theoretical_prices([weight_kg], [country])[0]
+    return None if np.isnan(price) else float(price)
+
+# ============================================================================
+# LECTURE DES FACTURES (feuille 'Table 1', un seul passage)
+# ============================================================================
+
+INVOICE_SHEET = 'Table 1'
+
+# Préfixes des numéros de tracking Chronopost
+TRACKING_PREFIXES = ('XR', 'XA', 'XT', '2L', '6A', 'LD', 'MH')
+
+# Les surplus sont cherchés à partir de cette ligne (index 0 = ligne 1)
+SURPLUS_FIRST_ROW = 100
+
+# Valeurs lues comme vides, comme pd.read_excel (na_values par défaut)
+EXCEL_NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null'
+}
+
+def _excel_value(value):
+    """Valeur de cellule telle que la rend pd.read_excel (None si vide)"""
+    if value is None:
         return None
+    if isinstance(value, str):
+        return None if value in EXCEL_NA_STRINGS or value in ERROR_CODES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def iter_invoice_rows(uploaded_file):
+    """
+    Parcourt la feuille 'Table 1' ligne par ligne (openpyxl read_only)
     
-    # Déterminer la tranche de poids
-    if weight_kg <= 0.5:
-        weight_range = '0.00 - 0.50'
-    elif weight_kg <= 1.0:
-        weight_range = '0.50 - 1.00'
-    elif weight_kg <= 2.0:
-        weight_range = '1.00 - 2.00'
-    elif weight_kg <= 3.0:
-        weight_range = '2.00 - 3.00'
-    elif weight_kg <= 4.0:
-        weight_range = '3.00 - 4.00'
-    elif weight_kg <= 5.0:
-        weight_range = '4.00 - 5.00' if country == 'FR' else '3.00 - 5.00'
-    elif weight_kg <= 6.0:
-        weight_range = '5.00 - 6.00'
-    elif weight_kg <= 7.0:
-        weight_range = '6.00 - 7.00' if country == 'FR' else '5.00 - 7.00'
-    elif weight_kg <= 8.0:
-        weight_range = '7.00 - 8.00'
-    elif weight_kg <= 9.0:
-        weight_range = '8.00 - 9.00'
-    elif weight_kg <= 10.0:
-        weight_range = '9.00 - 10.00' if country == 'FR' else '7.00 - 10.00'
-    elif weight_kg <= 11.0:
-        weight_range = '10.00 - 11.00'
-    elif weight_kg <= 12.0:
-        weight_range = '11.00 - 12.00'
-    elif weight_kg <= 13.0:
-        weight_range = '12.00 - 13.00'
-    elif weight_kg <= 14.0:
-        weight_range = '13.00 - 14.00'
-    elif weight_kg <= 15.0:
-        weight_range = '14.00 - 15.00' if country == 'FR' else '10.00 - 15.00'
-    elif weight_kg <= 16.0:
-        weight_range = '15.00 - 16.00'
-    elif weight_kg <= 17.0:
-        weight_range = '16.00 - 17.00'
-    elif weight_kg <= 18.0:
-        weight_range = '17.00 - 18.00'
-    elif weight_kg <= 19.0:
-        weight_range = '18.00 - 19.00'
-    elif weight_kg <= 20.0:
-        weight_range = '19.00 - 20.00'
-    else:
+    Aucune copie complète de la feuille en mémoire : chaque ligne est un
+    tuple de valeurs (None pour une cellule vide), index 0 = ligne 1.
+    """
+    wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        ws = wb[INVOICE_SHEET]
+        ws.reset_dimensions()
+        for row in ws.iter_rows(values_only=True):
+            yield tuple(_excel_value(v) for v in row)
+    finally:
+        wb.close()
+
+def _cell(row, col):
+    return row[col] if 0 <= col < len(row) else None
+
+def _is_invoice_header(row):
+    """Ligne d'en-tête de section : 'Date' et '...objet...' dans les 10 premières colonnes"""
+    has_date = False
+    has_tracking = False
+    for val in row[:10]:
+        if val is not None:
+            val_str = str(val).strip()
+            if val_str in ['Date', 'DATE']:
+                has_date = True
+            if 'objet' in val_str.lower():
+                has_tracking = True
+    return has_date and has_tracking
+
+def _invoice_columns(header_row):
+    """Positions des colonnes date / tracking / poids / montant / obs d'une section"""
+    columns = {'date': None, 'tracking': None, 'poids': None, 'montant': None, 'obs': None}
+    for j, val in enumerate(header_row):
+        if val is not None:
+            val_str = str(val).strip().lower()
+            if val_str == 'date':
+                columns['date'] = j
+            elif 'objet' in val_str:
+                columns['tracking'] = j
+            elif val_str == 'poids':
+                columns['poids'] = j
+            elif 'montant' in val_str:
+                columns['montant'] = j
+            elif val_str == 'obs':
+                columns['obs'] = j
+    return columns
+
+def _invoice_line(row, columns):
+    """Ligne de facture (dict) ou None si la ligne ne porte pas de tracking"""
+    tracking = None
+    if columns['tracking'] is not None:
+        for col_offset in [0, 1, 2, -1, -2]:
+            val = _cell(row, columns['tracking'] + col_offset)
+            if val is not None:
+                val = str(val).strip()
+                if len(val) > 10 and val.startswith(TRACKING_PREFIXES):
+                    tracking = val
+                    break
+    
+    if not tracking:
         return None
     
-    # Chercher le prix
-    if country == 'FR':
-        return TARIFS_FRANCE.get(weight_range)
-    else:
-        if weight_range in TARIFS_EUROPE:
-            return TARIFS_EUROPE[weight_range].get(country)
+    date_value = None
+    if columns['date'] is not None and _cell(row, columns['date']) is not None:
+        date_value = _cell(row, columns['date'])
+    elif _cell(row, 1) is not None:
+        date_value = _cell(row, 1)
+    elif _cell(row, 2) is not None:
+        date_value = _cell(row, 2)
     
+    poids_col, montant_col, obs_col = columns['poids'], columns['montant'], columns['obs']
+    return {
+        'Date': date_value,
+        'Tracking': tracking,
+        'Poids_Chronopost': _cell(row, poids_col) if poids_col else None,
+        'Prix_Facture_HT': _cell(row, montant_col) if montant_col else None,
+        'Observations': str(_cell(row, obs_col)) if obs_col and _cell(row, obs_col) is not None else ''
+    }
+
+def _surplus_type(row):
+    """Type de surplus décrit par la ligne (None si aucun)"""
+    row_text = ' '.join([str(v) for v in row if v is not None]).upper()
+    
+    if 'ETIQUETTE' in row_text and 'NON CONFORME' in row_text:
+        return 'Etiquette non conforme'
+    if 'RETOUR' in row_text and 'EXPEDITEUR' in row_text:
+        return 'Retour expéditeur'
+    if 'TRAITEMENT' in row_text and 'RETOUR' in row_text:
+        return 'Traitement Retour expéditeur'
+    if 'ZONE' in row_text and ('DIFFICILE' in row_text or 'ELOIGNE' in row_text):
+        return 'Zones Difficiles d\'accès'
+    if 'CORSE' in row_text:
+        return 'Supplément Corse'
+    if 'HORS NORME' in row_text or 'HORS-NORME' in row_text:
+        for val in row:
+            if val is None or not isinstance(val, (int, float)):
+                continue
+            if 60 < val < 80:
+                return 'Supplément hors norme'
+            elif 15 < val < 25:
+                return 'Supplément manutention'
+        return 'Supplément manutention' if 'MANUTENTION' in row_text else 'Supplément hors norme'
+    if 'MANUTENTION' in row_text:
+        return 'Supplément manutention'
     return None
 
-def load_chronopost_invoice(uploaded_file):
-    """Charger et parser une facture Chronopost"""
-    df_raw = pd.read_excel(uploaded_file, sheet_name='Table 1', header=None)
+def parse_invoice_rows(rows):
+    """
+    Extrait lignes de facture et surplus en un seul parcours des lignes
     
-    header_lines = []
-    for i in range(len(df_raw)):
-        row = df_raw.iloc[i]
-        has_date = False
-        has_tracking = False
-        
-        for j in range(min(10, len(row))):
-            if pd.notna(row[j]):
-                val_str = str(row[j]).strip()
-                if val_str in ['Date', 'DATE']:
-                    has_date = True
-                if 'objet' in val_str.lower():
-                    has_tracking = True
-        
-        if has_date and has_tracking:
-            header_lines.append(i)
+    Les en-têtes de section ('Date' + 'N° objet') sont détectés au fil de
+    l'eau : les lignes de données d'une section commencent 3 lignes sous
+    son en-tête et s'arrêtent à l'en-tête suivant.
     
-    data_rows = []
-    for section_idx, header_line in enumerate(header_lines):
-        header_row = df_raw.iloc[header_line]
-        
-        date_col = None
-        tracking_col = None
-        poids_col = None
-        montant_col = None
-        obs_col = None
-        
-        for j, val in enumerate(header_row):
-            if pd.notna(val):
-                val_str = str(val).strip().lower()
-                if val_str in ['date', 'DATE']:
-                    date_col = j
-                elif 'objet' in val_str:
-                    tracking_col = j
-                elif val_str == 'poids':
-                    poids_col = j
-                elif 'montant' in val_str:
-                    montant_col = j
-                elif val_str == 'obs':
-                    obs_col = j
-        
-        next_header = header_lines[section_idx + 1] if section_idx + 1 < len(header_lines) else len(df_raw)
-        
-        for i in range(header_line + 3, next_header):
-            row = df_raw.iloc[i]
-            
-            tracking = None
-            if tracking_col is not None:
-                for col_offset in [0, 1, 2, -1, -2]:
-                    col_to_check = tracking_col + col_offset
-                    if 0 <= col_to_check < len(row) and pd.notna(row[col_to_check]):
-                        val = str(row[col_to_check]).strip()
-                        if len(val) > 10 and any(val.startswith(p) for p in ['XR', 'XA', 'XT', '2L', '6A', 'LD', 'MH']):
-                            tracking = val
-                            break
-            
-            if tracking:
-                date_value = None
-                if date_col is not None and pd.notna(row[date_col]):
-                    date_value = row[date_col]
-                elif pd.notna(row[1]):
-                    date_value = row[1]
-                elif pd.notna(row[2]):
-                    date_value = row[2]
-                
-                data_rows.append({
-                    'Date': date_value,
-                    'Tracking': tracking,
-                    'Poids_Chronopost': row[poids_col] if poids_col and pd.notna(row[poids_col]) else None,
-                    'Prix_Facture_HT': row[montant_col] if montant_col and pd.notna(row[montant_col]) else None,
-                    'Observations': str(row[obs_col]) if obs_col and pd.notna(row[obs_col]) else ''
-                })
+    Args:
+        rows: itérable de tuples de valeurs (None = cellule vide)
     
-    if data_rows:
-        df = pd.DataFrame(data_rows)
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df[df['Date'].notna()]
-        return df
-    
-    return pd.DataFrame()
-
-def extract_surplus(df_raw):
-    """Extraire les surplus d'une facture"""
+    Returns:
+        tuple: (lignes de facture, surplus) — listes de dicts
+    """
+    data_rows = []
     surplus_data = []
+    
+    columns = None
+    header_line = None
     current_tracking = None
     current_date = None
     
-    for i in range(100, len(df_raw)):
-        row = df_raw.iloc[i]
-        
+    for i, row in enumerate(rows):
+        # Lignes de facture
+        if _is_invoice_header(row):
+            header_line = i
+            columns = _invoice_columns(row)
+        elif columns is not None and i >= header_line + 3:
+            line = _invoice_line(row, columns)
+            if line:
+                data_rows.append(line)
+        
+        if i < SURPLUS_FIRST_ROW:
+            continue
+        
+        # Surplus : rattachés au dernier tracking rencontré
         for col in [3, 4, 5, 6]:
-            if col < len(row) and pd.notna(row[col]):
-                val = str(row[col]).strip()
-                if len(val) > 10 and any(val.startswith(p) for p in ['XR', 'XT', 'XA', '2L', '6A', 'LD', 'MH']):
+            val = _cell(row, col)
+            if val is not None:
+                val = str(val).strip()
+                if len(val) > 10 and val.startswith(TRACKING_PREFIXES):
                     current_tracking = val
                     for date_col in [1, 2]:
-                        if date_col < len(row) and pd.notna(row[date_col]):
+                        if _cell(row, date_col) is not None:
                             try:
-                                current_date = pd.to_datetime(row[date_col])
+                                current_date = pd.to_datetime(_cell(row, date_col))
                                 break
                             except:
                                 pass
                     break
         
-        surplus_type = None
-        montant = None
-        
-        row_text = ' '.join([str(v) for v in row if pd.notna(v)]).upper()
-        
-        if 'ETIQUETTE' in row_text and 'NON CONFORME' in row_text:
-            surplus_type = 'Etiquette non conforme'
-        elif 'RETOUR' in row_text and 'EXPEDITEUR' in row_text:
-            surplus_type = 'Retour expéditeur'
-        elif 'TRAITEMENT' in row_text and 'RETOUR' in row_text:
-            surplus_type = 'Traitement Retour expéditeur'
-        elif 'ZONE' in row_text and ('DIFFICILE' in row_text or 'ELOIGNE' in row_text):
-            surplus_type = 'Zones Difficiles d\'accès'
-        elif 'CORSE' in row_text:
-            surplus_type = 'Supplément Corse'
-        elif 'HORS NORME' in row_text or 'HORS-NORME' in row_text:
-            for col in range(len(row)):
-                if pd.notna(row[col]) and isinstance(row[col], (int, float)):
-                    if 60 < row[col] < 80:
-                        surplus_type = 'Supplément hors norme'
-                        break
-                    elif 15 < row[col] < 25:
-                        surplus_type = 'Supplément manutention'
-                        break
-            if not surplus_type:
-                if 'MANUTENTION' in row_text:
-                    surplus_type = 'Supplément manutention'
-                else:
-                    surplus_type = 'Supplément hors norme'
-        elif 'MANUTENTION' in row_text:
-            surplus_type = 'Supplément manutention'
-        
+        surplus_type = _surplus_type(row)
         if surplus_type:
-            for col in range(len(row)):
-                if pd.notna(row[col]) and isinstance(row[col], (int, float)):
-                    if 0 < row[col] < 100:
-                        montant = row[col]
-                        break
+            montant = None
+            for val in row:
+                if val is not None and isinstance(val, (int, float)) and 0 < val < 100:
+                    montant = val
+                    break
             
             if montant and current_tracking:
                 surplus_data.append({
@@ -257,42 +315,53 @@ def extract_surplus(df_raw):
                     'Montant_Surplus': montant
                 })
     
-    return surplus_data
+    return data_rows, surplus_data
+
+def _invoice_dataframe(data_rows):
+    if data_rows:
+        df = pd.DataFrame(data_rows)
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        df = df[df['Date'].notna()]
+        return df
+    
+    return pd.DataFrame()
+
+def parse_chronopost_invoice(uploaded_file):
+    """
+    Lit une facture Chronopost en un seul passage (streaming)
+    
+    Returns:
+        tuple: (DataFrame des lignes de facture, liste des surplus)
+    """
+    data_rows, surplus_data = parse_invoice_rows(iter_invoice_rows(uploaded_file))
+    return _invoice_dataframe(data_rows), surplus_data
+
+def load_chronopost_invoice(uploaded_file):
+    """Charger et parser une facture Chronopost"""
+    return parse_chronopost_invoice(uploaded_file)[0]
+
+def extract_surplus(df_raw):
+    """Extraire les surplus d'une facture (feuille déjà lue en DataFrame)"""
+    rows = (tuple(None if pd.isna(v) else v for v in row) for row in df_raw.itertuples(index=False))
+    return parse_invoice_rows(rows)[1]
 
 def create_excel_export(df_filtered, title):
     """Créer un export Excel formaté"""
-    output = BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = title
-    
-    # Écrire les données
-    for r_idx, row in enumerate([df_filtered.columns.tolist()] + df_filtered.values.tolist(), 1):
-        for c_idx, value in enumerate(row, 1):
-            cell = ws.cell(row=r_idx, column=c_idx, value=value)
-            
-            # En-tête
-            if r_idx == 1:
-                cell.font = Font(bold=True, color='FFFFFF')
-                cell.fill = PatternFill(start_color='0066CC', end_color='0066CC', fill_type='solid')
-                cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Ajuster largeurs
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column].width = adjusted_width
-    
-    ws.freeze_panes = 'A2'
-    wb.save(output)
-    return output.getvalue()
+    wb = new_workbook()
+    ws = wb.create_sheet(title)
+    
+    # Écrire les données (en-tête stylé, largeurs calculées sur le DataFrame)
+    write_dataframe(
+        ws, df_filtered,
+        header_style=CellStyle(
+            fill=PatternFill(start_color='0066CC', end_color='0066CC', fill_type='solid'),
+            font=Font(bold=True, color='FFFFFF'),
+            alignment=Alignment(horizontal='center', vertical='center')
+        ),
+        max_width=50
+    )
+    
+    return save_workbook(wb).getvalue()
 
 # ============================================================================
 # FONCTION PRINCIPALE DU MODULE
@@ -350,14 +419,14 @@ def run():
         # Fichiers logisticien depuis bibliothèque
         st.subheader("📋 Fichiers Logisticien")
         
-        from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
+        from modules.logisticiens_library import get_all_available_periods
         
-        available_files = load_logisticien_files_for_analysis(nb_months=3)
+        # Liste des périodes (manifeste seul, contenus chargés au lancement)
+        available_periods = get_all_available_periods()[:3]
         
-        if len(available_files) > 0:
-            st.success(f"✅ {len(available_files)} fichier(s) chargé(s) automatiquement depuis la bibliothèque")
-            periods = get_all_available_periods()[:len(available_files)]
-            for period in periods:
+        if len(available_periods) > 0:
+            st.success(f"✅ {len(available_periods)} fichier(s) chargé(s) automatiquement depuis la bibliothèque")
+            for period in available_periods:
                 from modules.bibliotheque import get_month_name
                 st.caption(f"• {get_month_name(period['month'])} {period['year']}")
         else:
@@ -372,7 +441,7 @@ def run():
         if not can_analyze:
             st.info("💡 Uploadez au moins une facture Chronopost pour lancer l'analyse")
         
-        if len(available_files) == 0:
+        if len(available_periods) == 0:
             st.warning("⚠️ Sans fichiers logisticiens, seule l'analyse des factures et surplus sera disponible")
         
         if st.button("🚀 Lancer l'analyse", type="primary", disabled=not can_analyze, use_container_width=True):
@@ -384,15 +453,13 @@ def run():
                     
                     factures_to_process = factures if factures else st.session_state.chronopost_files.get('factures', [])
                     
-                    for facture in factures_to_process:
-                        facture.seek(0)
-                        df_invoice = load_chronopost_invoice(facture)
+                    # Lecture des factures en parallèle (un processus par facture)
+                    parsed_invoices = parse_files(parse_chronopost_invoice, factures_to_process)
+                    
+                    for facture, (df_invoice, surplus) in zip(factures_to_process, parsed_invoices):
                         df_invoice['Num_Facture'] = facture.name.split('_')[0] if '_' in facture.name else facture.name[:8]
                         all_invoices.append(df_invoice)
                         
-                        facture.seek(0)
-                        df_raw = pd.read_excel(facture, sheet_name='Table 1', header=None)
-                        surplus = extract_surplus(df_raw)
                         for s in surplus:
                             s['Num_Facture'] = facture.name.split('_')[0] if '_' in facture.name else facture.name[:8]
                         all_surplus.extend(surplus)
@@ -404,15 +471,10 @@ def run():
                         
                         # Charger et fusionner fichiers logisticien (si disponibles)
                         df_log = None
-                        if len(available_files) > 0:
-                            all_log_data = []
-                            for log_file in available_files:
-                                try:
-                                    log_file.seek(0)
-                                    df_log_temp = pd.read_excel(log_file, sheet_name='Facturation préparation')
-                                    all_log_data.append(df_log_temp)
-                                except Exception as e:
-                                    st.warning(f"⚠️ Erreur lecture {log_file.name}: {str(e)}")
+                        if len(available_periods) > 0:
+                            from modules.logisticiens_library import load_logisticien_dataframes
+                            
+                            all_log_data = load_logisticien_dataframes(nb_months=3)
                             
                             if all_log_data:
                                 df_log = pd.concat(all_log_data, ignore_index=True)
@@ -447,15 +509,8 @@ def run():
                             st.info("ℹ️ Analyse sans fichiers logisticiens : certaines colonnes seront vides")
                         
                         # Calculs
-                        df['Prix_Theorique_HT'] = df.apply(
-                            lambda row: get_theoretical_price(row['Poids_Logisticien'], row['Pays']) if pd.notna(row['Poids_Logisticien']) else None,
-                            axis=1
-                        )
-                        
-                        df['Prix_Selon_Poids_Chronopost'] = df.apply(
-                            lambda row: get_theoretical_price(row['Poids_Chronopost'], row['Pays']) if pd.notna(row['Pays']) else None,
-                            axis=1
-                        )
+                        df['Prix_Theorique_HT'] = get_theoretical_prices(df['Poids_Logisticien'], df['Pays'])
+                        df['Prix_Selon_Poids_Chronopost'] = get_theoretical_prices(df['Poids_Chronopost'], df['Pays'])
                         
                         df['Difference_Prix'] = df['Prix_Facture_HT'] - df['Prix_Theorique_HT']
                         df['Ecart_Poids'] = df['Poids_Chronopost'] - df['Poids_Logisticien']
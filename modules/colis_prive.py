@@ -94,14 +94,14 @@ def run():
         # Fichiers logisticien depuis bibliothèque
         st.subheader("📋 Fichiers Logisticien")
         
-        from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
+        from modules.logisticiens_library import get_all_available_periods
         
-        available_files = load_logisticien_files_for_analysis(nb_months=3)
+        # Liste des périodes (manifeste seul, contenus chargés au lancement)
+        available_periods = get_all_available_periods()[:3]
         
-        if len(available_files) > 0:
-            st.success(f"✅ {len(available_files)} fichier(s) chargé(s) automatiquement depuis la bibliothèque")
-            periods = get_all_available_periods()[:len(available_files)]
-            for period in periods:
+        if len(available_periods) > 0:
+            st.success(f"✅ {len(available_periods)} fichier(s) chargé(s) automatiquement depuis la bibliothèque")
+            for period in available_periods:
                 from modules.bibliotheque import get_month_name
                 st.caption(f"• {get_month_name(period['month'])} {period['year']}")
         else:
@@ -128,10 +128,10 @@ def run():
         st.markdown("---")
         
         # Bouton d'analyse
-        can_analyze = (fichier_cp or 'csv' in st.session_state.colis_prive_files) and len(available_files) > 0
+        can_analyze = (fichier_cp or 'csv' in st.session_state.colis_prive_files) and len(available_periods) > 0
         
         if not can_analyze:
-            if len(available_files) == 0:
+            if len(available_periods) == 0:
                 st.warning("⚠️ Ajoutez des fichiers logisticiens dans le module 📋 Logisticiens")
             else:
                 st.info("💡 Uploadez un fichier CSV Colis Privé pour lancer l'analyse")
@@ -144,15 +144,10 @@ def run():
                     fichier_to_process.seek(0)
                     df_cp = pd.read_csv(fichier_to_process, sep=';', encoding='utf-8-sig', decimal=',')
                     
-                    # Charger les fichiers logisticien depuis la bibliothèque
-                    all_log_data = []
-                    for log_file in available_files:
-                        try:
-                            log_file.seek(0)
-                            df_log_temp = pd.read_excel(log_file, sheet_name='Facturation préparation')
-                            all_log_data.append(df_log_temp)
-                        except Exception as e:
-                            st.warning(f"⚠️ Erreur lecture {log_file.name}: {str(e)}")
+                    # Charger les données logisticien (déjà parsées) depuis la bibliothèque
+                    from modules.logisticiens_library import load_logisticien_dataframes
+                    
+                    all_log_data = load_logisticien_dataframes(nb_months=3)
                     
                     if not all_log_data:
                         st.error("❌ Aucun fichier logisticien valide")
@@ -81,12 +81,15 @@ def read_excel_logisticien(file, sheet_name="Facturation préparation"):
             return None
 
 def fusion_logisticiens(log1, log2, log3):
-    """Fusionne les 3 fichiers logisticien"""
+    """Fusionne les 3 fichiers logisticien (fichiers Excel ou DataFrames déjà parsés)"""
     dfs = []
     
     for log_file in [log1, log2, log3]:
         if log_file is not None:
-            df = read_excel_logisticien(log_file)
+            if isinstance(log_file, pd.DataFrame):
+                df = log_file
+            else:
+                df = read_excel_logisticien(log_file)
             if df is not None:
                 dfs.append(df)
     
@@ -123,59 +126,202 @@ def correspondance_tracking_exact(tracking_retour, df_log):
         }
     return None
 
-def correspondance_tracking_partiel(tracking_retour, df_log):
-    """Méthode 2 : Correspondance tracking partielle (8+ chiffres)"""
+PARTIAL_GRAM = 8  # longueur minimale d'une séquence numérique
+
+def build_partial_tracking_index(df_log):
+    """
+    Index des séquences numériques des trackings aller pour la méthode 2
+    
+    Chaque séquence distincte (8+ chiffres) est rattachée à sa première
+    ligne dans df_log, puis découpée en n-grammes de 8 chiffres. Une
+    séquence retour ne peut être contenue que dans les séquences qui
+    partagent tous ses n-grammes : on ne vérifie que les candidats du
+    n-gramme le plus rare, dans l'ordre des lignes.
+    
+    Returns:
+        dict {'seqs': [(position, séquence)], 'grams': {n-gramme: [indices dans seqs]}}
+    """
+    index = {'seqs': [], 'grams': {}}
+    if 'Tracking_Clean' not in df_log.columns or len(df_log) == 0:
+        return index
+    
+    sequences = df_log['Tracking_Clean'].astype(str).str.extract(r'(\d{8,})', expand=False)
+    
+    first_rows = (
+        pd.DataFrame({'seq': sequences.to_numpy(dtype=object), 'pos': np.arange(len(df_log))})
+        .dropna(subset=['seq'])
+        .drop_duplicates('seq', keep='first')
+    )
+    
+    for seq, pos in zip(first_rows['seq'], first_rows['pos']):
+        seq_idx = len(index['seqs'])
+        index['seqs'].append((int(pos), seq))
+        for gram in {seq[i:i + PARTIAL_GRAM] for i in range(len(seq) - PARTIAL_GRAM + 1)}:
+            index['grams'].setdefault(gram, []).append(seq_idx)
+    
+    return index
+
+def find_partial_tracking(seq_retour, index):
+    """Position de la première ligne dont la séquence contient seq_retour (ou None)"""
+    postings = []
+    for i in range(len(seq_retour) - PARTIAL_GRAM + 1):
+        gram_postings = index['grams'].get(seq_retour[i:i + PARTIAL_GRAM])
+        if not gram_postings:
+            return None
+        postings.append(gram_postings)
+    
+    # Candidats du n-gramme le plus rare, déjà triés par ligne
+    for seq_idx in min(postings, key=len):
+        pos, seq_aller = index['seqs'][seq_idx]
+        if seq_retour in seq_aller:
+            return pos
+    return None
+
+def correspondance_tracking_partiel(tracking_retour, df_log, index=None):
+    """Méthode 2 : Correspondance tracking partielle (8+ chiffres)
+    
+    Args:
+        index: build_partial_tracking_index(df_log), à construire une fois
+            pour tous les retours (construit ici si absent)
+    """
     seq_retour = extract_numeric_sequence(tracking_retour)
     if not seq_retour:
         return None
     
-    for _, row in df_log.iterrows():
-        tracking_aller = row.get('Tracking_Clean', '')
-        seq_aller = extract_numeric_sequence(tracking_aller)
-        
-        if seq_aller and seq_retour in seq_aller:
-            return {
-                'partenaire': row.get('Nom du partenaire', 'NON IDENTIFIÉ'),
-                'commande': str(row.get('Numéro de commande d\'origine', '')),
-                'tracking_aller': tracking_aller,
-                'methode': 'Tracking partiel'
-            }
+    if index is None:
+        index = build_partial_tracking_index(df_log)
     
-    return None
+    pos = find_partial_tracking(seq_retour, index)
+    if pos is None:
+        return None
+    
+    row = df_log.iloc[pos]
+    return {
+        'partenaire': row.get('Nom du partenaire', 'NON IDENTIFIÉ'),
+        'commande': str(row.get('Numéro de commande d\'origine', '')),
+        'tracking_aller': row.get('Tracking_Clean', ''),
+        'methode': 'Tracking partiel'
+    }
 
-def correspondance_cp_date(cp_retour, date_retour, df_log):
-    """Méthode 3 : Correspondance par code postal + date"""
+def _cp_key(cp_retour):
+    """Code postal retour tel que comparé au logisticien (None si inutilisable)"""
     try:
-        if pd.isna(cp_retour) or pd.isna(date_retour):
+        if pd.isna(cp_retour):
             return None
-        
-        cp_str = str(int(cp_retour)) if isinstance(cp_retour, float) else str(cp_retour)
+        return str(int(cp_retour)) if isinstance(cp_retour, float) else str(cp_retour)
+    except:
+        return None
+
+def _date_key(date_retour):
+    """Date retour en Timestamp sans fuseau (NaT si inutilisable)"""
+    try:
+        if pd.isna(date_retour):
+            return pd.NaT
         date_retour_dt = pd.to_datetime(date_retour, errors='coerce')
-        
-        if pd.isna(date_retour_dt):
-            return None
-        
-        # Chercher dans le logisticien
-        matches = df_log[
-            (df_log['Code postal destination'].astype(str).str.strip() == cp_str) &
-            (df_log['Date_Expedition'] < date_retour_dt)
-        ]
-        
-        if len(matches) > 0:
-            # Prendre la plus récente
-            matches_sorted = matches.sort_values('Date_Expedition', ascending=False)
-            row = matches_sorted.iloc[0]
-            
-            return {
-                'partenaire': row.get('Nom du partenaire', 'NON IDENTIFIÉ'),
-                'commande': str(row.get('Numéro de commande d\'origine', '')),
-                'tracking_aller': row.get('Tracking_Clean', ''),
-                'methode': 'CP + Date'
-            }
+        if isinstance(date_retour_dt, pd.Timestamp) and date_retour_dt.tz is None:
+            return date_retour_dt
     except:
         pass
+    return pd.NaT
+
+def correspondance_cp_date_batch(cp_retours, dates_retour, df_log):
+    """
+    Méthode 3 pour tous les retours en une passe : jointure as-of
     
-    return None
+    Pour chaque retour, l'expédition la plus récente strictement antérieure
+    à la date de retour, au même code postal. À date égale, la première
+    ligne du logisticien l'emporte.
+    
+    Args:
+        cp_retours: Series des codes postaux retour
+        dates_retour: Series des dates retour (même index)
+        df_log: DataFrame logisticien fusionné
+    
+    Returns:
+        DataFrame aligné sur l'index de cp_retours : 'found', 'partenaire',
+        'commande', 'tracking_aller'
+    """
+    result = pd.DataFrame(index=cp_retours.index)
+    result['found'] = False
+    for column in ['partenaire', 'commande', 'tracking_aller']:
+        result[column] = None
+    
+    required = ['Code postal destination', 'Date_Expedition']
+    if len(result) == 0 or any(c not in df_log.columns for c in required):
+        return result
+    if not pd.api.types.is_datetime64_dtype(df_log['Date_Expedition']):
+        return result
+    
+    try:
+        # Retours : clés calculées une fois par valeur distincte
+        cps = pd.Series(cp_retours.to_numpy(dtype=object)).map(_cp_key)
+        dates = pd.Series(dates_retour.to_numpy(dtype=object)).map(_date_key)
+        left = pd.DataFrame({
+            'cp': cps,
+            'date': pd.to_datetime(dates).astype('datetime64[ns]'),
+            'pos_retour': np.arange(len(result))
+        })
+        left = left[left['cp'].notna() & left['date'].notna()].sort_values('date', kind='stable')
+        left['cp'] = left['cp'].astype(str)
+        
+        # Logisticien : un seul passage de normalisation, une ligne par (CP, date)
+        right = pd.DataFrame({
+            'cp': df_log['Code postal destination'].astype(str).str.strip().to_numpy(),
+            'date': df_log['Date_Expedition'].astype('datetime64[ns]').to_numpy(),
+            'pos_log': np.arange(len(df_log))
+        })
+        right = (
+            right[right['date'].notna()]
+            .drop_duplicates(['cp', 'date'], keep='first')
+            .sort_values('date', kind='stable')
+        )
+        right['cp'] = right['cp'].astype(str)
+        
+        if len(left) == 0 or len(right) == 0:
+            return result
+        
+        merged = pd.merge_asof(
+            left, right, on='date', by='cp',
+            direction='backward', allow_exact_matches=False
+        )
+    except Exception:
+        return result
+    
+    merged = merged[merged['pos_log'].notna()]
+    if len(merged) == 0:
+        return result
+    
+    pos_retour = merged['pos_retour'].to_numpy()
+    pos_log = merged['pos_log'].to_numpy(dtype=np.int64)
+    
+    def log_values(column, default):
+        if column not in df_log.columns:
+            return [default] * len(pos_log)
+        return list(df_log[column].to_numpy(dtype=object)[pos_log])
+    
+    rows = result.index[pos_retour]
+    result.loc[rows, 'found'] = True
+    result.loc[rows, 'partenaire'] = pd.Series(log_values('Nom du partenaire', 'NON IDENTIFIÉ'), index=rows, dtype=object)
+    result.loc[rows, 'commande'] = pd.Series([str(v) for v in log_values('Numéro de commande d\'origine', '')], index=rows, dtype=object)
+    result.loc[rows, 'tracking_aller'] = pd.Series(log_values('Tracking_Clean', ''), index=rows, dtype=object)
+    
+    return result
+
+def correspondance_cp_date(cp_retour, date_retour, df_log):
+    """Méthode 3 : Correspondance par code postal + date (un seul retour)"""
+    match = correspondance_cp_date_batch(
+        pd.Series([cp_retour], dtype=object), pd.Series([date_retour], dtype=object), df_log
+    ).iloc[0]
+    
+    if not match['found']:
+        return None
+    
+    return {
+        'partenaire': match['partenaire'],
+        'commande': match['commande'],
+        'tracking_aller': match['tracking_aller'],
+        'methode': 'CP + Date'
+    }
 
 def traiter_retours_colissimo(df_facture, df_log):
     """Traite les retours Colissimo"""
@@ -189,6 +335,12 @@ def traiter_retours_colissimo(df_facture, df_log):
     # 2. Enrichir chaque retour
     resultats = []
     
+    # Index des séquences aller (méthode 2), construit une seule fois
+    partial_index = build_partial_tracking_index(df_log)
+    
+    # Retours sans correspondance tracking : méthode 3 en une passe ensuite
+    sans_tracking = []
+    
     for _, row in df_retours.iterrows():
         tracking_retour = clean_tracking(row.get('Tracking', ''))
         date_retour = row.get('Date PCH', '')
@@ -207,11 +359,10 @@ def traiter_retours_colissimo(df_facture, df_log):
         
         # Méthode 2 : Tracking partiel
         if not correspondance:
-            correspondance = correspondance_tracking_partiel(tracking_retour, df_log)
+            correspondance = correspondance_tracking_partiel(tracking_retour, df_log, partial_index)
         
-        # Méthode 3 : CP + Date
         if not correspondance:
-            correspondance = correspondance_cp_date(cp_retour, date_retour, df_log)
+            sans_tracking.append(len(resultats))
         
         # Résultat
         if correspondance:
@@ -238,6 +389,21 @@ def traiter_retours_colissimo(df_facture, df_log):
             'Méthode Correspondance': methode
         })
     
+    # Méthode 3 : CP + Date (jointure as-of sur les retours restants)
+    if sans_tracking:
+        cp_date = correspondance_cp_date_batch(
+            pd.Series([resultats[i]['Code Postal'] for i in sans_tracking], index=sans_tracking, dtype=object),
+            pd.Series([resultats[i]['Date Retour'] for i in sans_tracking], index=sans_tracking, dtype=object),
+            df_log
+        )
+        for i, match in cp_date[cp_date['found']].iterrows():
+            resultats[i].update({
+                'Nom Partenaire': match['partenaire'],
+                'N° Commande': match['commande'],
+                'Tracking Aller': match['tracking_aller'],
+                'Méthode Correspondance': 'CP + Date'
+            })
+    
     df_detail = pd.DataFrame(resultats)
     
     # 3. Statistiques
@@ -327,7 +493,8 @@ def run():
         # Chargement automatique depuis la bibliothèque logisticiens
         from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
         
-        log_files = load_logisticien_files_for_analysis(nb_months=3)
+        # Liste des périodes (manifeste seul, contenus chargés au lancement)
+        log_periods = get_all_available_periods()[:3]
         
         # Upload des fichiers
         col1, col2 = st.columns(2)
@@ -344,33 +511,24 @@ def run():
         with col2:
             st.markdown("#### Fichiers Logisticiens")
             
-            if len(log_files) >= 3:
-                log1, log2, log3 = log_files[0], log_files[1], log_files[2]
-                
-                periods = get_all_available_periods()[:3]
-                st.success(f"✅ {periods[0]['filename']}")
-                st.success(f"✅ {periods[1]['filename']}")
-                st.success(f"✅ {periods[2]['filename']}")
+            if len(log_periods) >= 3:
+                st.success(f"✅ {log_periods[0]['filename']}")
+                st.success(f"✅ {log_periods[1]['filename']}")
+                st.success(f"✅ {log_periods[2]['filename']}")
                 
                 st.info("📋 Chargés depuis Bibliothèque")
-            elif len(log_files) > 0:
-                st.warning(f"⚠️ {len(log_files)} fichier(s) seulement")
+            elif len(log_periods) > 0:
+                st.warning(f"⚠️ {len(log_periods)} fichier(s) seulement")
                 st.info("Ajoutez-en dans **📋 Logisticiens**")
-                log1 = log_files[0] if len(log_files) > 0 else None
-                log2 = log_files[1] if len(log_files) > 1 else None
-                log3 = log_files[2] if len(log_files) > 2 else None
             else:
                 st.error("❌ Aucun fichier disponible")
                 st.info("➡️ **📋 Logisticiens** pour ajouter")
-                log1 = None
-                log2 = None
-                log3 = None
         
         # Bouton d'analyse
         st.markdown("---")
         
         has_facture = csv_facture is not None
-        has_log = log1 is not None and log2 is not None and log3 is not None
+        has_log = len(log_periods) >= 3
         
         if has_facture and has_log:
             # Style CSS pour bouton vert
@@ -404,7 +562,11 @@ def run():
                             st.error("❌ Erreur lecture CSV facture")
                             st.stop()
                         
-                        df_log = fusion_logisticiens(log1, log2, log3)
+                        from modules.logisticiens_library import load_logisticien_dataframes
+                        
+                        log_dfs = load_logisticien_dataframes(nb_months=3)
+                        log_dfs += [None] * (3 - len(log_dfs))
+                        df_log = fusion_logisticiens(*log_dfs)
                         if df_log is None:
                             st.error("❌ Erreur lecture fichiers logisticien")
                             st.stop()
@@ -423,12 +585,10 @@ def run():
                         st.session_state.colissimo_data_loaded = True
                         
                         # 💾 SAUVEGARDE FICHIERS
-                        files_to_save = {
-                            'csv_facture': csv_facture,
-                            'log1': log1,
-                            'log2': log2,
-                            'log3': log3
-                        }
+                        files_to_save = {'csv_facture': csv_facture}
+                        log_files = load_logisticien_files_for_analysis(nb_months=3)
+                        for key, log_file in zip(['log1', 'log2', 'log3'], log_files):
+                            files_to_save[key] = log_file
                         persistence.save_module_files('colissimo', files_to_save)
                         st.session_state.colissimo_files_loaded = True
                         
@@ -1,12 +1,10 @@
 import streamlit as st
 import pandas as pd
 import csv
-from io import BytesIO
 from datetime import datetime
-from openpyxl import Workbook
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
 from shared import persistence
+from shared.excel_export import CellStyle, new_workbook, save_workbook, write_dataframe
 
 def process_dhl_file(uploaded_file):
     """Traite le fichier DHL et génère les données de facturation"""
@@ -83,11 +81,11 @@ def enrich_with_logisticiens(df):
     """Enrichit les données DHL avec les informations des fichiers logisticiens"""
     
     # Charger les fichiers logisticiens depuis la bibliothèque
-    from modules.logisticiens_library import load_logisticien_files_for_analysis
+    from modules.logisticiens_library import load_logisticien_dataframes, normalize_references
     
-    log_files = load_logisticien_files_for_analysis(nb_months=3)
+    all_log_data = load_logisticien_dataframes(nb_months=3)
     
-    if len(log_files) == 0:
+    if len(all_log_data) == 0:
         st.warning("⚠️ Aucun fichier logisticien disponible - Enrichissement impossible")
         # Ajouter colonnes vides
         df['Partenaire'] = 'Non trouvé'
@@ -97,28 +95,12 @@ def enrich_with_logisticiens(df):
         return df
     
     # Fusionner tous les fichiers logisticiens
-    all_log_data = []
-    for log_file in log_files:
-        try:
-            log_file.seek(0)
-            df_log_temp = pd.read_excel(log_file, sheet_name='Facturation préparation')
-            all_log_data.append(df_log_temp)
-        except Exception as e:
-            st.warning(f"⚠️ Erreur lecture fichier: {str(e)}")
-    
-    if not all_log_data:
-        df['Partenaire'] = 'Non trouvé'
-        df['Num_Commande_Origine'] = ''
-        df['Num_Commande_Partenaire'] = ''
-        df['Match'] = False
-        return df
-    
     df_log = pd.concat(all_log_data, ignore_index=True)
-    df_log = df_log.drop_duplicates(subset=['Numéro de tracking'], keep='first')
     
-    # Nettoyer les trackings
-    df['Tracking_Clean'] = df['Numero_Expedition'].astype(str).str.strip().str.replace('.0', '', regex=False)
-    df_log['Tracking_Clean'] = df_log['Numéro de tracking'].astype(str).str.strip().str.replace('.0', '', regex=False)
+    # Nettoyer les trackings (normalisation commune des références)
+    df['Tracking_Clean'] = normalize_references(df['Numero_Expedition'])
+    df_log['Tracking_Clean'] = normalize_references(df_log['Numéro de tracking'])
+    df_log = df_log[df_log['Tracking_Clean'] != ''].drop_duplicates(subset=['Tracking_Clean'], keep='first')
     
     # Merger
     df_merged = df.merge(
@@ -255,12 +237,7 @@ def create_synthese_colonnes(df):
 def export_excel_dhl(df, synthese_colonnes):
     """Génère le fichier Excel avec mise en forme et colonnes en évidence"""
     
-    output = BytesIO()
-    wb = Workbook()
-    
-    # Feuille 1: Données détaillées
-    ws1 = wb.active
-    ws1.title = "Données Détaillées"
+    wb = new_workbook()
     
     # Réorganiser les colonnes : numéros de commande en premier
     cols_order = [
@@ -278,22 +255,12 @@ def export_excel_dhl(df, synthese_colonnes):
     
     df_export = df[cols_order]
     
-    # Écrire le DataFrame
-    for r in dataframe_to_rows(df_export, index=False, header=True):
-        ws1.append(r)
-    
     # Styles
     bleu_header = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
     jaune_highlight = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
     font_header = Font(bold=True, color='FFFFFF', size=11)
     font_normal = Font(size=10)
     
-    # En-tête
-    for cell in ws1[1]:
-        cell.fill = bleu_header
-        cell.font = font_header
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
     # Colonnes à mettre en évidence (positions après réorganisation)
     # Tarif_Base_HT est colonne 11 (K)
     # XC1_Montant_HT est colonne 15 (O) 
@@ -304,52 +271,48 @@ def export_excel_dhl(df, synthese_colonnes):
     
     highlight_cols = [11, 15, 20, 25, 30, 42]  # Index 1-based
     
-    for row in ws1.iter_rows(min_row=2, max_row=ws1.max_row):
-        for idx, cell in enumerate(row, start=1):
-            if idx in highlight_cols:
-                cell.fill = jaune_highlight
-            cell.font = font_normal
-            cell.alignment = Alignment(horizontal='left' if idx <= 10 else 'right')
-    
-    # Largeurs de colonnes
-    ws1.column_dimensions['A'].width = 18  # Num Commande Origine
-    ws1.column_dimensions['B'].width = 18  # Num Commande Partenaire
-    ws1.column_dimensions['C'].width = 20  # Partenaire
-    ws1.column_dimensions['D'].width = 8   # Match
-    ws1.column_dimensions['E'].width = 18  # Numero Expedition
+    # Même style pour toutes les lignes de données
+    row_styles = [
+        CellStyle(
+            fill=jaune_highlight if idx in highlight_cols else None,
+            font=font_normal,
+            alignment=Alignment(horizontal='left' if idx <= 10 else 'right')
+        )
+        for idx in range(1, len(cols_order) + 1)
+    ]
     
-    # Figer la première ligne
-    ws1.freeze_panes = 'A2'
+    # Feuille 1: Données détaillées
+    ws1 = wb.create_sheet("Données Détaillées")
+    write_dataframe(
+        ws1, df_export,
+        header_style=CellStyle(
+            fill=bleu_header,
+            font=font_header,
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)
+        ),
+        row_style=lambda row_idx, values: row_styles,
+        widths={
+            'A': 18,  # Num Commande Origine
+            'B': 18,  # Num Commande Partenaire
+            'C': 20,  # Partenaire
+            'D': 8,   # Match
+            'E': 18,  # Numero Expedition
+        }
+    )
     
     # Feuille 2: Synthèse colonnes
     ws2 = wb.create_sheet("Synthèse Colonnes")
+    write_dataframe(
+        ws2, synthese_colonnes,
+        header_style=CellStyle(
+            fill=bleu_header,
+            font=font_header,
+            alignment=Alignment(horizontal='center', vertical='center')
+        ),
+        widths={'A': 12, 'B': 18, 'C': 45, 'D': 12, 'E': 18, 'F': 18, 'G': 18, 'H': 18}
+    )
     
-    for r in dataframe_to_rows(synthese_colonnes, index=False, header=True):
-        ws2.append(r)
-    
-    # En-tête
-    for cell in ws2[1]:
-        cell.fill = bleu_header
-        cell.font = font_header
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Ajuster largeurs
-    ws2.column_dimensions['A'].width = 12
-    ws2.column_dimensions['B'].width = 18
-    ws2.column_dimensions['C'].width = 45
-    ws2.column_dimensions['D'].width = 12
-    ws2.column_dimensions['E'].width = 18
-    ws2.column_dimensions['F'].width = 18
-    ws2.column_dimensions['G'].width = 18
-    ws2.column_dimensions['H'].width = 18
-    
-    # Figer
-    ws2.freeze_panes = 'A2'
-    
-    wb.save(output)
-    output.seek(0)
-    
-    return output.getvalue()
+    return save_workbook(wb).getvalue()
 
 
 def run():
@@ -371,19 +334,19 @@ def run():
             st.success("✅ Données DHL chargées depuis la sauvegarde")
     
     # Vérifier fichiers logisticiens
-    from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
+    from modules.logisticiens_library import get_all_available_periods
     
-    log_files = load_logisticien_files_for_analysis(nb_months=3)
+    # Liste des périodes (manifeste seul)
+    log_periods = get_all_available_periods()[:3]
     
     st.markdown("---")
     st.markdown("### 📋 Fichiers Logisticien")
     
-    if len(log_files) > 0:
-        periods = get_all_available_periods()[:len(log_files)]
-        st.success(f"✅ {len(log_files)} fichier(s) logisticien disponible(s)")
+    if len(log_periods) > 0:
+        st.success(f"✅ {len(log_periods)} fichier(s) logisticien disponible(s)")
         with st.expander("📅 Périodes disponibles"):
             from modules.bibliotheque import get_month_name
-            for period in periods:
+            for period in log_periods:
                 st.caption(f"• {get_month_name(period['month'])} {period['year']}")
     else:
         st.warning("⚠️ Aucun fichier logisticien dans la bibliothèque")
@@ -11,6 +11,7 @@ from io import BytesIO
 from datetime import datetime
 import pickle
 from shared import persistence
+from shared.ingestion import parse_files
 
 def export_excel(dataframes_dict):
     """Export multiple DataFrames vers Excel avec plusieurs feuilles"""
@@ -75,12 +76,15 @@ def read_excel_file(file, sheet_name=None):
         return None
 
 def fusion_logisticiens(log_n, log_n1, log_n2):
-    """Fusionne les 3 fichiers logisticien"""
+    """Fusionne les 3 fichiers logisticien (fichiers Excel ou DataFrames déjà parsés)"""
     dfs = []
     
     for log_file in [log_n, log_n1, log_n2]:
         if log_file is not None:
-            df = read_excel_file(log_file, sheet_name="Facturation préparation")
+            if isinstance(log_file, pd.DataFrame):
+                df = log_file.copy()
+            else:
+                df = read_excel_file(log_file, sheet_name="Facturation préparation")
             if df is not None:
                 # Nettoyer les numéros de tracking (enlever les décimales)
                 if 'Numéro de tracking' in df.columns:
@@ -103,14 +107,15 @@ def fusion_dpd(dpd_predict, dpd_classic):
     """Fusionne les 2 fichiers DPD"""
     dfs = []
     
-    for dpd_file in [dpd_predict, dpd_classic]:
-        if dpd_file is not None:
-            df = read_excel_file(dpd_file)
-            if df is not None:
-                # Nettoyer les DPD ID (enlever les décimales)
-                if 'DPD ID' in df.columns:
-                    df['DPD ID'] = df['DPD ID'].apply(clean_tracking_number)
-                dfs.append(df)
+    # Lecture des fichiers en parallèle (première feuille)
+    for df in parse_files(pd.read_excel, [dpd_predict, dpd_classic], return_exceptions=True):
+        if isinstance(df, Exception):
+            st.error(f"Erreur lecture fichier : {df}")
+            continue
+        # Nettoyer les DPD ID (enlever les décimales)
+        if 'DPD ID' in df.columns:
+            df['DPD ID'] = df['DPD ID'].apply(clean_tracking_number)
+        dfs.append(df)
     
     if not dfs:
         return None
@@ -119,79 +124,126 @@ def fusion_dpd(dpd_predict, dpd_classic):
     df_fusion = pd.concat(dfs, ignore_index=True)
     return df_fusion
 
+def safe_float_series(values):
+    """Version colonne de safe_float (NaN / non convertible → 0.0)"""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype(float).fillna(0.0)
+    
+    result = pd.to_numeric(values, errors='coerce').astype(float)
+    # Valeurs non reconnues par to_numeric : règle exacte de safe_float
+    unresolved = result.isna() & values.notna()
+    if unresolved.any():
+        result[unresolved] = values[unresolved].map(safe_float).astype(float)
+    return result.mask(values.isna(), 0.0)
+
+def _format_dates(dates):
+    """Dates → 'DD/MM/YYYY' ('' si NaT), formatage une fois par date distincte"""
+    codes, uniques = pd.factorize(dates)
+    formatted = np.append(uniques.strftime('%d/%m/%Y').to_numpy(dtype=object), '')
+    return pd.Series(formatted[codes], index=dates.index, dtype=object)
+
+def convert_excel_date_series(values):
+    """Version colonne de convert_excel_date"""
+    values = pd.Series(values)
+    try:
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            return _format_dates(values)
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            # Date Excel : nombre de jours depuis 1899-12-30 (partie entière)
+            days = pd.to_timedelta(np.trunc(values.astype(float)), unit='D')
+            return _format_dates(pd.Timestamp(1899, 12, 30) + days)
+    except (OverflowError, ValueError, pd.errors.OutOfBoundsDatetime, pd.errors.OutOfBoundsTimedelta):
+        pass
+    # Types mixtes (texte, dates, nombres) : règle ligne à ligne
+    return pd.Series(values.tolist(), index=values.index, dtype=object).map(convert_excel_date)
+
 def croisement_donnees(df_logisticien, df_dpd):
-    """Croise les données logisticien et DPD"""
-    
-    # Création des mappings depuis logisticien
-    mapping_partner = {}
-    mapping_commande = {}
-    
-    if df_logisticien is not None:
-        for _, row in df_logisticien.iterrows():
-            # Nettoyer le numéro de tracking (sans décimales)
-            tracking = clean_tracking_number(row.get('Numéro de tracking', ''))
-            if tracking:
-                mapping_partner[tracking] = row.get('Nom du partenaire', 'NON ATTRIBUÉ')
-                mapping_commande[tracking] = str(row.get('Numéro de commande d\'origine', ''))
-    
-    # Debug: afficher quelques mappings pour vérifier
-    if mapping_partner:
-        st.sidebar.write("🔍 Debug Mapping (premiers 5):")
-        for i, (k, v) in enumerate(list(mapping_partner.items())[:5]):
-            st.sidebar.write(f"  {k} → {v}")
-    
-    # Enrichissement des données DPD
-    results = []
-    
-    for _, row in df_dpd.iterrows():
-        # Nettoyer le DPD ID (sans décimales)
-        dpd_id = clean_tracking_number(row.get('DPD ID', ''))
-        
-        # Attribution partenaire et commande
-        partner = mapping_partner.get(dpd_id, 'NON ATTRIBUÉ')
-        commande = mapping_commande.get(dpd_id, '')
-        
-        # Lecture des valeurs
-        prix_transport = safe_float(row.get('Prix transport', 0))
-        supplement_ile = safe_float(row.get('Supplément île et montagne', 0))
-        nb_retours = safe_float(row.get('Nombre Retour expédition', 0))
-        cout_retours = safe_float(row.get('Fact. Retour expédition', 0))
-        
-        # Lecture automatique des taxes (v1.5)
-        taxe_fuel = safe_float(row.get('Indexation gasoil', 0))
-        participation_surete = safe_float(row.get('Participation Sureté', 0))
-        contribution_logistique = safe_float(row.get('Contribution Logistique Responsable', 0))
-        
-        # Calcul taxe sûreté totale
-        taxe_surete = participation_surete + contribution_logistique
+    """Croise les données logisticien et DPD
+    
+    Traitement par colonnes : une seule jointure sur le DPD ID nettoyé
+    (en cas de tracking en double côté logisticien, la dernière ligne
+    l'emporte), conversions numériques et dates vectorisées.
+    """
+    from modules.logisticiens_library import normalize_references
+    
+    def column(df, name, default):
+        if name in df.columns:
+            return df[name].reset_index(drop=True)
+        return pd.Series([default] * len(df), dtype=object)
+    
+    # Correspondances depuis logisticien (tracking nettoyé → partenaire, commande)
+    mapping = pd.DataFrame(columns=['DPD ID', 'Partenaire', 'N° Commande'])
+    if df_logisticien is not None and len(df_logisticien) > 0:
+        mapping = pd.DataFrame({
+            'DPD ID': normalize_references(column(df_logisticien, 'Numéro de tracking', '')),
+            'Partenaire': column(df_logisticien, 'Nom du partenaire', 'NON ATTRIBUÉ').astype(object),
+            'N° Commande': pd.Series(
+                column(df_logisticien, 'Numéro de commande d\'origine', '').tolist(), dtype=object
+            ).map(str)
+        })
+        mapping = mapping[mapping['DPD ID'] != '']
         
-        # Calculs
-        montant_base = supplement_ile + cout_retours
-        total_avec_taxes = montant_base + taxe_fuel + taxe_surete
-        prix_total_ligne = prix_transport + supplement_ile + cout_retours + taxe_fuel + taxe_surete
+        # Debug: afficher quelques mappings pour vérifier (ordre de première apparition)
+        if len(mapping) > 0:
+            last = mapping.drop_duplicates('DPD ID', keep='last').set_index('DPD ID')['Partenaire']
+            st.sidebar.write("🔍 Debug Mapping (premiers 5):")
+            for tracking in mapping['DPD ID'].drop_duplicates().head(5):
+                st.sidebar.write(f"  {tracking} → {last[tracking]}")
         
-        # Ligne enrichie
-        results.append({
-            'Partenaire': partner,
-            'N° Commande': commande,
-            'DPD ID': dpd_id,
-            'N° Colis': row.get('N° Colis', ''),
-            'Date expédition': convert_excel_date(row.get('Date expédition', '')),
-            'Nom destinataire': row.get('Nom destinataire', ''),
-            'Ville destinataire': row.get('Ville destinataire', ''),
-            'CP destinataire': row.get('CP destinataire', ''),
-            'Pays destinataire': row.get('Code pays destinataire', ''),
-            'Prix transport': prix_transport,
-            'Supplément île': supplement_ile,
-            'Nb retours': nb_retours,
-            'Coût retours': cout_retours,
-            'Taxe Fuel': taxe_fuel,
-            'Taxe Sûreté': taxe_surete,
-            'Total avec taxes': total_avec_taxes,
-            'Prix total ligne': prix_total_ligne
-        })
+        mapping = mapping.drop_duplicates('DPD ID', keep='last')
+    
+    if len(df_dpd) == 0:
+        return pd.DataFrame()
+    
+    # Jointure sur le DPD ID nettoyé
+    dpd_ids = normalize_references(column(df_dpd, 'DPD ID', ''))
+    matched = pd.DataFrame({'DPD ID': dpd_ids}).merge(
+        mapping, on='DPD ID', how='left', indicator=True
+    )
+    found = (matched['_merge'] == 'both').to_numpy()
+    partner = np.where(found, matched['Partenaire'].to_numpy(dtype=object), 'NON ATTRIBUÉ')
+    commande = np.where(found, matched['N° Commande'].to_numpy(dtype=object), '')
     
-    return pd.DataFrame(results)
+    # Lecture des valeurs
+    prix_transport = safe_float_series(column(df_dpd, 'Prix transport', 0))
+    supplement_ile = safe_float_series(column(df_dpd, 'Supplément île et montagne', 0))
+    nb_retours = safe_float_series(column(df_dpd, 'Nombre Retour expédition', 0))
+    cout_retours = safe_float_series(column(df_dpd, 'Fact. Retour expédition', 0))
+    
+    # Lecture automatique des taxes (v1.5)
+    taxe_fuel = safe_float_series(column(df_dpd, 'Indexation gasoil', 0))
+    participation_surete = safe_float_series(column(df_dpd, 'Participation Sureté', 0))
+    contribution_logistique = safe_float_series(column(df_dpd, 'Contribution Logistique Responsable', 0))
+    
+    # Calcul taxe sûreté totale
+    taxe_surete = participation_surete + contribution_logistique
+    
+    # Calculs
+    montant_base = supplement_ile + cout_retours
+    total_avec_taxes = montant_base + taxe_fuel + taxe_surete
+    prix_total_ligne = prix_transport + supplement_ile + cout_retours + taxe_fuel + taxe_surete
+    
+    # Colonnes enrichies (listes : même inférence de types qu'un DataFrame construit ligne à ligne)
+    return pd.DataFrame({
+        'Partenaire': partner.tolist(),
+        'N° Commande': commande.tolist(),
+        'DPD ID': dpd_ids.tolist(),
+        'N° Colis': column(df_dpd, 'N° Colis', '').tolist(),
+        'Date expédition': convert_excel_date_series(column(df_dpd, 'Date expédition', '')).tolist(),
+        'Nom destinataire': column(df_dpd, 'Nom destinataire', '').tolist(),
+        'Ville destinataire': column(df_dpd, 'Ville destinataire', '').tolist(),
+        'CP destinataire': column(df_dpd, 'CP destinataire', '').tolist(),
+        'Pays destinataire': column(df_dpd, 'Code pays destinataire', '').tolist(),
+        'Prix transport': prix_transport.tolist(),
+        'Supplément île': supplement_ile.tolist(),
+        'Nb retours': nb_retours.tolist(),
+        'Coût retours': cout_retours.tolist(),
+        'Taxe Fuel': taxe_fuel.tolist(),
+        'Taxe Sûreté': taxe_surete.tolist(),
+        'Total avec taxes': total_avec_taxes.tolist(),
+        'Prix total ligne': prix_total_ligne.tolist()
+    })
 
 def calculer_synthese(df_detail):
     """Calcule la synthèse par partenaire"""
@@ -368,7 +420,8 @@ def run():
         # Chargement automatique depuis la bibliothèque logisticiens
         from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
         
-        log_files = load_logisticien_files_for_analysis(nb_months=3)
+        # Liste des périodes (manifeste seul, contenus chargés au lancement)
+        log_periods = get_all_available_periods()[:3]
         
         # Upload des fichiers
         col1, col2, col3 = st.columns(3)
@@ -376,28 +429,19 @@ def run():
         with col1:
             st.markdown("#### Fichiers Logisticiens")
             
-            if len(log_files) >= 3:
-                log_n, log_n1, log_n2 = log_files[0], log_files[1], log_files[2]
-                
-                # Afficher les fichiers chargés
-                periods = get_all_available_periods()[:3]
-                st.success(f"✅ {periods[0]['filename']}")
-                st.success(f"✅ {periods[1]['filename']}")
-                st.success(f"✅ {periods[2]['filename']}")
+            if len(log_periods) >= 3:
+                # Afficher les fichiers disponibles
+                st.success(f"✅ {log_periods[0]['filename']}")
+                st.success(f"✅ {log_periods[1]['filename']}")
+                st.success(f"✅ {log_periods[2]['filename']}")
                 
                 st.info("📋 Chargés depuis Bibliothèque")
-            elif len(log_files) > 0:
-                st.warning(f"⚠️ {len(log_files)} fichier(s) seulement")
+            elif len(log_periods) > 0:
+                st.warning(f"⚠️ {len(log_periods)} fichier(s) seulement")
                 st.info("Ajoutez-en dans **📋 Logisticiens**")
-                log_n = log_files[0] if len(log_files) > 0 else None
-                log_n1 = log_files[1] if len(log_files) > 1 else None
-                log_n2 = log_files[2] if len(log_files) > 2 else None
             else:
                 st.error("❌ Aucun fichier disponible")
                 st.info("➡️ **📋 Logisticiens** pour ajouter")
-                log_n = None
-                log_n1 = None
-                log_n2 = None
         
         with col2:
             st.markdown("#### Fichiers DPD")
@@ -417,7 +461,7 @@ def run():
         # Bouton d'analyse
         st.markdown("---")
         
-        has_log = log_n is not None and log_n1 is not None and log_n2 is not None
+        has_log = len(log_periods) >= 3
         has_dpd = dpd_predict is not None and dpd_classic is not None
         
         if has_log and has_dpd:
@@ -447,7 +491,11 @@ def run():
                 with st.spinner("⏳ Analyse en cours..."):
                     try:
                         # Fusion logisticiens
-                        df_log = fusion_logisticiens(log_n, log_n1, log_n2)
+                        from modules.logisticiens_library import load_logisticien_dataframes
+                        
+                        log_dfs = load_logisticien_dataframes(nb_months=3)
+                        log_dfs += [None] * (3 - len(log_dfs))
+                        df_log = fusion_logisticiens(*log_dfs)
                         if df_log is None:
                             st.error("❌ Erreur fusion logisticiens")
                             st.stop()
@@ -487,9 +535,9 @@ def run():
                         
                         # 💾 SAUVEGARDE AUTOMATIQUE DES FICHIERS
                         files_to_save = {}
-                        if log_n is not None: files_to_save['log_n'] = log_n
-                        if log_n1 is not None: files_to_save['log_n1'] = log_n1
-                        if log_n2 is not None: files_to_save['log_n2'] = log_n2
+                        log_files = load_logisticien_files_for_analysis(nb_months=3)
+                        for key, log_file in zip(['log_n', 'log_n1', 'log_n2'], log_files):
+                            files_to_save[key] = log_file
                         if dpd_predict is not None: files_to_save['dpd_predict'] = dpd_predict
                         if dpd_classic is not None: files_to_save['dpd_classic'] = dpd_classic
                         persistence.save_module_files('dpd', files_to_save)
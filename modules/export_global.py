@@ -6,11 +6,94 @@ Version 2.0 - Vue orientée commande
 
 import streamlit as st
 import pandas as pd
-from io import BytesIO
-from openpyxl import load_workbook
+import numpy as np
 from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
 from datetime import datetime
+from shared.excel_export import (
+    CellStyle, BLEU_GREENLOG, VERT_CLAIR, new_workbook, save_workbook,
+    styled_cell, styled_row, column_widths, set_column_widths, write_dataframe
+)
+
+# ==================== CONSOLIDATION PAR TRACKING ====================
+
+def _column_values(df, column, default):
+    """Valeurs brutes d'une colonne, ou la valeur par défaut si elle est absente (comme row.get)"""
+    if column in df.columns:
+        return df[column].to_numpy(dtype=object)
+    return np.full(len(df), default, dtype=object)
+
+def _carrier_lines(df, costs, partenaires_filter=None,
+                   tracking_col='Numéro de tracking', partner_col='Nom du partenaire',
+                   commande_col="Numéro de commande d'origine", date_col='Date de la commande'):
+    """
+    Lignes d'un transporteur au format commun, dans l'ordre du fichier
+    
+    Args:
+        df: DataFrame du transporteur
+        costs: coût à refacturer de chaque ligne (aligné sur df)
+        partenaires_filter: Liste des partenaires à inclure (None = tous)
+    
+    Returns:
+        DataFrame ['Tracking', 'Partenaire', 'Num_Commande', 'Date', 'Cout']
+    """
+    lines = pd.DataFrame({
+        'Tracking': [str(t) for t in _column_values(df, tracking_col, '')],
+        'Partenaire': _column_values(df, partner_col, 'Non attribué'),
+        'Num_Commande': _column_values(df, commande_col, ''),
+        'Date': _column_values(df, date_col, ''),
+        'Cout': np.asarray(costs, dtype=object),
+    })
+    
+    if partenaires_filter:
+        lines = lines[lines['Partenaire'].isin(list(partenaires_filter))]
+    
+    return lines
+
+def consolidate_carrier_lines(carrier_lines, chronopost_surplus=None):
+    """
+    Une ligne par tracking avec une colonne de coût par transporteur
+    
+    Règles de priorité :
+    - partenaire, commande et date viennent de la première ligne rencontrée
+      (transporteurs dans l'ordre de carrier_lines, puis ordre des fichiers)
+    - pour un même transporteur, la dernière ligne d'un tracking donne le coût
+    - les surplus Chronopost s'ajoutent aux trackings présents chez les
+      transporteurs collectés jusqu'à Chronopost inclus
+    
+    Args:
+        carrier_lines: liste ordonnée de (colonne de coût, lignes _carrier_lines)
+        chronopost_surplus: Series montant de surplus par tracking (str) ou None
+    
+    Returns:
+        DataFrame indexé par tracking (ordre de première apparition), None si vide
+    """
+    if not carrier_lines:
+        return None
+    
+    all_lines = pd.concat([lines for _, lines in carrier_lines], ignore_index=True)
+    if len(all_lines) == 0:
+        return None
+    
+    df_consolidated = all_lines.drop_duplicates('Tracking', keep='first')
+    df_consolidated = df_consolidated[['Partenaire', 'Tracking', 'Num_Commande', 'Date']]
+    df_consolidated.index = pd.Index(df_consolidated['Tracking'].to_numpy(dtype=object))
+    
+    for cost_col, lines in carrier_lines:
+        last_cost = lines.drop_duplicates('Tracking', keep='last').set_index('Tracking')['Cout']
+        df_consolidated[cost_col] = last_cost.reindex(df_consolidated.index).infer_objects().to_numpy()
+    
+    if chronopost_surplus is not None and 'Chronopost' in df_consolidated.columns:
+        # Seuls les trackings connus à la collecte Chronopost reçoivent un surplus
+        carriers = [cost_col for cost_col, _ in carrier_lines]
+        seen_lines = carrier_lines[:carriers.index('Chronopost') + 1]
+        seen = pd.concat([lines['Tracking'] for _, lines in seen_lines]).unique()
+        surplus = chronopost_surplus.reindex(df_consolidated.index)
+        has_surplus = surplus.notna() & df_consolidated.index.isin(seen)
+        if has_surplus.any():
+            current = df_consolidated.loc[has_surplus, 'Chronopost'].fillna(0)
+            df_consolidated.loc[has_surplus, 'Chronopost'] = current + surplus[has_surplus]
+    
+    return df_consolidated
 
 def create_consolidated_export(partenaires_filter=None):
     """
@@ -24,37 +107,33 @@ def create_consolidated_export(partenaires_filter=None):
         BytesIO: Fichier Excel
     """
     
-    # Dictionnaire pour stocker les coûts par tracking
-    all_data = {}
-    
     # Couleurs GREENLOG
-    bleu_greenlog = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
     rouge_alert = PatternFill(start_color='FFCCCC', end_color='FFCCCC', fill_type='solid')
-    vert_clair = PatternFill(start_color='E8F5F1', end_color='E8F5F1', fill_type='solid')
     jaune_alert = PatternFill(start_color='FFF3CD', end_color='FFF3CD', fill_type='solid')
     
+    style_ligne_paire = CellStyle(fill=VERT_CLAIR)
+    style_cout = CellStyle(fill=jaune_alert, font=Font(bold=True))
+    style_total = CellStyle(fill=rouge_alert, font=Font(bold=True, size=11, color='CC0000'))
+    style_titre = CellStyle(fill=BLEU_GREENLOG, font=Font(bold=True, size=14, color='FFFFFF'))
+    style_entete_synthese = CellStyle(
+        fill=BLEU_GREENLOG,
+        font=Font(bold=True, color='FFFFFF'),
+        alignment=Alignment(horizontal='center', vertical='center')
+    )
+    style_total_general = CellStyle(fill=BLEU_GREENLOG, font=Font(bold=True, color='FFFFFF', size=12))
+    style_total_synthese = CellStyle(fill=rouge_alert, font=Font(bold=True, color='CC0000'))
+    
+    # Lignes (tracking, partenaire, commande, date, coût) par transporteur, dans l'ordre de priorité
+    carrier_lines = []
+    
     # ==================== COLLECTER COÛTS DPD ====================
     if 'dpd_data' in st.session_state and st.session_state.dpd_data:
         try:
-            df_dpd = st.session_state.dpd_data['df_with_taxes'].copy()
+            df_dpd = st.session_state.dpd_data['df_with_taxes']
             
-            for _, row in df_dpd.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Partenaire': partner,
-                        'Tracking': tracking,
-                        'Num_Commande': row.get("Numéro de commande d'origine", ''),
-                        'Date': row.get('Date de la commande', ''),
-                    }
-                
-                # Coût DPD = Total TTC
-                all_data[tracking]['DPD'] = row.get('Montant total TTC', 0)
+            # Coût DPD = Total TTC
+            costs = _column_values(df_dpd, 'Montant total TTC', 0)
+            carrier_lines.append(('DPD', _carrier_lines(df_dpd, costs, partenaires_filter)))
         
         except Exception as e:
             st.warning(f"⚠️ Erreur collecte DPD: {str(e)}")
@@ -62,25 +141,11 @@ def create_consolidated_export(partenaires_filter=None):
     # ==================== COLLECTER COÛTS MONDIAL RELAY ====================
     if 'mondial_relay_data' in st.session_state and st.session_state.mondial_relay_data:
         try:
-            df_mr = st.session_state.mondial_relay_data['df'].copy()
+            df_mr = st.session_state.mondial_relay_data['df']
             
-            for _, row in df_mr.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Partenaire': partner,
-                        'Tracking': tracking,
-                        'Num_Commande': row.get("Numéro de commande d'origine", ''),
-                        'Date': row.get('Date de la commande', ''),
-                    }
-                
-                # Coût Mondial Relay = Total avec taxe
-                all_data[tracking]['Mondial_Relay'] = row.get('Total avec taxe', 0)
+            # Coût Mondial Relay = Total avec taxe
+            costs = _column_values(df_mr, 'Total avec taxe', 0)
+            carrier_lines.append(('Mondial_Relay', _carrier_lines(df_mr, costs, partenaires_filter)))
         
         except Exception as e:
             st.warning(f"⚠️ Erreur collecte Mondial Relay: {str(e)}")
@@ -89,100 +154,60 @@ def create_consolidated_export(partenaires_filter=None):
     # Note: Colissimo n'a pas de coût direct, juste statut
     if 'colissimo_data' in st.session_state and st.session_state.colissimo_data:
         try:
-            df_col = st.session_state.colissimo_data['df_matched'].copy()
+            df_col = st.session_state.colissimo_data['df_matched']
             
-            for _, row in df_col.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Partenaire': partner,
-                        'Tracking': tracking,
-                        'Num_Commande': row.get("Numéro de commande d'origine", ''),
-                        'Date': row.get('Date de la commande', ''),
-                    }
-                
-                # Colissimo : pas de coût direct, juste indication
-                all_data[tracking]['Colissimo'] = 0
+            # Colissimo : pas de coût direct, juste indication
+            costs = np.zeros(len(df_col), dtype=int)
+            carrier_lines.append(('Colissimo', _carrier_lines(df_col, costs, partenaires_filter)))
         
         except Exception as e:
             st.warning(f"⚠️ Erreur collecte Colissimo: {str(e)}")
     
     # ==================== COLLECTER COÛTS CHRONOPOST ====================
+    chronopost_surplus = None
     if 'chronopost_data' in st.session_state and st.session_state.chronopost_data:
         try:
-            df_chrono = st.session_state.chronopost_data['df'].copy()
+            df_chrono = st.session_state.chronopost_data['df']
             
-            for _, row in df_chrono.iterrows():
-                tracking = str(row.get('Tracking', ''))
-                partner = row.get('Partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Partenaire': partner,
-                        'Tracking': tracking,
-                        'Num_Commande': row.get('Num_Commande_Origine', ''),
-                        'Date': row.get('Date', ''),
-                    }
-                
-                # Coût Chronopost = Écart prix (si positif) + Surplus
-                ecart = row.get('Difference_Prix', 0)
-                all_data[tracking]['Chronopost'] = ecart if ecart > 0 else 0
+            # Coût Chronopost = Écart prix (si positif) + Surplus
+            ecart = pd.to_numeric(pd.Series(_column_values(df_chrono, 'Difference_Prix', 0)), errors='coerce')
+            costs = ecart.where(ecart > 0, 0).to_numpy()
+            lines = _carrier_lines(
+                df_chrono, costs, partenaires_filter,
+                tracking_col='Tracking', partner_col='Partenaire',
+                commande_col='Num_Commande_Origine', date_col='Date'
+            )
             
-            # Ajouter les surplus
+            # Surplus par tracking (ajoutés après consolidation)
             if 'df_surplus' in st.session_state.chronopost_data:
-                df_surplus = st.session_state.chronopost_data['df_surplus'].copy()
-                
-                surplus_by_tracking = df_surplus.groupby('Tracking')['Montant_Surplus'].sum().to_dict()
-                
-                for tracking, surplus in surplus_by_tracking.items():
-                    tracking_str = str(tracking)
-                    if tracking_str in all_data:
-                        current = all_data[tracking_str].get('Chronopost', 0)
-                        all_data[tracking_str]['Chronopost'] = current + surplus
+                df_surplus = st.session_state.chronopost_data['df_surplus']
+                chronopost_surplus = df_surplus.groupby('Tracking')['Montant_Surplus'].sum()
+                chronopost_surplus.index = chronopost_surplus.index.map(str)
+                chronopost_surplus = chronopost_surplus.groupby(level=0, sort=False).sum()
+            
+            carrier_lines.append(('Chronopost', lines))
         
         except Exception as e:
+            chronopost_surplus = None
             st.warning(f"⚠️ Erreur collecte Chronopost: {str(e)}")
     
     # ==================== COLLECTER COÛTS COLIS PRIVÉ ====================
     if 'colis_prive_data' in st.session_state and st.session_state.colis_prive_data:
         try:
-            df_cp = st.session_state.colis_prive_data['df'].copy()
+            df_cp = st.session_state.colis_prive_data['df']
             
-            for _, row in df_cp.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Partenaire': partner,
-                        'Tracking': tracking,
-                        'Num_Commande': row.get("Numéro de commande d'origine", ''),
-                        'Date': row.get('Date de la commande', ''),
-                    }
-                
-                # Coût Colis Privé = Majoration
-                all_data[tracking]['Colis_Prive'] = row.get('Majoration service', 0)
+            # Coût Colis Privé = Majoration
+            costs = _column_values(df_cp, 'Majoration service', 0)
+            carrier_lines.append(('Colis_Prive', _carrier_lines(df_cp, costs, partenaires_filter)))
         
         except Exception as e:
             st.warning(f"⚠️ Erreur collecte Colis Privé: {str(e)}")
     
     # ==================== CRÉER LE DATAFRAME SIMPLIFIÉ ====================
-    if not all_data:
+    df_refacturation = consolidate_carrier_lines(carrier_lines, chronopost_surplus)
+    if df_refacturation is None:
         return None
     
-    df_refacturation = pd.DataFrame.from_dict(all_data, orient='index')
-    
     # Colonnes dans l'ordre voulu
     colonnes_ordre = [
         'Partenaire',
@@ -227,61 +252,7 @@ def create_consolidated_export(partenaires_filter=None):
     for col in cols_numeriques + ['TOTAL_A_REFACTURER']:
         df_refacturation[col] = df_refacturation[col].round(2)
     
-    # ==================== CRÉER LE FICHIER EXCEL ====================
-    output = BytesIO()
-    df_refacturation.to_excel(output, index=False, sheet_name='Refacturation', engine='openpyxl')
-    output.seek(0)
-    
-    wb = load_workbook(output)
-    ws = wb['Refacturation']
-    
-    # Mise en forme des en-têtes
-    for cell in ws[1]:
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF', size=11)
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
-    # Mettre en jaune les cellules avec coûts > 0, en rouge le TOTAL
-    for row_idx in range(2, ws.max_row + 1):
-        # Alterner les couleurs de fond
-        if row_idx % 2 == 0:
-            for col_idx in range(1, ws.max_column + 1):
-                ws.cell(row=row_idx, column=col_idx).fill = vert_clair
-        
-        # Mettre en jaune les coûts > 0
-        for col_idx in range(5, 10):  # DPD à Colis_Prive
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value and isinstance(cell.value, (int, float)) and cell.value > 0:
-                cell.fill = jaune_alert
-                cell.font = Font(bold=True)
-        
-        # Mettre en rouge le TOTAL
-        total_cell = ws.cell(row=row_idx, column=10)
-        if total_cell.value and total_cell.value > 0:
-            total_cell.fill = rouge_alert
-            total_cell.font = Font(bold=True, size=11, color='CC0000')
-    
-    # Ajuster largeur des colonnes
-    for col_idx in range(1, ws.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_idx)
-        for row_idx in range(1, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 30)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Figer la première ligne
-    ws.freeze_panes = 'A2'
-    
-    # Ajouter un onglet SYNTHÈSE PAR PARTENAIRE
-    ws_synthese = wb.create_sheet('Synthèse Partenaire', 0)
-    
-    # Calculer synthèse
+    # ==================== SYNTHÈSE PAR PARTENAIRE ====================
     synthese_data = []
     for partner in df_refacturation['Partenaire'].unique():
         df_partner = df_refacturation[df_refacturation['Partenaire'] == partner]
@@ -314,492 +285,73 @@ def create_consolidated_export(partenaires_filter=None):
     }
     df_synthese = pd.concat([df_synthese, pd.DataFrame([total_general])], ignore_index=True)
     
-    # Écrire la synthèse
-    ws_synthese['A1'] = "SYNTHÈSE REFACTURATION PAR PARTENAIRE"
-    ws_synthese['A1'].font = Font(bold=True, size=14, color='FFFFFF')
-    ws_synthese['A1'].fill = bleu_greenlog
-    ws_synthese.merge_cells('A1:H1')
-    ws_synthese.row_dimensions[1].height = 30
+    # ==================== CRÉER LE FICHIER EXCEL ====================
+    wb = new_workbook()
+    
+    # Onglet SYNTHÈSE PAR PARTENAIRE (premier onglet)
+    ws_synthese = wb.create_sheet('Synthèse Partenaire')
     
-    ws_synthese['A2'] = f"Date d'export : {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+    titre = "SYNTHÈSE REFACTURATION PAR PARTENAIRE"
+    infos = [f"Date d'export : {datetime.now().strftime('%d/%m/%Y %H:%M')}"]
     if partenaires_filter:
-        ws_synthese['A3'] = f"Filtré : {', '.join(partenaires_filter)}"
+        infos.append(f"Filtré : {', '.join(partenaires_filter)}")
+    
+    # Ajuster colonnes synthèse (titre et informations en colonne A)
+    widths = column_widths(df_synthese, max_width=25)
+    widths[0] = min(max(widths[0], max(len(text) for text in [titre] + infos) + 2), 25)
+    set_column_widths(ws_synthese, widths)
+    
+    ws_synthese.merged_cells.add('A1:H1')
+    ws_synthese.row_dimensions[1].height = 30
+    ws_synthese.append([styled_cell(ws_synthese, titre, style_titre)])
+    for info in infos:
+        ws_synthese.append([info])
+    ws_synthese.append([])
     
     # En-têtes
     start_row = 5 if partenaires_filter else 4
-    for col_idx, col_name in enumerate(df_synthese.columns, 1):
-        cell = ws_synthese.cell(row=start_row, column=col_idx, value=col_name)
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF')
-        cell.alignment = Alignment(horizontal='center', vertical='center')
+    ws_synthese.append(styled_row(ws_synthese, df_synthese.columns, style_entete_synthese))
     
     # Données
     for row_idx, row_data in enumerate(df_synthese.values, start_row + 1):
         is_total_row = row_data[0] == 'TOTAL GÉNÉRAL'
         
+        styles = []
         for col_idx, value in enumerate(row_data, 1):
-            cell = ws_synthese.cell(row=row_idx, column=col_idx, value=value)
-            
             if is_total_row:
-                cell.fill = bleu_greenlog
-                cell.font = Font(bold=True, color='FFFFFF', size=12)
+                style = style_total_general
             elif row_idx % 2 == 0:
-                cell.fill = vert_clair
+                style = style_ligne_paire
+            else:
+                style = None
             
             # Colonne TOTAL en rouge
             if col_idx == 8 and not is_total_row and isinstance(value, (int, float)) and value > 0:
-                cell.fill = rouge_alert
-                cell.font = Font(bold=True, color='CC0000')
-    
-    # Ajuster colonnes synthèse
-    for col_idx in range(1, ws_synthese.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_idx)
-        for row_idx in range(1, ws_synthese.max_row + 1):
-            cell = ws_synthese.cell(row=row_idx, column=col_idx)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 25)
-        ws_synthese.column_dimensions[column_letter].width = adjusted_width
-    
-    # Sauvegarder
-    final_output = BytesIO()
-    wb.save(final_output)
-    final_output.seek(0)
-    
-    return final_output
-    
-    # Couleurs GREENLOG
-    bleu_greenlog = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
-    rouge_alert = PatternFill(start_color='FFCCCC', end_color='FFCCCC', fill_type='solid')
-    vert_clair = PatternFill(start_color='E8F5F1', end_color='E8F5F1', fill_type='solid')
-    
-    # ==================== COLLECTER DONNÉES DPD ====================
-    if 'dpd_data' in st.session_state and st.session_state.dpd_data:
-        try:
-            df_dpd = st.session_state.dpd_data['df_with_taxes'].copy()
-            
-            for _, row in df_dpd.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                # Filtrer par partenaire si nécessaire
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Tracking': tracking,
-                        'Partenaire': partner,
-                        'Date': row.get('Date de la commande', ''),
-                        'Num_Commande_Origine': row.get("Numéro de commande d'origine", ''),
-                        'Num_Commande_Partenaire': row.get('Numéro de commande partenaire', ''),
-                    }
-                
-                all_data[tracking]['DPD_Montant_HT'] = row.get('Montant HT', 0)
-                all_data[tracking]['DPD_Taxe_Fuel'] = row.get('Taxe fuel', 0)
-                all_data[tracking]['DPD_Taxe_Securite'] = row.get('Taxe sécurité', 0)
-                all_data[tracking]['DPD_Total_TTC'] = row.get('Montant total TTC', 0)
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte DPD: {str(e)}")
-    
-    # ==================== COLLECTER DONNÉES MONDIAL RELAY ====================
-    if 'mondial_relay_data' in st.session_state and st.session_state.mondial_relay_data:
-        try:
-            df_mr = st.session_state.mondial_relay_data['df'].copy()
-            
-            for _, row in df_mr.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Tracking': tracking,
-                        'Partenaire': partner,
-                        'Date': row.get('Date de la commande', ''),
-                        'Num_Commande_Origine': row.get("Numéro de commande d'origine", ''),
-                        'Num_Commande_Partenaire': row.get('Numéro de commande partenaire', ''),
-                    }
-                
-                all_data[tracking]['MondialRelay_Prix_Retour'] = row.get('Prix du retour', 0)
-                all_data[tracking]['MondialRelay_Taxe_Fuel'] = row.get('Taxe fuel', 0)
-                all_data[tracking]['MondialRelay_Total'] = row.get('Total avec taxe', 0)
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte Mondial Relay: {str(e)}")
-    
-    # ==================== COLLECTER DONNÉES COLISSIMO ====================
-    if 'colissimo_data' in st.session_state and st.session_state.colissimo_data:
-        try:
-            df_col = st.session_state.colissimo_data['df_matched'].copy()
-            
-            for _, row in df_col.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Tracking': tracking,
-                        'Partenaire': partner,
-                        'Date': row.get('Date de la commande', ''),
-                        'Num_Commande_Origine': row.get("Numéro de commande d'origine", ''),
-                        'Num_Commande_Partenaire': row.get('Numéro de commande partenaire', ''),
-                    }
-                
-                all_data[tracking]['Colissimo_Tracking_8R'] = row.get('Tracking 8R', '')
-                all_data[tracking]['Colissimo_Methode'] = row.get('Méthode', '')
-                all_data[tracking]['Colissimo_Statut'] = row.get('Statut', '')
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte Colissimo: {str(e)}")
-    
-    # ==================== COLLECTER DONNÉES CHRONOPOST ====================
-    if 'chronopost_data' in st.session_state and st.session_state.chronopost_data:
-        try:
-            df_chrono = st.session_state.chronopost_data['df'].copy()
-            
-            for _, row in df_chrono.iterrows():
-                tracking = str(row.get('Tracking', ''))
-                partner = row.get('Partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Tracking': tracking,
-                        'Partenaire': partner,
-                        'Date': row.get('Date', ''),
-                        'Num_Commande_Origine': row.get('Num_Commande_Origine', ''),
-                        'Num_Commande_Partenaire': row.get('Num_Commande_Partenaire', ''),
-                    }
-                
-                all_data[tracking]['Chronopost_Prix_Facture'] = row.get('Prix_Facture_HT', 0)
-                all_data[tracking]['Chronopost_Prix_Theorique'] = row.get('Prix_Theorique_HT', 0)
-                all_data[tracking]['Chronopost_Ecart_Prix'] = row.get('Difference_Prix', 0)
-                all_data[tracking]['Chronopost_Poids_Facture'] = row.get('Poids_Chronopost', 0)
-                all_data[tracking]['Chronopost_Poids_Logisticien'] = row.get('Poids_Logisticien', 0)
-                # Chronopost_Ecart_Poids RETIRÉ sur demande utilisateur
-            
-            # Ajouter les surplus
-            if 'df_surplus' in st.session_state.chronopost_data:
-                df_surplus = st.session_state.chronopost_data['df_surplus'].copy()
-                
-                # Grouper les surplus par tracking
-                surplus_by_tracking = df_surplus.groupby('Tracking').agg({
-                    'Montant_Surplus': 'sum',
-                    'Type_Surplus': lambda x: ', '.join(x.unique())
-                }).to_dict('index')
-                
-                for tracking, surplus_data in surplus_by_tracking.items():
-                    tracking_str = str(tracking)
-                    if tracking_str in all_data:
-                        all_data[tracking_str]['Chronopost_Surplus_Montant'] = surplus_data['Montant_Surplus']
-                        all_data[tracking_str]['Chronopost_Surplus_Types'] = surplus_data['Type_Surplus']
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte Chronopost: {str(e)}")
-    
-    # ==================== COLLECTER DONNÉES COLIS PRIVÉ ====================
-    if 'colis_prive_data' in st.session_state and st.session_state.colis_prive_data:
-        try:
-            df_cp = st.session_state.colis_prive_data['df'].copy()
-            
-            for _, row in df_cp.iterrows():
-                tracking = str(row.get('Numéro de tracking', ''))
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                if tracking not in all_data:
-                    all_data[tracking] = {
-                        'Tracking': tracking,
-                        'Partenaire': partner,
-                        'Date': row.get('Date de la commande', ''),
-                        'Num_Commande_Origine': row.get("Numéro de commande d'origine", ''),
-                        'Num_Commande_Partenaire': row.get('Numéro de commande partenaire', ''),
-                    }
-                
-                # ColisPrive_Poids_Facture RETIRÉ sur demande utilisateur
-                all_data[tracking]['ColisPrive_Majoration'] = row.get('Majoration service', 0)
-                # ColisPrive_Code_Postal RETIRÉ sur demande utilisateur
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte Colis Privé: {str(e)}")
-    
-    # ==================== COLLECTER DONNÉES RETOURS PRODUITS ====================
-    if 'retours_data' in st.session_state and st.session_state.retours_data:
-        try:
-            df_retours = st.session_state.retours_data['df_grouped'].copy()
-            
-            for _, row in df_retours.iterrows():
-                partner = row.get('Nom du partenaire', 'Non attribué')
-                
-                if partenaires_filter and partner not in partenaires_filter:
-                    continue
-                
-                # Pour les retours, on n'a pas forcément de tracking unique
-                # On va créer une entrée synthétique par partenaire
-                key = f"RETOURS_{partner}"
-                
-                if key not in all_data:
-                    all_data[key] = {
-                        'Tracking': 'SYNTHESE_RETOURS',
-                        'Partenaire': partner,
-                        'Date': '',
-                        'Num_Commande_Origine': '',
-                        'Num_Commande_Partenaire': '',
-                    }
-                
-                all_data[key]['Retours_Nb_Total'] = row.get('Nombre de retours', 0)
-                all_data[key]['Retours_Nb_Avec_Motif'] = row.get('Avec motif', 0)
-                all_data[key]['Retours_Nb_Sans_Motif'] = row.get('Sans motif', 0)
-        
-        except Exception as e:
-            st.warning(f"⚠️ Erreur collecte Retours: {str(e)}")
-    
-    # ==================== CRÉER LE DATAFRAME CONSOLIDÉ ====================
-    if not all_data:
-        return None
-    
-    df_consolidated = pd.DataFrame.from_dict(all_data, orient='index')
-    
-    # Définir TOUTES les colonnes possibles (même si vides)
-    all_possible_columns = {
-        # Colonnes de base
-        'Partenaire': None,
-        'Tracking': None,
-        'Date': None,
-        'Num_Commande_Origine': None,
-        'Num_Commande_Partenaire': None,
-        
-        # DPD
-        'DPD_Montant_HT': 0,
-        'DPD_Taxe_Fuel': 0,
-        'DPD_Taxe_Securite': 0,
-        'DPD_Total_TTC': 0,
-        
-        # Mondial Relay
-        'MondialRelay_Prix_Retour': 0,
-        'MondialRelay_Taxe_Fuel': 0,
-        'MondialRelay_Total': 0,
+                style = style_total_synthese
+            styles.append(style)
         
-        # Colissimo
-        'Colissimo_Tracking_8R': None,
-        'Colissimo_Methode': None,
-        'Colissimo_Statut': None,
-        
-        # Chronopost
-        'Chronopost_Prix_Facture': 0,
-        'Chronopost_Prix_Theorique': 0,
-        'Chronopost_Ecart_Prix': 0,
-        'Chronopost_Poids_Facture': 0,
-        'Chronopost_Poids_Logisticien': 0,
-        'Chronopost_Surplus_Montant': 0,
-        'Chronopost_Surplus_Types': None,
-        
-        # Colis Privé
-        'ColisPrive_Majoration': 0,
-        
-        # Retours
-        'Retours_Nb_Total': 0,
-        'Retours_Nb_Avec_Motif': 0,
-        'Retours_Nb_Sans_Motif': 0,
-    }
-    
-    # Ajouter les colonnes manquantes avec leurs valeurs par défaut
-    for col, default_value in all_possible_columns.items():
-        if col not in df_consolidated.columns:
-            df_consolidated[col] = default_value
+        ws_synthese.append(styled_row(ws_synthese, row_data, styles))
     
-    # Réorganiser les colonnes dans un ordre logique
-    base_cols = ['Partenaire', 'Tracking', 'Date', 'Num_Commande_Origine', 'Num_Commande_Partenaire']
-    
-    dpd_cols = ['DPD_Montant_HT', 'DPD_Taxe_Fuel', 'DPD_Taxe_Securite', 'DPD_Total_TTC']
-    mr_cols = ['MondialRelay_Prix_Retour', 'MondialRelay_Taxe_Fuel', 'MondialRelay_Total']
-    col_cols = ['Colissimo_Tracking_8R', 'Colissimo_Methode', 'Colissimo_Statut']
-    chrono_cols = ['Chronopost_Prix_Facture', 'Chronopost_Prix_Theorique', 'Chronopost_Ecart_Prix', 
-                   'Chronopost_Poids_Facture', 'Chronopost_Poids_Logisticien', 
-                   'Chronopost_Surplus_Montant', 'Chronopost_Surplus_Types']
-    cp_cols = ['ColisPrive_Majoration']
-    retours_cols = ['Retours_Nb_Total', 'Retours_Nb_Avec_Motif', 'Retours_Nb_Sans_Motif']
-    
-    ordered_cols = base_cols + dpd_cols + mr_cols + col_cols + chrono_cols + cp_cols + retours_cols
-    
-    df_consolidated = df_consolidated[ordered_cols]
-    
-    # Trier par partenaire puis par date
-    df_consolidated = df_consolidated.sort_values(['Partenaire', 'Date'], ascending=[True, False])
-    
-    # Remplacer NaN/None par 0 pour les colonnes numériques
-    numeric_cols = dpd_cols + mr_cols + chrono_cols + cp_cols + retours_cols
-    for col in numeric_cols:
-        if col in df_consolidated.columns:
-            df_consolidated[col] = df_consolidated[col].fillna(0)
-    
-    # ==================== CRÉER LE FICHIER EXCEL ====================
-    output = BytesIO()
-    df_consolidated.to_excel(output, index=False, sheet_name='Export Consolidé', engine='openpyxl')
-    output.seek(0)
-    
-    wb = load_workbook(output)
-    ws = wb['Export Consolidé']
-    
-    # Mise en forme des en-têtes
-    for cell in ws[1]:
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF', size=10)
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
-    # Identifier les colonnes de majorations/écarts pour mise en rouge
-    alert_columns = []
-    for idx, col_name in enumerate(df_consolidated.columns, 1):
-        if any(keyword in col_name for keyword in ['Ecart', 'Majoration', 'Surplus_Montant']):
-            alert_columns.append(idx)
-    
-    # Appliquer la mise en forme
-    for row_idx in range(2, ws.max_row + 1):
+    # Onglet détail, mis en forme ligne par ligne à l'écriture
+    def style_refacturation(row_idx, values):
         # Alterner les couleurs de fond
-        if row_idx % 2 == 0:
-            for col_idx in range(1, ws.max_column + 1):
-                ws.cell(row=row_idx, column=col_idx).fill = vert_clair
-        
-        # Mettre en rouge les cellules avec majorations/écarts > 0
-        for col_idx in alert_columns:
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value and isinstance(cell.value, (int, float)) and cell.value > 0:
-                cell.fill = rouge_alert
-                cell.font = Font(bold=True, color='CC0000')
-    
-    # Ajuster largeur des colonnes
-    for col_idx in range(1, ws.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_idx)
-        for row_idx in range(1, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 40)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Figer la première ligne
-    ws.freeze_panes = 'A2'
-    
-    # Ajouter un onglet de synthèse par partenaire
-    ws_synthese = wb.create_sheet('Synthèse par Partenaire', 0)
-    
-    # Grouper par partenaire
-    synthese_data = []
-    for partner in df_consolidated['Partenaire'].unique():
-        df_partner = df_consolidated[df_consolidated['Partenaire'] == partner]
-        
-        row_data = {
-            'Partenaire': partner,
-            'Nb_Commandes': len(df_partner[df_partner['Tracking'] != 'SYNTHESE_RETOURS']),
-        }
-        
-        # DPD
-        if 'DPD_Total_TTC' in df_partner.columns:
-            row_data['DPD_Total'] = df_partner['DPD_Total_TTC'].sum()
-        
-        # Mondial Relay
-        if 'MondialRelay_Total' in df_partner.columns:
-            row_data['MondialRelay_Total'] = df_partner['MondialRelay_Total'].sum()
-        
-        # Chronopost
-        if 'Chronopost_Ecart_Prix' in df_partner.columns:
-            row_data['Chronopost_Ecarts'] = df_partner['Chronopost_Ecart_Prix'].sum()
-        if 'Chronopost_Surplus_Montant' in df_partner.columns:
-            row_data['Chronopost_Surplus'] = df_partner['Chronopost_Surplus_Montant'].sum()
-        
-        # Colis Privé
-        if 'ColisPrive_Majoration' in df_partner.columns:
-            row_data['ColisPrive_Majorations'] = df_partner['ColisPrive_Majoration'].sum()
+        styles = [style_ligne_paire if row_idx % 2 == 0 else None] * len(values)
         
-        # Retours
-        if 'Retours_Nb_Total' in df_partner.columns:
-            row_data['Retours_Total'] = df_partner['Retours_Nb_Total'].sum()
-        
-        # Total général
-        row_data['TOTAL_GENERAL'] = (
-            row_data.get('DPD_Total', 0) +
-            row_data.get('MondialRelay_Total', 0) +
-            row_data.get('Chronopost_Ecarts', 0) +
-            row_data.get('Chronopost_Surplus', 0) +
-            row_data.get('ColisPrive_Majorations', 0)
-        )
+        # Mettre en jaune les coûts > 0
+        for col_idx in range(4, 9):  # DPD à Colis_Prive
+            value = values[col_idx]
+            if value and isinstance(value, (int, float)) and value > 0:
+                styles[col_idx] = style_cout
         
-        synthese_data.append(row_data)
-    
-    df_synthese = pd.DataFrame(synthese_data)
-    df_synthese = df_synthese.sort_values('TOTAL_GENERAL', ascending=False)
-    
-    # Écrire la synthèse
-    ws_synthese['A1'] = "SYNTHÈSE PAR PARTENAIRE"
-    ws_synthese['A1'].font = Font(bold=True, size=14, color='FFFFFF')
-    ws_synthese['A1'].fill = bleu_greenlog
-    ws_synthese.merge_cells('A1:I1')
-    ws_synthese.row_dimensions[1].height = 30
+        # Mettre en rouge le TOTAL
+        if values[9] and values[9] > 0:
+            styles[9] = style_total
+        return styles
     
-    ws_synthese['A2'] = f"Date d'export : {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    if partenaires_filter:
-        ws_synthese['A3'] = f"Filtré : {', '.join(partenaires_filter)}"
+    ws = wb.create_sheet('Refacturation')
+    write_dataframe(ws, df_refacturation, row_style=style_refacturation, max_width=30)
     
-    # En-têtes
-    start_row = 5 if partenaires_filter else 4
-    headers = list(df_synthese.columns)
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws_synthese.cell(row=start_row, column=col_idx, value=header)
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF')
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Données
-    for row_idx, row_data in enumerate(df_synthese.values, start_row + 1):
-        for col_idx, value in enumerate(row_data, 1):
-            cell = ws_synthese.cell(row=row_idx, column=col_idx, value=value)
-            if row_idx % 2 == 0:
-                cell.fill = vert_clair
-            
-            # Mettre en rouge les valeurs > 0 pour écarts/majorations
-            if col_idx > 2 and isinstance(value, (int, float)) and value > 0:
-                if 'Ecart' in headers[col_idx-1] or 'Majoration' in headers[col_idx-1] or 'Surplus' in headers[col_idx-1]:
-                    cell.fill = rouge_alert
-    
-    # Ajuster colonnes synthèse
-    for col_idx in range(1, ws_synthese.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_idx)
-        for row_idx in range(1, ws_synthese.max_row + 1):
-            cell = ws_synthese.cell(row=row_idx, column=col_idx)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 30)
-        ws_synthese.column_dimensions[column_letter].width = adjusted_width
-    
-    # Sauvegarder
-    final_output = BytesIO()
-    wb.save(final_output)
-    final_output.seek(0)
-    
-    return final_output
+    return save_workbook(wb)
 
 def run_export_interface():
     """Interface d'export global sur la page d'accueil"""
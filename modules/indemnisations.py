@@ -6,12 +6,68 @@ Version 1.0
 
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+import numpy as np
 from datetime import datetime, date
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.utils import get_column_letter
+from openpyxl.styles import Font
 from shared import persistence
+from shared.excel_export import (
+    CellStyle, BLEU_GREENLOG, VERT_CLAIR, new_workbook, save_workbook,
+    styled_cell, styled_row, set_column_widths, write_dataframe
+)
+
+# Colonnes logisticien rapatriées pour une indemnisation
+LOGISTICIEN_COLUMNS = {
+    'partenaire': 'Nom du partenaire',
+    'num_commande_origine': "Numéro de commande d'origine",
+    'num_commande_partenaire': 'Numéro de commande partenaire'
+}
+
+def match_trackings(trackings, nb_months=6):
+    """
+    Recherche groupée de trackings dans les fichiers logisticien partagés
+    
+    Une seule jointure contre l'index des références : les données
+    logisticiens sont chargées une fois pour toutes les lignes (et restent
+    en cache pour les appels suivants).
+    
+    Args:
+        trackings: Series/liste de trackings
+        nb_months: Nombre de périodes les plus récentes consultées
+    
+    Returns:
+        DataFrame aligné sur l'index de `trackings` : 'found', 'partenaire',
+        'num_commande_origine', 'num_commande_partenaire'
+    """
+    from modules.logisticiens_library import match_references
+    
+    trackings = pd.Series(trackings, dtype=object)
+    n = len(trackings)
+    found = np.zeros(n, dtype=bool)
+    infos = {
+        'partenaire': np.full(n, 'Non trouvé', dtype=object),
+        'num_commande_origine': np.full(n, '', dtype=object),
+        'num_commande_partenaire': np.full(n, '', dtype=object)
+    }
+    
+    try:
+        if n > 0:
+            matched = match_references(
+                trackings, fields=('tracking',), nb_months=nb_months,
+                columns=list(LOGISTICIEN_COLUMNS.values())
+            )
+            found = matched['period'].notna().to_numpy()
+            
+            for field, column in LOGISTICIEN_COLUMNS.items():
+                for i, value in zip(np.flatnonzero(found), matched[column].to_numpy(dtype=object)[found]):
+                    # Colonne absente du fichier : valeur par défaut
+                    if value is None:
+                        continue
+                    infos[field][i] = value if field == 'partenaire' else str(value)
+    except Exception as e:
+        print(f"Erreur recherche trackings logisticien: {e}")
+        found = np.zeros(n, dtype=bool)
+    
+    return pd.DataFrame({'found': found, **infos}, index=trackings.index)
 
 def get_info_from_tracking(tracking):
     """
@@ -21,105 +77,51 @@ def get_info_from_tracking(tracking):
     Returns:
         dict: {'partenaire': str, 'num_commande_origine': str, 'num_commande_partenaire': str, 'found': bool}
     """
-    tracking_clean = str(tracking).strip()
-    
-    # Charger fichiers logisticiens depuis la bibliothèque
-    from modules.logisticiens_library import load_logisticien_files_for_analysis
-    
-    log_files = load_logisticien_files_for_analysis(nb_months=6)
-    
-    if len(log_files) == 0:
-        return {
-            'partenaire': 'Non trouvé',
-            'num_commande_origine': '',
-            'num_commande_partenaire': '',
-            'found': False
-        }
-    
-    # Parcourir tous les fichiers logisticien
-    for log_file in log_files:
-        try:
-            # Lire le fichier Excel
-            log_file.seek(0)
-            
-            # Essayer de lire la feuille "Facturation préparation"
-            try:
-                df = pd.read_excel(log_file, sheet_name="Facturation préparation")
-            except:
-                df = pd.read_excel(log_file)
-            
-            # Chercher le tracking dans la colonne "Numéro de tracking"
-            if 'Numéro de tracking' in df.columns:
-                # Nettoyer les trackings
-                df['Tracking_Clean'] = df['Numéro de tracking'].astype(str).str.strip()
-                
-                # Chercher la correspondance
-                match = df[df['Tracking_Clean'] == tracking_clean]
-                
-                if len(match) > 0:
-                    row = match.iloc[0]
-                    return {
-                        'partenaire': row.get('Nom du partenaire', 'Non trouvé'),
-                        'num_commande_origine': str(row.get("Numéro de commande d'origine", '')),
-                        'num_commande_partenaire': str(row.get('Numéro de commande partenaire', '')),
-                        'found': True
-                    }
-        except Exception as e:
-            continue
-    
-    # Si pas trouvé
+    info = match_trackings([str(tracking).strip()]).iloc[0]
     return {
-        'partenaire': 'Non trouvé',
-        'num_commande_origine': '',
-        'num_commande_partenaire': '',
-        'found': False
+        'partenaire': info['partenaire'],
+        'num_commande_origine': info['num_commande_origine'],
+        'num_commande_partenaire': info['num_commande_partenaire'],
+        'found': bool(info['found'])
     }
 
+def rematch_non_trouves(df_full):
+    """
+    Re-matching rétroactif des indemnisations "Non trouvé" (en place)
+    
+    Toutes les lignes en attente sont recherchées en une seule passe.
+    
+    Returns:
+        tuple: (liste des mises à jour [{'tracking', 'partenaire'}], nb toujours non trouvées)
+    """
+    pending = np.flatnonzero((df_full['Partenaire'] == 'Non trouvé').to_numpy())
+    if len(pending) == 0:
+        return [], 0
+    
+    infos = match_trackings(df_full['Tracking'].iloc[pending].reset_index(drop=True))
+    found = infos['found'].to_numpy()
+    
+    rows = np.zeros(len(df_full), dtype=bool)
+    rows[pending[found]] = True
+    infos = infos[found]
+    
+    df_full.loc[rows, 'Partenaire'] = infos['partenaire'].to_numpy()
+    df_full.loc[rows, 'Num_Commande_Origine'] = infos['num_commande_origine'].to_numpy()
+    df_full.loc[rows, 'Num_Commande_Partenaire'] = infos['num_commande_partenaire'].to_numpy()
+    
+    updated_list = [
+        {'tracking': tracking, 'partenaire': partenaire}
+        for tracking, partenaire in zip(df_full.loc[rows, 'Tracking'], infos['partenaire'])
+    ]
+    return updated_list, int(len(pending) - found.sum())
+
 def export_indemnisations_excel(df):
     """Exporter les indemnisations en Excel avec mise en forme"""
     
-    output = BytesIO()
-    df.to_excel(output, index=False, sheet_name='Indemnisations', engine='openpyxl')
-    output.seek(0)
-    
-    wb = load_workbook(output)
-    ws = wb['Indemnisations']
-    
-    # Couleurs GREENLOG
-    bleu_greenlog = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
-    vert_clair = PatternFill(start_color='E8F5F1', end_color='E8F5F1', fill_type='solid')
-    
-    # Mise en forme des en-têtes
-    for cell in ws[1]:
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF', size=11)
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
-    # Alterner les couleurs de fond
-    for row_idx in range(2, ws.max_row + 1):
-        if row_idx % 2 == 0:
-            for col_idx in range(1, ws.max_column + 1):
-                ws.cell(row=row_idx, column=col_idx).fill = vert_clair
-    
-    # Ajuster largeur des colonnes
-    for col_idx in range(1, ws.max_column + 1):
-        max_length = 0
-        column_letter = get_column_letter(col_idx)
-        for row_idx in range(1, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            try:
-                if cell.value and len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 40)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Figer la première ligne
-    ws.freeze_panes = 'A2'
-    
-    # Créer onglet de synthèse
-    ws_synthese = wb.create_sheet('Synthèse', 0)
+    # Styles GREENLOG
+    style_ligne_paire = CellStyle(fill=VERT_CLAIR)
+    style_titre = CellStyle(fill=BLEU_GREENLOG, font=Font(bold=True, size=14, color='FFFFFF'))
+    style_bloc = CellStyle(fill=BLEU_GREENLOG, font=Font(bold=True, color='FFFFFF'))
     
     # Synthèse par partenaire et transporteur
     synthese_partner_transp = df.groupby(['Partenaire', 'Transporteur'])['Montant'].sum().reset_index()
@@ -141,81 +143,62 @@ def export_indemnisations_excel(df):
     synthese_transp.columns = ['Transporteur', 'Total_Indemnisations', 'Nb_Cas']
     synthese_transp = synthese_transp.sort_values('Total_Indemnisations', ascending=False)
     
+    wb = new_workbook()
+    
+    # Créer onglet de synthèse (premier onglet)
+    ws_synthese = wb.create_sheet('Synthèse')
+    
+    # Ajuster colonnes synthèse
+    set_column_widths(ws_synthese, [25] * 4)
+    
     # Titre
-    ws_synthese['A1'] = "SYNTHÈSE DES INDEMNISATIONS"
-    ws_synthese['A1'].font = Font(bold=True, size=14, color='FFFFFF')
-    ws_synthese['A1'].fill = bleu_greenlog
-    ws_synthese.merge_cells('A1:D1')
+    ws_synthese.merged_cells.add('A1:D1')
     ws_synthese.row_dimensions[1].height = 30
+    ws_synthese.append([styled_cell(ws_synthese, "SYNTHÈSE DES INDEMNISATIONS", style_titre)])
     
-    ws_synthese['A2'] = f"Date d'export : {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    ws_synthese['A3'] = f"Période : {df['Date'].min()} au {df['Date'].max()}"
+    ws_synthese.append([f"Date d'export : {datetime.now().strftime('%d/%m/%Y %H:%M')}"])
+    ws_synthese.append([f"Période : {df['Date'].min()} au {df['Date'].max()}"])
+    ws_synthese.append([])
     
-    # Total général
+    # Total général (ligne 5)
     total_general = df['Montant'].sum()
     nb_total = len(df)
-    ws_synthese['A5'] = "TOTAL GÉNÉRAL"
-    ws_synthese['A5'].font = Font(bold=True, size=12)
-    ws_synthese['B5'] = f"{total_general:.2f} €"
-    ws_synthese['B5'].font = Font(bold=True, size=12, color='CC0000')
-    ws_synthese['C5'] = f"{nb_total} indemnisation(s)"
-    
-    # Par partenaire
+    ws_synthese.append([
+        styled_cell(ws_synthese, "TOTAL GÉNÉRAL", CellStyle(font=Font(bold=True, size=12))),
+        styled_cell(ws_synthese, f"{total_general:.2f} €", CellStyle(font=Font(bold=True, size=12, color='CC0000'))),
+        f"{nb_total} indemnisation(s)"
+    ])
+    ws_synthese.append([])
+    ws_synthese.append([])
     row = 8
-    ws_synthese[f'A{row}'] = "PAR PARTENAIRE"
-    ws_synthese[f'A{row}'].font = Font(bold=True, size=11)
-    ws_synthese[f'A{row}'].fill = bleu_greenlog
-    ws_synthese[f'A{row}'].font = Font(bold=True, color='FFFFFF')
-    
-    row += 1
-    for col_idx, col_name in enumerate(['Partenaire', 'Total', 'Nb Cas'], 1):
-        cell = ws_synthese.cell(row=row, column=col_idx, value=col_name)
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF')
-    
-    row += 1
-    for _, partner_row in synthese_partner.iterrows():
-        ws_synthese[f'A{row}'] = partner_row['Partenaire']
-        ws_synthese[f'B{row}'] = f"{partner_row['Total_Indemnisations']:.2f} €"
-        ws_synthese[f'C{row}'] = int(partner_row['Nb_Cas'])
-        if row % 2 == 0:
-            for col_idx in range(1, 4):
-                ws_synthese.cell(row=row, column=col_idx).fill = vert_clair
-        row += 1
-    
-    # Par transporteur
-    row += 2
-    ws_synthese[f'A{row}'] = "PAR TRANSPORTEUR"
-    ws_synthese[f'A{row}'].font = Font(bold=True, size=11)
-    ws_synthese[f'A{row}'].fill = bleu_greenlog
-    ws_synthese[f'A{row}'].font = Font(bold=True, color='FFFFFF')
-    
-    row += 1
-    for col_idx, col_name in enumerate(['Transporteur', 'Total', 'Nb Cas'], 1):
-        cell = ws_synthese.cell(row=row, column=col_idx, value=col_name)
-        cell.fill = bleu_greenlog
-        cell.font = Font(bold=True, color='FFFFFF')
-    
-    row += 1
-    for _, transp_row in synthese_transp.iterrows():
-        ws_synthese[f'A{row}'] = transp_row['Transporteur']
-        ws_synthese[f'B{row}'] = f"{transp_row['Total_Indemnisations']:.2f} €"
-        ws_synthese[f'C{row}'] = int(transp_row['Nb_Cas'])
-        if row % 2 == 0:
-            for col_idx in range(1, 4):
-                ws_synthese.cell(row=row, column=col_idx).fill = vert_clair
-        row += 1
     
-    # Ajuster colonnes synthèse
-    for col_idx in range(1, 5):
-        ws_synthese.column_dimensions[get_column_letter(col_idx)].width = 25
-    
-    # Sauvegarder
-    final_output = BytesIO()
-    wb.save(final_output)
-    final_output.seek(0)
-    
-    return final_output
+    # Par partenaire puis par transporteur
+    for titre, synthese, label in [
+        ("PAR PARTENAIRE", synthese_partner, 'Partenaire'),
+        ("PAR TRANSPORTEUR", synthese_transp, 'Transporteur'),
+    ]:
+        if titre == "PAR TRANSPORTEUR":
+            ws_synthese.append([])
+            ws_synthese.append([])
+            row += 2
+        
+        ws_synthese.append([styled_cell(ws_synthese, titre, style_bloc)])
+        ws_synthese.append(styled_row(ws_synthese, [label, 'Total', 'Nb Cas'], style_bloc))
+        row += 2
+        
+        for name, total, nb_cas in synthese[[label, 'Total_Indemnisations', 'Nb_Cas']].itertuples(index=False, name=None):
+            values = [name, f"{total:.2f} €", int(nb_cas)]
+            ws_synthese.append(styled_row(ws_synthese, values, style_ligne_paire if row % 2 == 0 else None))
+            row += 1
+    
+    # Onglet détail : couleurs alternées à l'écriture, largeurs calculées sur le DataFrame
+    ws = wb.create_sheet('Indemnisations')
+    write_dataframe(
+        ws, df, max_width=40,
+        row_style=lambda row_idx, values: style_ligne_paire if row_idx % 2 == 0 else None
+    )
+    
+    return save_workbook(wb)
 
 def run():
     """Point d'entrée du module Indemnisations"""
@@ -350,10 +333,11 @@ def run():
         st.subheader("➕ Nouvelle Indemnisation")
         
         # Vérifier si fichiers logisticien disponibles dans la bibliothèque
-        from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
+        from modules.logisticiens_library import get_all_available_periods
         
-        log_files = load_logisticien_files_for_analysis(nb_months=6)
-        has_log = len(log_files) > 0
+        # Liste des périodes (manifeste seul)
+        log_periods = get_all_available_periods()[:6]
+        has_log = len(log_periods) > 0
         
         if not has_log:
             st.warning("""
@@ -369,11 +353,10 @@ def run():
             Les fichiers logisticien permettent de croiser automatiquement le tracking avec les informations partenaire.
             """)
         else:
-            periods = get_all_available_periods()[:len(log_files)]
-            st.success(f"✅ {len(log_files)} fichier(s) logisticien disponible(s) pour croisement automatique")
+            st.success(f"✅ {len(log_periods)} fichier(s) logisticien disponible(s) pour croisement automatique")
             with st.expander("📅 Périodes disponibles"):
                 from modules.bibliotheque import get_month_name
-                for period in periods:
+                for period in log_periods:
                     st.caption(f"• {get_month_name(period['month'])} {period['year']}")
         
         with st.form("form_indemnisation"):
@@ -598,11 +581,11 @@ def run():
                     if st.button("🔄 Lancer le Re-Matching", type="primary", use_container_width=True):
                         with st.spinner("🔍 Re-matching en cours..."):
                             # Charger les fichiers logisticiens
-                            from modules.logisticiens_library import load_logisticien_files_for_analysis
+                            from modules.logisticiens_library import get_all_available_periods
                             
-                            log_files = load_logisticien_files_for_analysis(nb_months=6)
+                            log_periods = get_all_available_periods()[:6]
                             
-                            if len(log_files) == 0:
+                            if len(log_periods) == 0:
                                 st.error("""
                                 ❌ **Aucun fichier logisticien disponible**
                                 
@@ -610,34 +593,12 @@ def run():
                                 **"Import Fichier Logisticien"** pour que le re-matching fonctionne.
                                 """)
                             else:
-                                st.success(f"✅ {len(log_files)} fichier(s) logisticien disponible(s)")
-                                
-                                # Statistiques
-                                nb_updated = 0
-                                nb_still_not_found = 0
-                                updated_list = []
+                                st.success(f"✅ {len(log_periods)} fichier(s) logisticien disponible(s)")
                                 
-                                # Re-matcher chaque indemnisation "Non trouvé"
+                                # Re-matcher toutes les indemnisations "Non trouvé" en une passe
                                 df_full = st.session_state.indemnisations_data.copy()
-                                
-                                for idx, row in df_full.iterrows():
-                                    if row['Partenaire'] == 'Non trouvé':
-                                        # Re-chercher les infos
-                                        info = get_info_from_tracking(row['Tracking'])
-                                        
-                                        if info['found']:
-                                            # Mettre à jour
-                                            df_full.at[idx, 'Partenaire'] = info['partenaire']
-                                            df_full.at[idx, 'Num_Commande_Origine'] = info['num_commande_origine']
-                                            df_full.at[idx, 'Num_Commande_Partenaire'] = info['num_commande_partenaire']
-                                            
-                                            nb_updated += 1
-                                            updated_list.append({
-                                                'tracking': row['Tracking'],
-                                                'partenaire': info['partenaire']
-                                            })
-                                        else:
-                                            nb_still_not_found += 1
+                                updated_list, nb_still_not_found = rematch_non_trouves(df_full)
+                                nb_updated = len(updated_list)
                                 
                                 # Sauvegarder les modifications
                                 if nb_updated > 0:
@@ -659,7 +620,7 @@ def run():
                                     st.metric("⚠️ Toujours Non trouvé", nb_still_not_found)
                                 
                                 with col3:
-                                    st.metric("📁 Fichiers consultés", len(log_files))
+                                    st.metric("📁 Fichiers consultés", len(log_periods))
                                 
                                 if nb_updated > 0:
                                     st.success(f"✅ **{nb_updated} indemnisation(s) mise(s) à jour avec succès !**")
@@ -6,8 +6,34 @@ Version 1.0
 
 import streamlit as st
 import pandas as pd
+import numpy as np
+import pickle
+import threading
+from io import BytesIO
 from datetime import datetime
 from shared import persistence
+from shared.ingestion import parse_files
+
+# Feuille lue dans tous les fichiers logisticiens
+LOGISTICIEN_SHEET = 'Facturation préparation'
+
+# Colonnes indexées dans l'index des références (champ → colonne logisticien)
+INDEX_FIELDS = {
+    'tracking': 'Numéro de tracking',
+    'colis': 'Numéro de colis',
+    'commande': "Numéro de commande d'origine"
+}
+
+# DataFrames parsés déjà désérialisés, partagés entre sessions :
+# période → ((blob, uploaded_at), DataFrame). Un nouvel upload de la
+# période change le blob et invalide l'entrée. Rendus via
+# persistence.frame_copy (jamais l'objet du cache lui-même).
+_dataframe_cache = {}
+_dataframe_cache_lock = threading.Lock()
+
+# Tables de recherche dédoublonnées (index des références indexé par clé) :
+# (champs, nb_months, keep) → (état des périodes, DataFrame)
+_lookup_cache = {}
 
 def get_month_name(month_num):
     """Retourne le nom du mois en français"""
@@ -24,12 +50,19 @@ def detect_period_from_logisticien(file):
     en analysant les dates d'expédition
     """
     try:
-        import pandas as pd
+        return detect_period_from_dataframe(read_logisticien_file(file))
+    except Exception as e:
+        print(f"Erreur détection période: {e}")
+        return None, None
+
+def detect_period_from_dataframe(df):
+    """
+    Détecte la période d'un fichier logisticien déjà parsé
+    (feuille 'Facturation préparation')
+    """
+    try:
         from collections import Counter
         
-        # Lire le fichier
-        df = pd.read_excel(file, sheet_name='Facturation préparation')
-        
         # Chercher colonne date
         date_col = None
         for col in df.columns:
@@ -40,9 +73,8 @@ def detect_period_from_logisticien(file):
         if not date_col:
             return None, None
         
-        # Convertir en datetime
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-        dates_valid = df[date_col].dropna()
+        # Convertir en datetime (sans modifier le DataFrame)
+        dates_valid = pd.to_datetime(df[date_col], errors='coerce').dropna()
         
         if len(dates_valid) == 0:
             return None, None
@@ -65,34 +97,77 @@ def detect_period_from_logisticien(file):
         print(f"Erreur détection période: {e}")
         return None, None
 
-def save_logisticien_file(file, year, month):
-    """Sauvegarde un fichier logisticien avec sa période"""
+def read_logisticien_file(file):
+    """Parse la feuille 'Facturation préparation' d'un fichier uploadé"""
+    file.seek(0)
+    return pd.read_excel(file, sheet_name=LOGISTICIEN_SHEET)
+
+def parse_logisticien_content(file_content):
+    """Parse la feuille 'Facturation préparation' depuis le contenu brut (bytes)"""
+    return pd.read_excel(BytesIO(file_content), sheet_name=LOGISTICIEN_SHEET)
+
+def serialize_parsed_dataframe(df):
+    """
+    Sérialise un DataFrame logisticien en copie colonnaire typée
+    
+    Parquet (pyarrow) en priorité. Les colonnes de types mixtes
+    (ex: trackings numériques + texte) ne passent pas en Parquet :
+    on retombe alors sur pickle, qui conserve les types à l'identique.
+    
+    Returns:
+        tuple: (bytes, format) avec format = 'parquet' ou 'pickle'
+    """
+    try:
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue(), 'parquet'
+    except Exception:
+        return pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), 'pickle'
+
+def deserialize_parsed_dataframe(parsed_bytes, parsed_format):
+    """Reconstruit le DataFrame depuis sa copie colonnaire"""
+    if parsed_format == 'parquet':
+        return pd.read_parquet(BytesIO(parsed_bytes))
+    return pickle.loads(parsed_bytes)
+
+def save_logisticien_file(file, year, month, df=None):
+    """Sauvegarde un fichier logisticien avec sa période
+    
+    La feuille 'Facturation préparation' est parsée une seule fois ici
+    (ou fournie déjà parsée via df) et stockée en copie colonnaire à côté
+    des bytes bruts.
+    """
     try:
         # Lire le contenu
         file.seek(0)
         file_content = file.read()
         file.seek(0)
         
-        # Charger la bibliothèque
-        library = persistence.load_logisticiens_library()
-        if library is None:
-            library = {}
+        # Parser une seule fois à l'upload
+        if df is None:
+            df = parse_logisticien_content(file_content)
+        parsed_bytes, parsed_format = serialize_parsed_dataframe(df)
         
         # Clé de période
         period_key = f"{year}_{month:02d}"
         
-        # Sauvegarder
-        library[period_key] = {
+        # Sauvegarder (seule cette période est écrite)
+        entry = {
             'filename': file.name,
             'content': file_content,
             'size': len(file_content),
+            'parsed': parsed_bytes,
+            'parsed_format': parsed_format,
             'uploaded_at': datetime.now().isoformat(),
             'year': year,
             'month': month
         }
         
         # Persister
-        persistence.save_logisticiens_library(library)
+        persistence.save_logisticiens_entry(period_key, entry)
+        
+        # Mettre à jour l'index des références pour cette période
+        update_tracking_index(period_key, deserialize_parsed_dataframe(parsed_bytes, parsed_format))
         
         return True
         
@@ -101,19 +176,25 @@ def save_logisticien_file(file, year, month):
         return False
 
 def get_all_available_periods():
-    """Retourne toutes les périodes disponibles"""
-    library = persistence.load_logisticiens_library()
-    if not library:
+    """Retourne toutes les périodes disponibles
+    
+    Lit uniquement le manifeste de la bibliothèque : aucun contenu de
+    fichier n'est chargé.
+    """
+    entries = persistence.list_logisticiens_entries()
+    if not entries:
         return []
     
     periods = []
-    for period_key, data in library.items():
+    for period_key, data in entries.items():
         periods.append({
             'key': period_key,
             'year': data['year'],
             'month': data['month'],
             'filename': data['filename'],
-            'uploaded_at': data['uploaded_at']
+            'size': data['size'],
+            'uploaded_at': data['uploaded_at'],
+            'blob': data.get('blob')
         })
     
     # Trier par date décroissante
@@ -129,10 +210,6 @@ def load_logisticien_files_for_analysis(nb_months=3):
     Returns:
         list: Liste de fichiers chargés (BytesIO avec name)
     """
-    library = persistence.load_logisticiens_library()
-    if not library:
-        return []
-    
     # Récupérer toutes les périodes
     periods = get_all_available_periods()
     
@@ -141,34 +218,330 @@ def load_logisticien_files_for_analysis(nb_months=3):
     
     files = []
     for period in selected_periods:
-        period_key = period['key']
-        if period_key in library:
-            from io import BytesIO
-            
+        entry = persistence.load_logisticiens_entry(period['key'])
+        if entry is not None:
             # Créer un fichier BytesIO
-            file_content = library[period_key]['content']
-            file_obj = BytesIO(file_content)
-            file_obj.name = library[period_key]['filename']
+            file_obj = BytesIO(entry['content'])
+            file_obj.name = entry['filename']
             
             files.append(file_obj)
     
     return files
 
+def load_logisticien_dataframes(nb_months=3):
+    """
+    Charge les N derniers mois de données logisticiens, déjà parsées
+    
+    Utilise la copie colonnaire enregistrée à l'upload : aucune lecture
+    Excel. Les entrées anciennes (sans copie parsée) sont parsées une fois
+    puis complétées dans la bibliothèque.
+    
+    Returns:
+        list: Liste de DataFrames (feuille 'Facturation préparation'),
+              du plus récent au plus ancien
+    """
+    return [df for _, df in load_logisticien_period_dataframes(nb_months)]
+
+def load_logisticien_period_dataframes(nb_months=3):
+    """
+    Comme load_logisticien_dataframes, avec la clé de période
+    
+    Les DataFrames désérialisés restent en mémoire (cache par période) :
+    les appels suivants ne relisent ni le stockage ni la copie parsée.
+    
+    Returns:
+        list: Liste de tuples (period_key, DataFrame), du plus récent au plus ancien
+    """
+    # Récupérer toutes les périodes
+    periods = get_all_available_periods()
+    
+    with _dataframe_cache_lock:
+        # Oublier les périodes supprimées
+        for period_key in set(_dataframe_cache) - {p['key'] for p in periods}:
+            del _dataframe_cache[period_key]
+    
+    # Prendre les N plus récentes
+    selected_periods = periods[:nb_months]
+    
+    dataframes = []
+    for period in selected_periods:
+        stamp = (period['blob'], period['uploaded_at'])
+        with _dataframe_cache_lock:
+            cached = _dataframe_cache.get(period['key'])
+        if cached is not None and cached[0] == stamp:
+            dataframes.append((period['key'], persistence.frame_copy(cached[1])))
+            continue
+        
+        entry = persistence.load_logisticiens_entry(period['key'])
+        if entry is None:
+            continue
+        
+        try:
+            if entry.get('parsed') is not None:
+                df = deserialize_parsed_dataframe(entry['parsed'], entry.get('parsed_format', 'pickle'))
+            else:
+                # Entrée ancienne : parser une fois et compléter
+                df = parse_logisticien_content(entry['content'])
+                entry['parsed'], entry['parsed_format'] = serialize_parsed_dataframe(df)
+                persistence.save_logisticiens_entry(period['key'], entry)
+        except Exception as e:
+            print(f"Erreur lecture données {entry.get('filename', period['key'])}: {e}")
+            continue
+        
+        with _dataframe_cache_lock:
+            _dataframe_cache[period['key']] = (stamp, df)
+        dataframes.append((period['key'], persistence.frame_copy(df)))
+    
+    return dataframes
+
 def delete_period_logisticien(year, month):
     """Supprime un fichier logisticien"""
-    library = persistence.load_logisticiens_library()
-    if not library:
-        return False
-    
     period_key = f"{year}_{month:02d}"
     
-    if period_key in library:
-        del library[period_key]
-        persistence.save_logisticiens_library(library)
+    # Existence vérifiée sur le manifeste (sans charger le fichier ni ses données)
+    if period_key in persistence.list_logisticiens_entries():
+        persistence.delete_logisticiens_entry(period_key)
+        update_tracking_index(period_key, None)
         return True
     
     return False
 
+# ============================================================================
+# INDEX DES RÉFÉRENCES (tracking / n° de colis / commande d'origine)
+# ============================================================================
+
+def _clean_reference(value):
+    """Une référence numérique en texte, comme clean_tracking_number (repli : texte brut)"""
+    try:
+        return str(int(value))
+    except (TypeError, ValueError, OverflowError):
+        return str(value).strip()
+
+def normalize_references(values):
+    """
+    Normalise une colonne de références (version vectorisée de
+    clean_tracking_number)
+    
+    - Nombres → entier sans décimales ('123456.0' → '123456')
+    - Texte → espaces de début/fin supprimés
+    - Vide / NaN → ''
+    
+    Returns:
+        Series de str, même index que l'entrée
+    """
+    values = pd.Series(values)
+    # Remplissage par position (l'index peut contenir des doublons)
+    raw = values.to_numpy(dtype=object)
+    result = np.full(len(values), '', dtype=object)
+    
+    valid = values.notna().to_numpy()
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        numeric = valid
+    else:
+        is_number = np.fromiter(
+            (isinstance(v, (int, float, np.number)) for v in raw), dtype=bool, count=len(raw)
+        )
+        numeric = valid & is_number
+    text = valid & ~numeric
+    
+    if numeric.any():
+        numbers = values.to_numpy()[numeric]
+        if numbers.dtype.kind in 'iu':
+            result[numeric] = numbers.astype(str)
+        else:
+            # Chemin vectorisé limité aux flottants finis représentables en
+            # int64 ; le reste (très grands entiers, inf, objets) valeur par valeur
+            fast = np.zeros(len(numbers), dtype=bool)
+            if numbers.dtype.kind == 'f':
+                fast = np.isfinite(numbers) & (np.abs(numbers) < 2.0 ** 63)
+            positions = np.flatnonzero(numeric)
+            if fast.any():
+                result[positions[fast]] = numbers[fast].astype('int64').astype(str)
+            slow = ~fast
+            if slow.any():
+                result[positions[slow]] = [_clean_reference(v) for v in numbers[slow]]
+    if text.any():
+        result[text] = pd.Series(raw[text]).astype(str).str.strip().to_numpy(dtype=object)
+    
+    return pd.Series(result, index=values.index, dtype=object)
+
+def build_period_index(df):
+    """
+    Construit l'index d'une période : une ligne par référence non vide
+    
+    Returns:
+        DataFrame ['key', 'field', 'row'] — 'row' est la position (iloc)
+        de la ligne dans le DataFrame parsé de la période
+    """
+    parts = []
+    for field, column in INDEX_FIELDS.items():
+        if column not in df.columns:
+            continue
+        keys = normalize_references(df[column]).to_numpy()
+        rows = np.arange(len(df), dtype='int32')
+        mask = keys != ''
+        parts.append(pd.DataFrame({
+            'key': keys[mask],
+            'field': field,
+            'row': rows[mask]
+        }))
+    
+    if not parts:
+        return pd.DataFrame({'key': pd.Series(dtype=object), 'field': pd.Series(dtype=object),
+                             'row': pd.Series(dtype='int32')})
+    
+    # Ordre : ligne puis champ (= ordre de parcours du fichier)
+    index = pd.concat(parts, ignore_index=True)
+    field_order = {field: i for i, field in enumerate(INDEX_FIELDS)}
+    index['_order'] = index['field'].map(field_order)
+    index = index.sort_values(['row', '_order'], kind='stable').drop(columns='_order')
+    index['field'] = index['field'].astype('category')
+    return index.reset_index(drop=True)
+
+def update_tracking_index(period_key, df):
+    """
+    Met à jour l'index pour une seule période (df=None → suppression)
+    """
+    try:
+        # Verrou exclusif : mises à jour simultanées de périodes différentes fusionnées
+        with persistence.data_lock(persistence.INDEX_LOCK):
+            index_data = persistence.load_logisticiens_index() or {}
+            if df is None:
+                index_data.pop(period_key, None)
+            else:
+                index_data[period_key] = build_period_index(df)
+            persistence.save_logisticiens_index(index_data)
+        return True
+    except Exception as e:
+        print(f"Erreur mise à jour index références: {e}")
+        return False
+
+def load_tracking_index(nb_months=None, fields=None):
+    """
+    Charge l'index des références sur les N derniers mois
+    
+    Les périodes absentes de l'index (bibliothèque antérieure à l'index)
+    sont indexées à la volée puis persistées.
+    
+    Args:
+        nb_months: Nombre de périodes les plus récentes (None = toutes)
+        fields: Champs à conserver (ex: ['tracking']), None = tous
+    
+    Returns:
+        DataFrame ['key', 'field', 'period', 'row'] ordonné du plus récent
+        au plus ancien, puis par ligne : keep='first' donne la même priorité
+        qu'un drop_duplicates sur la concaténation des fichiers
+    """
+    periods = [p['key'] for p in get_all_available_periods()][:nb_months]
+    if not periods:
+        return pd.DataFrame(columns=['key', 'field', 'period', 'row'])
+    
+    index_data = persistence.load_logisticiens_index() or {}
+    
+    if any(key not in index_data for key in periods):
+        with persistence.data_lock(persistence.INDEX_LOCK):
+            index_data = persistence.load_logisticiens_index() or {}
+            missing = [key for key in periods if key not in index_data]
+            if missing:
+                for period_key, df in load_logisticien_period_dataframes(nb_months=None):
+                    if period_key in missing:
+                        index_data[period_key] = build_period_index(df)
+                persistence.save_logisticiens_index(index_data)
+    
+    parts = []
+    for period_key in periods:
+        period_index = index_data.get(period_key)
+        if period_index is None or len(period_index) == 0:
+            continue
+        if fields is not None:
+            period_index = period_index[period_index['field'].isin(fields)]
+        parts.append(period_index.assign(period=period_key))
+    
+    if not parts:
+        return pd.DataFrame(columns=['key', 'field', 'period', 'row'])
+    
+    return pd.concat(parts, ignore_index=True)[['key', 'field', 'period', 'row']]
+
+def _reference_table(fields, nb_months, keep):
+    """
+    Index des références dédoublonné, indexé par clé (pd.Index unique)
+    
+    Mis en cache tant que les périodes consultées (blob, date d'upload)
+    n'ont pas changé : la table de hachage de l'Index est réutilisée d'une
+    recherche à l'autre.
+    """
+    state = tuple((p['key'], p['blob'], p['uploaded_at']) for p in get_all_available_periods()[:nb_months])
+    cache_key = (tuple(fields), nb_months, keep)
+    
+    with _dataframe_cache_lock:
+        cached = _lookup_cache.get(cache_key)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    
+    index = load_tracking_index(nb_months=nb_months, fields=list(fields))
+    table = index.drop_duplicates(subset=['key'], keep=keep).set_index('key')[['period', 'row']]
+    
+    with _dataframe_cache_lock:
+        _lookup_cache[cache_key] = (state, table)
+    return table
+
+def get_reference_lookup(fields=('tracking',), nb_months=None, keep='first'):
+    """
+    Dictionnaire référence normalisée → (period_key, row) pour des
+    recherches unitaires en O(1)
+    
+    Args:
+        keep: 'first' (période la plus récente prioritaire) ou 'last'
+    """
+    index = load_tracking_index(nb_months=nb_months, fields=list(fields))
+    index = index.drop_duplicates(subset=['key'], keep=keep)
+    return dict(zip(index['key'], zip(index['period'], index['row'])))
+
+def match_references(values, fields=('tracking',), nb_months=None, columns=None, keep='first'):
+    """
+    Jointure vectorisée d'une colonne de références contre l'index
+    
+    Args:
+        values: Series/liste de références (nettoyées via normalize_references)
+        fields: Champs de l'index à utiliser
+        nb_months: Nombre de périodes les plus récentes (None = toutes)
+        columns: Colonnes logisticien à rapatrier pour les lignes trouvées
+        keep: 'first' ou 'last' en cas de référence présente plusieurs fois
+    
+    Returns:
+        DataFrame aligné sur l'index de `values` avec 'period', 'row'
+        (NaN si non trouvé) et les colonnes demandées
+    """
+    values = pd.Series(values)
+    keys = normalize_references(values)
+    
+    table = _reference_table(fields, nb_months, keep)
+    positions = table.index.get_indexer(keys.to_numpy())
+    hit = positions >= 0
+    
+    periods = np.full(len(keys), np.nan, dtype=object)
+    rows = np.full(len(keys), np.nan)
+    periods[hit] = table['period'].to_numpy(dtype=object)[positions[hit]]
+    rows[hit] = table['row'].to_numpy()[positions[hit]]
+    matched = pd.DataFrame({'period': periods, 'row': rows}, index=values.index)
+    
+    if columns:
+        for column in columns:
+            matched[column] = None
+        found = matched['period'].notna()
+        if found.any():
+            wanted = set(matched.loc[found, 'period'])
+            for period_key, df in load_logisticien_period_dataframes(nb_months=nb_months):
+                if period_key not in wanted:
+                    continue
+                in_period = found & (matched['period'] == period_key)
+                rows = matched.loc[in_period, 'row'].astype('int64').to_numpy()
+                for column in columns:
+                    if column in df.columns:
+                        matched.loc[in_period, column] = df[column].to_numpy()[rows]
+    
+    return matched
+
 def run():
     """Interface de gestion des fichiers logisticiens"""
     
@@ -222,13 +595,20 @@ def run():
                 results = []
                 
                 with st.spinner("Analyse et sauvegarde en cours..."):
-                    for file in uploaded_files:
+                    # Lecture des fichiers en parallèle (une seule lecture par fichier)
+                    parsed_files = parse_files(read_logisticien_file, uploaded_files, return_exceptions=True)
+                    
+                    for file, df in zip(uploaded_files, parsed_files):
                         # Détecter période
-                        year, month = detect_period_from_logisticien(file)
+                        if isinstance(df, Exception):
+                            print(f"Erreur détection période: {df}")
+                            year, month = None, None
+                        else:
+                            year, month = detect_period_from_dataframe(df)
                         
                         if year and month:
                             # Sauvegarder
-                            if save_logisticien_file(file, year, month):
+                            if save_logisticien_file(file, year, month, df):
                                 results.append({
                                     'file': file.name,
                                     'period': f"{get_month_name(month)} {year}",
@@ -284,7 +664,8 @@ def run():
                 
                 with col3:
                     upload_date = datetime.fromisoformat(period['uploaded_at'])
-                    st.caption(f"Ajouté le {upload_date.strftime('%d/%m/%Y à %H:%M')}")
+                    size_kb = period['size'] / 1024
+                    st.caption(f"Ajouté le {upload_date.strftime('%d/%m/%Y à %H:%M')} • {size_kb:.0f} KB")
                 
                 with col4:
                     if st.button("🗑️", key=f"del_{period['key']}", help="Supprimer"):
@@ -11,6 +11,8 @@ from io import BytesIO
 from datetime import datetime
 import re
 from shared import persistence
+from shared.matching import cascade_join, build_key_table, lookup_keys
+from modules.logisticiens_library import normalize_references
 
 def export_excel(dataframes_dict):
     """Export multiple DataFrames vers Excel avec plusieurs feuilles"""
@@ -38,17 +40,6 @@ def convert_european_to_float(value):
     except:
         return 0.0
 
-def clean_numero_colis(value):
-    """Nettoie un numéro de colis"""
-    try:
-        if pd.isna(value) or value == '':
-            return ''
-        if isinstance(value, (int, float)):
-            return str(int(value))
-        return str(value).strip()
-    except:
-        return str(value).strip() if value else ''
-
 def read_csv_retours(file):
     """Lit le fichier CSV des retours Mondial Relay"""
     try:
@@ -142,8 +133,12 @@ def traiter_retours_mondial_relay(df_retours, list_df_log):
         df_retours_filtered['Majoration_Service'] = 0.0
     
     # 4. Nettoyer les numéros de colis
-    df_retours_filtered['Ref_Client_Clean'] = df_retours_filtered['Reférence client'].apply(
-        clean_numero_colis
+    df_retours_filtered['Ref_Client_Clean'] = normalize_references(
+        df_retours_filtered['Reférence client']
+    )
+    df_retours_filtered['Tracking_Retour_Clean'] = normalize_references(
+        df_retours_filtered['Tracking'] if 'Tracking' in df_retours_filtered.columns
+        else pd.Series('', index=df_retours_filtered.index)
     )
     
     # 5. Fusion de TOUS les fichiers logisticien
@@ -152,19 +147,13 @@ def traiter_retours_mondial_relay(df_retours, list_df_log):
         if df_log is not None:
             # Nettoyer les numéros de colis
             if 'Numéro de colis' in df_log.columns:
-                df_log['Numero_Colis_Clean'] = df_log['Numéro de colis'].apply(
-                    clean_numero_colis
-                )
+                df_log['Numero_Colis_Clean'] = normalize_references(df_log['Numéro de colis'])
             # Nettoyer aussi le numéro de tracking
             if 'Numéro de tracking' in df_log.columns:
-                df_log['Tracking_Clean'] = df_log['Numéro de tracking'].apply(
-                    clean_numero_colis
-                )
+                df_log['Tracking_Clean'] = normalize_references(df_log['Numéro de tracking'])
             # Nettoyer le numéro de commande d'origine
             if "Numéro de commande d'origine" in df_log.columns:
-                df_log['Commande_Clean'] = df_log["Numéro de commande d'origine"].apply(
-                    clean_numero_colis
-                )
+                df_log['Commande_Clean'] = normalize_references(df_log["Numéro de commande d'origine"])
             dfs_log.append(df_log)
             st.info(f"✅ Fichier logisticien {idx} chargé : {len(df_log)} lignes")
     
@@ -175,85 +164,77 @@ def traiter_retours_mondial_relay(df_retours, list_df_log):
     df_logisticien = pd.concat(dfs_log, ignore_index=True)
     st.success(f"📊 Total : {len(df_logisticien)} lignes logisticien chargées depuis {len(dfs_log)} fichier(s)")
     
-    # 6. Créer des mappings multiples pour améliorer les correspondances
-    mapping_partner = {}
-    mapping_commande = {}
-    mapping_tracking_aller = {}
-    
-    for _, row in df_logisticien.iterrows():
-        partner = row.get('Nom du partenaire', 'Non attribué')
-        commande = str(row.get('Numéro de commande d\'origine', ''))
-        tracking = str(row.get('Numéro de tracking', ''))
-        
-        # Mapping par numéro de colis
-        numero_colis = row.get('Numero_Colis_Clean', '')
-        if numero_colis:
-            mapping_partner[numero_colis] = partner
-            mapping_commande[numero_colis] = commande
-            mapping_tracking_aller[numero_colis] = tracking
-        
-        # Mapping par tracking (tentative alternative)
-        tracking_clean = row.get('Tracking_Clean', '')
-        if tracking_clean:
-            mapping_partner[tracking_clean] = partner
-            mapping_commande[tracking_clean] = commande
-            mapping_tracking_aller[tracking_clean] = tracking
-        
-        # Mapping par commande (tentative alternative)
-        commande_clean = row.get('Commande_Clean', '')
-        if commande_clean:
-            mapping_partner[commande_clean] = partner
-            mapping_commande[commande_clean] = commande
-            mapping_tracking_aller[commande_clean] = tracking
-    
-    # 7. Enrichir les retours avec recherche multiple
-    resultats = []
-    non_identifies = 0
-    
-    for _, row in df_retours_filtered.iterrows():
-        ref_client = row['Ref_Client_Clean']
-        
-        # Tentative 1: Par référence client
-        partner = mapping_partner.get(ref_client)
-        commande = mapping_commande.get(ref_client, '')
-        tracking_aller = mapping_tracking_aller.get(ref_client, '')
-        
-        # Si pas trouvé, essayer avec le tracking retour
-        if not partner or partner == 'Non attribué':
-            tracking_retour = clean_numero_colis(row.get('Tracking', ''))
-            if tracking_retour:
-                partner = mapping_partner.get(tracking_retour, partner)
-                if partner and partner != 'Non attribué':
-                    commande = mapping_commande.get(tracking_retour, commande)
-                    tracking_aller = mapping_tracking_aller.get(tracking_retour, tracking_aller)
-        
-        # Par défaut si toujours pas trouvé
-        if not partner:
-            partner = 'Non attribué'
-            non_identifies += 1
-        
-        # Montants
-        montant_base = row['Montant_Base']
-        majoration_service = row['Majoration_Service']
-        
-        # Montant total = Prix + Majoration de service
-        montant_total = montant_base + majoration_service
-        
-        resultats.append({
-            'Partenaire': partner,
-            'Tracking Retour': row.get('Tracking', ''),
-            'Tracking Aller': tracking_aller,
-            'N° Colis': ref_client,
-            'N° Commande Origine': commande,
-            'Date PCH': row.get('Date PCH', ''),
-            'Poids Facturé': row.get('Poids facturé', 0),
-            'Montant Base (€)': round(montant_base, 2),
-            'Majoration Service (€)': round(majoration_service, 2),
-            'Montant Total (€)': round(montant_total, 2),
-            'Statut': '✓ Identifié' if partner != 'Non attribué' else '⚠ Non identifié'
-        })
-    
-    df_detail = pd.DataFrame(resultats)
+    # 6. Valeurs rapatriées pour chaque ligne logisticien
+    def log_column(name, default):
+        if name in df_logisticien.columns:
+            return df_logisticien[name].tolist()
+        return [default] * len(df_logisticien)
+    
+    df_logisticien['_partner'] = pd.Series(log_column('Nom du partenaire', 'Non attribué'), dtype=object)
+    df_logisticien['_commande'] = pd.Series(log_column('Numéro de commande d\'origine', ''), dtype=object).map(str)
+    df_logisticien['_tracking'] = pd.Series(log_column('Numéro de tracking', ''), dtype=object).map(str)
+    
+    # 7. Correspondance en cascade : référence client puis tracking retour.
+    # Numéro de colis, tracking et commande partagent un même espace de clés
+    # (dernière ligne / dernière colonne prioritaire en cas de doublon).
+    # Un partenaire vide ou 'Non attribué' laisse la ligne à l'étape suivante.
+    log_keys = ['Numero_Colis_Clean', 'Tracking_Clean', 'Commande_Clean']
+    value_columns = ['_partner', '_commande', '_tracking']
+    
+    def partner_found(matched):
+        return matched['_partner'].map(lambda p: bool(p) and p != 'Non attribué')
+    
+    correspondances = cascade_join(
+        df_retours_filtered, df_logisticien,
+        stages=[
+            ('Référence client', 'Ref_Client_Clean', log_keys),
+            ('Tracking retour', 'Tracking_Retour_Clean', log_keys)
+        ],
+        columns=value_columns,
+        accept=partner_found
+    )
+    identified = correspondances['stage'].notna()
+    
+    # Non trouvés : commande / tracking aller de la référence client si elle
+    # existe (même refusée), partenaire brut de la dernière étape trouvée
+    table = build_key_table(df_logisticien, log_keys, value_columns)
+    by_ref = lookup_keys(df_retours_filtered['Ref_Client_Clean'], table, value_columns)
+    by_tracking = lookup_keys(df_retours_filtered['Tracking_Retour_Clean'], table, value_columns)
+    raw_partner = np.where(by_ref['found'], by_ref['_partner'].to_numpy(dtype=object), None)
+    raw_partner = np.where(by_tracking['found'], by_tracking['_partner'].to_numpy(dtype=object), raw_partner)
+    non_identifies = int(sum(not p for p in raw_partner[~identified.to_numpy()]))
+    
+    partner = correspondances['_partner'].where(identified, 'Non attribué')
+    commande = correspondances['_commande'].where(identified, by_ref['_commande'].where(by_ref['found'], ''))
+    tracking_aller = correspondances['_tracking'].where(identified, by_ref['_tracking'].where(by_ref['found'], ''))
+    
+    # Montants
+    montant_base = df_retours_filtered['Montant_Base']
+    majoration_service = df_retours_filtered['Majoration_Service']
+    
+    # Montant total = Prix + Majoration de service
+    montant_total = montant_base + majoration_service
+    
+    def retour_column(name, default):
+        if name in df_retours_filtered.columns:
+            return df_retours_filtered[name].tolist()
+        return [default] * len(df_retours_filtered)
+    
+    # round() Python (arrondi décimal exact, comme ligne à ligne)
+    df_detail = pd.DataFrame({
+        'Partenaire': partner.tolist(),
+        'Tracking Retour': retour_column('Tracking', ''),
+        'Tracking Aller': tracking_aller.tolist(),
+        'N° Colis': df_retours_filtered['Ref_Client_Clean'].tolist(),
+        'N° Commande Origine': commande.tolist(),
+        'Date PCH': retour_column('Date PCH', ''),
+        'Poids Facturé': retour_column('Poids facturé', 0),
+        'Montant Base (€)': [round(v, 2) for v in montant_base.tolist()],
+        'Majoration Service (€)': [round(v, 2) for v in majoration_service.tolist()],
+        'Montant Total (€)': [round(v, 2) for v in montant_total.tolist()],
+        'Statut': np.where(partner != 'Non attribué', '✓ Identifié', '⚠ Non identifié').tolist(),
+        'Méthode Correspondance': correspondances['stage'].fillna('Aucune').tolist()
+    })
     
     # Afficher les statistiques de correspondance
     total_lignes = len(df_detail)
@@ -392,7 +373,8 @@ def run():
         # Chargement automatique depuis la bibliothèque logisticiens
         from modules.logisticiens_library import load_logisticien_files_for_analysis, get_all_available_periods
         
-        log_files = load_logisticien_files_for_analysis(nb_months=3)
+        # Liste des périodes (manifeste seul, contenus chargés au lancement)
+        log_periods = get_all_available_periods()[:3]
         
         # Upload des fichiers
         col1, col2 = st.columns(2)
@@ -409,10 +391,9 @@ def run():
         with col2:
             st.markdown("#### Fichiers Logisticiens")
             
-            if len(log_files) > 0:
-                st.success(f"✅ {len(log_files)} fichier(s) chargé(s) :")
-                periods = get_all_available_periods()[:len(log_files)]
-                for period in periods:
+            if len(log_periods) > 0:
+                st.success(f"✅ {len(log_periods)} fichier(s) chargé(s) :")
+                for period in log_periods:
                     st.caption(f"• {period['filename']}")
                 st.info("📋 Depuis Bibliothèque Logisticiens")
             else:
@@ -423,7 +404,7 @@ def run():
         st.markdown("---")
         
         has_retours = csv_retours is not None
-        has_log = len(log_files) > 0
+        has_log = len(log_periods) > 0
         
         if not has_retours:
             st.info("📤 Uploadez un fichier CSV Retours Mondial Relay pour commencer")
@@ -462,16 +443,10 @@ def run():
                             st.error("❌ Erreur lecture CSV retours")
                             st.stop()
                         
-                        # Lecture de TOUS les fichiers logisticien
-                        list_df_log = []
-                        for idx, log_file in enumerate(log_files, 1):
-                            if log_file is not None:
-                                log_file.seek(0)  # Reset position
-                                df_log = read_excel_logisticien(log_file)
-                                if df_log is not None:
-                                    list_df_log.append(df_log)
-                                else:
-                                    st.warning(f"⚠️ Erreur lecture fichier logisticien {idx}")
+                        # Lecture de TOUS les fichiers logisticien (déjà parsés)
+                        from modules.logisticiens_library import load_logisticien_dataframes
+                        
+                        list_df_log = load_logisticien_dataframes(nb_months=3)
                         
                         if not list_df_log:
                             st.error("❌ Aucun fichier logisticien valide")
@@ -497,6 +472,7 @@ def run():
                         
                         # 💾 SAUVEGARDE FICHIERS
                         files_to_save = {'csv_retours': csv_retours}
+                        log_files = load_logisticien_files_for_analysis(nb_months=3)
                         for idx, log_file in enumerate(log_files):
                             if log_file is not None:
                                 files_to_save[f'log_{idx}'] = log_file
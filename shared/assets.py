@@ -0,0 +1,82 @@
+"""
+Ressources statiques de l'interface
+Logos lus et encodés en base64 une seule fois par processus : app.py est
+réexécuté à chaque interaction, un cache défini dans le script serait
+perdu à chaque rerun
+"""
+
+import base64
+from functools import lru_cache
+from pathlib import Path
+
+# Racine de l'application (logo_greenlog.jpg, dossier logos/)
+APP_DIR = Path(__file__).resolve().parent.parent
+
+LOGO_FILE = "logo_greenlog.jpg"
+
+# Logos des transporteurs (dossier logos/)
+CARRIER_LOGOS = {
+    'dpd': 'dpd.svg',
+    'mondial_relay': 'mondial_relay.svg',
+    'colissimo': 'colissimo.webp',
+    'chronopost': 'chronopost.png',
+    'colis_prive': 'colis_prive.png',
+    'dhl': 'dhl.png'
+}
+
+# Clé du bouton de chaque transporteur sur la page d'accueil
+CARRIER_BUTTON_KEYS = {
+    'dpd': 'btn_dpd',
+    'colis_prive': 'btn_cp',
+    'mondial_relay': 'btn_mr',
+    'colissimo': 'btn_col',
+    'chronopost': 'btn_chrono',
+    'dhl': 'btn_dhl'
+}
+
+MIME_TYPES = {
+    '.svg': 'image/svg+xml',
+    '.webp': 'image/webp',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg'
+}
+
+@lru_cache(maxsize=None)
+def data_uri(relative_path):
+    """
+    URI data: base64 d'un fichier de l'application (mémorisée)
+    
+    Returns:
+        str 'data:<mime>;base64,...' ou None si le fichier est absent
+    """
+    path = APP_DIR / relative_path
+    try:
+        content = path.read_bytes()
+    except OSError:
+        return None
+    mime_type = MIME_TYPES.get(path.suffix.lower(), 'image/png')
+    return f"data:{mime_type};base64,{base64.b64encode(content).decode()}"
+
+def logo_data_uri():
+    """Logo GREENLOG du bandeau (None si absent)"""
+    return data_uri(LOGO_FILE)
+
+def carrier_logo_data_uri(carrier_name):
+    """Logo d'un transporteur (None si inconnu ou absent)"""
+    logo_file = CARRIER_LOGOS.get(carrier_name)
+    if not logo_file:
+        return None
+    return data_uri(f"logos/{logo_file}")
+
+@lru_cache(maxsize=None)
+def carrier_buttons_css():
+    """
+    Bloc <style> unique des boutons-logos de la page d'accueil
+    (un fond par bouton dont le logo existe)
+    """
+    rules = [
+        f'button[key="{CARRIER_BUTTON_KEYS[carrier]}"] {{ background-image: url("{uri}") !important; }}'
+        for carrier in CARRIER_LOGOS
+        if (uri := carrier_logo_data_uri(carrier))
+    ]
+    return "<style>\n" + "\n".join(rules) + "\n</style>"
@@ -1,14 +1,682 @@
 """
 Système de Sauvegarde Automatique
 Crée des sauvegardes automatiques après chaque action importante
+(incrémentales : seuls les fichiers modifiés depuis la précédente)
 """
 
 import streamlit as st
+import os
+import json
+import time
+import hashlib
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-import zipfile
-from io import BytesIO
-import json
+from shared import persistence
+
+# ============================================================================
+# SAUVEGARDES INCRÉMENTALES
+# ============================================================================
+# Une chaîne de sauvegardes = une sauvegarde complète (base) suivie de
+# sauvegardes incrémentales qui ne contiennent que les fichiers modifiés
+# depuis la sauvegarde précédente. Chaque ZIP embarque dans metadata.json
+# l'inventaire complet {chemin: sha256, taille} de l'état sauvegardé et la
+# référence de la sauvegarde parente ; la restauration rejoue la base puis
+# les incrémentales. Le catalogue (catalog.json) garde la liste des
+# sauvegardes et l'empreinte de chaque fichier : un fichier dont la taille
+# et la date de modification n'ont pas changé n'est pas relu.
+
+# Dossier des sauvegardes (hors .greenlog_data : jamais sauvegardé lui-même)
+BACKUP_DIR = Path(".greenlog_backups")
+CATALOG_NAME = "catalog.json"
+BACKUP_LOCK = "backups"
+BACKUP_VERSION = 'pilot by GREENLOG v1.0'
+
+# Nouvelle sauvegarde complète après ce nombre d'incrémentales
+MAX_DELTAS = 20
+
+# Nombre de chaînes (complète + incrémentales) conservées sur disque
+KEEP_CHAINS = 2
+
+def _empty_catalog():
+    return {'snapshots': [], 'files': {}}
+
+def load_catalog():
+    """Catalogue des sauvegardes (vide si absent ou illisible : la prochaine sera complète)"""
+    try:
+        with open(BACKUP_DIR / CATALOG_NAME, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        if isinstance(catalog.get('snapshots'), list) and isinstance(catalog.get('files'), dict):
+            return catalog
+    except (OSError, ValueError):
+        pass
+    return _empty_catalog()
+
+def _save_catalog(catalog):
+    payload = json.dumps(catalog, indent=2, ensure_ascii=False).encode('utf-8')
+    persistence.atomic_write_bytes(BACKUP_DIR / CATALOG_NAME, payload)
+
+def _file_sha256(filepath):
+    with open(filepath, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+def scan_data_files(known=None):
+    """
+    Empreinte de chaque fichier persisté
+    
+    Args:
+        known: inventaire précédent ; le hash est repris tel quel si la
+            taille et la date de modification n'ont pas changé
+    
+    Returns:
+        dict: {chemin relatif: {'sha256', 'size', 'mtime_ns'}}
+    """
+    known = known or {}
+    files = {}
+    for filepath in persistence.list_data_files():
+        relative_path = filepath.relative_to(persistence.SAVE_DIR).as_posix()
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            continue
+        previous = known.get(relative_path)
+        if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+            sha256 = previous['sha256']
+        else:
+            try:
+                sha256 = _file_sha256(filepath)
+            except FileNotFoundError:
+                continue
+        files[relative_path] = {'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return files
+
+def _snapshot_readme(metadata):
+    """README joint à chaque sauvegarde"""
+    if metadata['snapshot_kind'] == 'full':
+        contenu = "Sauvegarde COMPLÈTE : se restaure seule."
+    else:
+        contenu = (
+            "Sauvegarde INCRÉMENTALE : ne contient que les fichiers modifiés.\n"
+            f"À restaurer avec la sauvegarde complète {metadata['base_id']}\n"
+            "et toutes les sauvegardes incrémentales qui la suivent."
+        )
+    return f"""
+SAUVEGARDE PILOT BY GREENLOG
+=============================
+
+Date de création: {datetime.now().strftime('%d/%m/%Y à %H:%M:%S')}
+Identifiant: {metadata['snapshot_id']}
+{contenu}
+
+Fichiers dans l'état sauvegardé: {metadata['files_count']}
+Fichiers inclus dans ce ZIP: {len(metadata['added'])}
+
+RESTAURATION:
+-------------
+1. Ouvrir pilot by GREENLOG
+2. Aller dans "Sauvegarde & Restauration"
+3. Onglet "Restaurer"
+4. Upload de ce fichier ZIP (avec sa sauvegarde complète et les incrémentales précédentes)
+5. Cliquer "Restaurer les données"
+6. Recharger la page (F5)
+"""
+
+# ============================================================================
+# COMPRESSION DES MEMBRES
+# ============================================================================
+# Les contenus déjà compressés (xlsx et autres ZIP, images, entrées zstd des
+# stockages) sont stockés tels quels : les recompresser coûte du temps CPU
+# pour quelques octets. La décision se prend sur un échantillon (début,
+# milieu, fin du fichier) compressé au niveau le plus rapide. Les autres
+# fichiers sont compressés en parallèle par un pool de threads (zlib libère
+# le GIL) dans des fichiers temporaires, recopiés ensuite dans le ZIP dans
+# l'ordre.
+
+# Threads de compression (1 = compression en flux dans le thread appelant)
+COMPRESS_WORKERS = min(8, os.cpu_count() or 1)
+COMPRESS_LEVEL = 6
+
+# Échantillonnage : taille d'un extrait et ratio au-delà duquel on stocke
+SAMPLE_SIZE = 64 * 1024
+STORE_RATIO = 0.9
+
+# Signatures de formats déjà compressés (ZIP/xlsx, gzip, zstd, JPEG, PNG, bzip2, xz)
+COMPRESSED_MAGICS = (
+    b'PK\x03\x04', b'\x1f\x8b', b'\x28\xb5\x2f\xfd', b'\xff\xd8\xff',
+    b'\x89PNG', b'BZh', b'\xfd7zXZ'
+)
+
+# Taille gardée en mémoire par membre compressé avant passage sur disque
+SPOOL_SIZE = 8 * 1024 * 1024
+
+def _is_compressible(filepath):
+    """Vrai si la compression d'un échantillon du fichier fait gagner au moins 10 %"""
+    with open(filepath, 'rb') as f:
+        sample = f.read(SAMPLE_SIZE)
+        if sample.startswith(COMPRESSED_MAGICS):
+            return False
+        size = os.fstat(f.fileno()).st_size
+        if size > 3 * SAMPLE_SIZE:
+            for position in (size // 2, size - SAMPLE_SIZE):
+                f.seek(position)
+                sample += f.read(SAMPLE_SIZE)
+    if len(sample) < 1024:
+        return True
+    return len(zlib.compress(sample, 1)) < len(sample) * STORE_RATIO
+
+def _deflate_member(filepath):
+    """
+    Compresse un fichier (deflate brut, tel qu'écrit dans un ZIP) dans un
+    fichier temporaire ; exécuté dans le pool de compression
+    
+    Returns:
+        tuple: (fichier temporaire rembobiné, crc32, taille, sha256)
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE, dir=BACKUP_DIR)
+    try:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        digest = hashlib.sha256()
+        crc = 0
+        size = 0
+        with open(filepath, 'rb') as source:
+            while chunk := source.read(persistence.COPY_CHUNK_SIZE):
+                digest.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                spool.write(compressor.compress(chunk))
+        spool.write(compressor.flush())
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, crc, size, digest.hexdigest()
+
+def _write_deflated_member(zip_file, zip_info, spool, crc, size):
+    """
+    Ajoute au ZIP un membre déjà compressé : en-tête local (CRC et tailles
+    connus d'avance), données, puis inscription au répertoire central, comme
+    le fait zipfile à la fermeture d'un membre écrit avec open('w')
+    """
+    spool.seek(0, os.SEEK_END)
+    zip_info.compress_type = zipfile.ZIP_DEFLATED
+    zip_info.compress_size = spool.tell()
+    zip_info.file_size = size
+    zip_info.CRC = crc
+    spool.seek(0)
+    
+    zip_info.header_offset = zip_file.fp.tell()
+    zip_file.fp.write(zip_info.FileHeader())
+    shutil.copyfileobj(spool, zip_file.fp, persistence.COPY_CHUNK_SIZE)
+    zip_file.start_dir = zip_file.fp.tell()
+    zip_file.filelist.append(zip_info)
+    zip_file.NameToInfo[zip_info.filename] = zip_info
+
+def _write_member(zip_file, zip_info, source_path):
+    """Copie un fichier par blocs dans le ZIP (compression selon zip_info) → (sha256, taille)"""
+    with open(source_path, 'rb') as source:
+        with zip_file.open(zip_info, 'w') as target:
+            writer = persistence.HashingWriter(target)
+            shutil.copyfileobj(source, writer, persistence.COPY_CHUNK_SIZE)
+    return writer.hexdigest(), writer.size
+
+def _write_snapshot_zip(filepath, changed, build_metadata):
+    """
+    Écrit le ZIP d'une sauvegarde en flux, de façon atomique (fichier
+    temporaire puis renommage) : chaque fichier est copié par blocs dans
+    l'archive et haché au passage, sans être chargé en mémoire. Les
+    contenus déjà compressés sont stockés, les autres compressés par le
+    pool (voir COMPRESSION DES MEMBRES).
+    
+    Args:
+        filepath: chemin du ZIP
+        changed: chemins relatifs (dans .greenlog_data) à inclure
+        build_metadata: fonction (added, errors) → metadata, appelée une fois
+            les fichiers copiés ; added = {chemin: (sha256, taille)}
+    
+    Returns:
+        tuple: (dict: metadata écrite dans le ZIP, dict: {chemin: message d'erreur})
+    """
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zip_file, \
+                 ThreadPoolExecutor(max_workers=COMPRESS_WORKERS) as pool:
+                added = {}
+                errors = {}
+                # Membres en cours de compression (fenêtre bornée : au plus
+                # 2 par thread attendent d'être recopiés dans le ZIP)
+                pending = deque()
+                
+                def write_pending(limit):
+                    while len(pending) > limit:
+                        relative_path, zip_info, future = pending.popleft()
+                        try:
+                            spool, crc, size, sha256 = future.result()
+                        except FileNotFoundError:
+                            continue
+                        except Exception as e:
+                            errors[relative_path] = f"Erreur sauvegarde {relative_path}: {str(e)}"
+                            continue
+                        with spool:
+                            _write_deflated_member(zip_file, zip_info, spool, crc, size)
+                        added[relative_path] = (sha256, size)
+                
+                for relative_path in changed:
+                    source_path = persistence.SAVE_DIR / relative_path
+                    try:
+                        zip_info = zipfile.ZipInfo.from_file(source_path, f"data/{relative_path}")
+                        compressible = _is_compressible(source_path)
+                    except FileNotFoundError:
+                        continue
+                    except Exception as e:
+                        errors[relative_path] = f"Erreur sauvegarde {relative_path}: {str(e)}"
+                        continue
+                    
+                    if compressible and COMPRESS_WORKERS > 1:
+                        pending.append((relative_path, zip_info, pool.submit(_deflate_member, source_path)))
+                        write_pending(2 * COMPRESS_WORKERS)
+                        continue
+                    
+                    # Contenu déjà compressé (stocké) ou compression sans pool : en flux
+                    zip_info.compress_type = zipfile.ZIP_DEFLATED if compressible else zipfile.ZIP_STORED
+                    try:
+                        added[relative_path] = _write_member(zip_file, zip_info, source_path)
+                    except FileNotFoundError:
+                        continue
+                    except Exception as e:
+                        errors[relative_path] = f"Erreur sauvegarde {relative_path}: {str(e)}"
+                write_pending(0)
+                
+                for relative_path, message in errors.items():
+                    zip_file.writestr(f"errors/{relative_path}.txt", message)
+                metadata = build_metadata(added, errors)
+                zip_file.writestr('metadata.json', json.dumps(metadata, indent=2, ensure_ascii=False))
+                zip_file.writestr('README.txt', _snapshot_readme(metadata))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return metadata, errors
+
+def _chain_start(snapshots):
+    """Position de la dernière sauvegarde complète (None si aucune)"""
+    for position in range(len(snapshots) - 1, -1, -1):
+        if snapshots[position]['kind'] == 'full':
+            return position
+    return None
+
+def _prune_chains(catalog):
+    """Supprime les sauvegardes des chaînes au-delà des KEEP_CHAINS plus récentes"""
+    snapshots = catalog['snapshots']
+    full_positions = [i for i, snapshot in enumerate(snapshots) if snapshot['kind'] == 'full']
+    if len(full_positions) <= KEEP_CHAINS:
+        return
+    first_kept = full_positions[-KEEP_CHAINS]
+    for snapshot in snapshots[:first_kept]:
+        try:
+            (BACKUP_DIR / snapshot['filename']).unlink()
+        except FileNotFoundError:
+            pass
+    catalog['snapshots'] = snapshots[first_kept:]
+
+def create_snapshot(backup_type='automatic', full=False):
+    """
+    Crée une sauvegarde sur disque : complète, ou incrémentale depuis la précédente
+    
+    Une sauvegarde complète est forcée s'il n'existe pas encore de chaîne, si
+    un fichier de la chaîne a disparu ou après MAX_DELTAS incrémentales.
+    
+    Args:
+        backup_type: 'automatic' ou 'manual' (informatif)
+        full: forcer une sauvegarde complète
+    
+    Returns:
+        dict: entrée du catalogue ('id', 'kind', 'parent', 'base', 'filename',
+        'files_count', 'added_count', 'removed_count', 'size') complétée de
+        'files' (inventaire sauvegardé) et 'errors' (fichiers illisibles),
+        None si rien n'a changé depuis la sauvegarde précédente
+    """
+    with persistence.data_lock(BACKUP_LOCK):
+        catalog = load_catalog()
+        snapshots = catalog['snapshots']
+        previous_files = catalog['files']
+        files = scan_data_files(previous_files)
+        
+        start = _chain_start(snapshots)
+        chain_complete = start is not None and all(
+            (BACKUP_DIR / snapshot['filename']).exists() for snapshot in snapshots[start:]
+        )
+        if full or not chain_complete or len(snapshots) - start - 1 >= MAX_DELTAS:
+            kind = 'full'
+            changed = sorted(files)
+            removed = []
+        else:
+            kind = 'delta'
+            changed = sorted(
+                path for path, info in files.items()
+                if previous_files.get(path, {}).get('sha256') != info['sha256']
+            )
+            removed = sorted(set(previous_files) - set(files))
+            if not changed and not removed:
+                return None
+        
+        now = datetime.now()
+        snapshot_id = now.strftime('%Y%m%d_%H%M%S_%f')
+        parent = snapshots[-1]['id'] if kind == 'delta' else None
+        base = snapshots[start]['id'] if kind == 'delta' else snapshot_id
+        
+        def build_metadata(added, errors):
+            # Inventaire final : hash et taille du contenu réellement copié,
+            # fichiers disparus ou illisibles retirés
+            for relative_path in changed:
+                if relative_path in added:
+                    files[relative_path]['sha256'], files[relative_path]['size'] = added[relative_path]
+                else:
+                    del files[relative_path]
+            return {
+                'export_date': now.isoformat(),
+                'version': BACKUP_VERSION,
+                'backup_type': backup_type,
+                'snapshot_id': snapshot_id,
+                'snapshot_kind': kind,
+                'parent_id': parent,
+                'base_id': base,
+                'files_count': len(files),
+                'total_size_bytes': sum(info['size'] for info in files.values()),
+                'data_directory': str(persistence.SAVE_DIR),
+                'files': {path: {'sha256': info['sha256'], 'size': info['size']} for path, info in files.items()},
+                'added': sorted(added),
+                'removed': removed,
+            }
+        
+        filename = f"pilot_{'FULL' if kind == 'full' else 'INCR'}_backup_{snapshot_id}.zip"
+        metadata, errors = _write_snapshot_zip(BACKUP_DIR / filename, changed, build_metadata)
+        
+        entry = {
+            'id': snapshot_id,
+            'kind': kind,
+            'parent': parent,
+            'base': base,
+            'date': now.isoformat(),
+            'backup_type': backup_type,
+            'filename': filename,
+            'files_count': len(files),
+            'added_count': len(metadata['added']),
+            'removed_count': len(removed),
+            'size': (BACKUP_DIR / filename).stat().st_size,
+        }
+        snapshots.append(entry)
+        catalog['files'] = files
+        _prune_chains(catalog)
+        _save_catalog(catalog)
+        
+        return dict(entry, errors=errors, files=metadata['files'])
+
+def snapshot_path(entry):
+    """Chemin du ZIP d'une sauvegarde du catalogue"""
+    return BACKUP_DIR / entry['filename']
+
+def snapshot_chain(snapshot_id=None):
+    """
+    Sauvegardes à rejouer pour restaurer un état (base complète d'abord)
+    
+    Args:
+        snapshot_id: sauvegarde visée (None = la plus récente)
+    
+    Returns:
+        list[dict]: entrées du catalogue, de la base à la sauvegarde visée
+    """
+    snapshots = load_catalog()['snapshots']
+    by_id = {snapshot['id']: snapshot for snapshot in snapshots}
+    if not snapshots:
+        return []
+    current = by_id.get(snapshot_id) if snapshot_id else snapshots[-1]
+    chain = []
+    while current is not None:
+        chain.append(current)
+        if current['kind'] == 'full':
+            return chain[::-1]
+        current = by_id.get(current['parent'])
+    return []
+
+# ============================================================================
+# RESTAURATION (BASE + INCRÉMENTALES)
+# ============================================================================
+
+def read_snapshot_metadata(zip_file):
+    """metadata.json d'un ZIP de sauvegarde ({} si absent ou illisible)"""
+    try:
+        return json.loads(zip_file.read('metadata.json'))
+    except Exception:
+        return {}
+
+def _restore_target(data_dir, relative_path):
+    """Chemin de restauration (sans remontée hors du dossier), None si invalide"""
+    relative_parts = [p for p in Path(relative_path).parts if p not in ('..', '', '/')]
+    if not relative_parts:
+        return None
+    return data_dir.joinpath(*relative_parts)
+
+def verify_snapshot(zip_file):
+    """
+    Vérifie l'intégrité d'un ZIP de sauvegarde sans charger ses fichiers
+    en mémoire : CRC de chaque membre, puis SHA-256 des fichiers de données
+    comparé à l'inventaire de metadata.json (lecture par blocs)
+    
+    Args:
+        zip_file: zipfile.ZipFile ouvert
+    
+    Returns:
+        list[str]: problèmes détectés (vide si l'archive est intacte)
+    """
+    problems = []
+    try:
+        bad_member = zip_file.testzip()
+    except Exception as e:
+        return [f"Archive illisible : {str(e)}"]
+    if bad_member is not None:
+        problems.append(f"CRC invalide : {bad_member}")
+    
+    metadata = read_snapshot_metadata(zip_file)
+    if not metadata.get('snapshot_id'):
+        # Ancien format : pas d'inventaire, seul le CRC est vérifiable
+        return problems
+    
+    expected = metadata.get('files', {})
+    for member in zip_file.namelist():
+        if not member.startswith('data/') or member.endswith('/'):
+            continue
+        relative_path = member[len('data/'):]
+        info = expected.get(relative_path)
+        if info is None:
+            problems.append(f"Fichier hors inventaire : {relative_path}")
+            continue
+        try:
+            with zip_file.open(member) as content:
+                digest = hashlib.file_digest(content, 'sha256').hexdigest()
+        except Exception as e:
+            problems.append(f"Lecture impossible : {relative_path} ({str(e)})")
+            continue
+        if digest != info['sha256']:
+            problems.append(f"Contenu corrompu : {relative_path}")
+    
+    if metadata.get('snapshot_kind') == 'full':
+        missing = set(expected) - {m[len('data/'):] for m in zip_file.namelist() if m.startswith('data/')}
+        problems.extend(f"Fichier manquant : {path}" for path in sorted(missing))
+    return problems
+
+def replay_snapshots(zip_files, data_dir=None):
+    """
+    Restaure l'état d'une chaîne de sauvegardes
+    
+    La sauvegarde visée est la plus récente des ZIP fournis ; la chaîne est
+    reconstituée en remontant les parents jusqu'à la sauvegarde complète.
+    Chaque fichier de l'état visé est pris dans le ZIP le plus récent qui le
+    contient, copié en flux et son SHA-256 vérifié avant de remplacer le
+    fichier existant.
+    
+    Args:
+        zip_files: zipfile.ZipFile ouverts (ordre quelconque)
+        data_dir: dossier de restauration (défaut .greenlog_data)
+    
+    Returns:
+        tuple: (int: fichiers restaurés, dict: metadata de la sauvegarde visée)
+    
+    Raises:
+        ValueError: sauvegarde manquante dans la chaîne ou contenu corrompu
+    """
+    data_dir = Path(data_dir or persistence.SAVE_DIR)
+    
+    by_id = {}
+    for zip_file in zip_files:
+        metadata = read_snapshot_metadata(zip_file)
+        if metadata.get('snapshot_id'):
+            by_id[metadata['snapshot_id']] = (zip_file, metadata)
+    if not by_id:
+        raise ValueError("Aucune sauvegarde reconnue dans les fichiers fournis")
+    
+    # Chaîne : de la plus récente jusqu'à la base complète
+    chain = []
+    current = by_id[max(by_id)]
+    while True:
+        chain.append(current)
+        metadata = current[1]
+        if metadata['snapshot_kind'] == 'full':
+            break
+        parent = metadata.get('parent_id')
+        if parent not in by_id:
+            raise ValueError(f"Sauvegarde manquante dans la chaîne : {parent} (base {metadata.get('base_id')})")
+        current = by_id[parent]
+    
+    target = chain[0][1]
+    data_dir.mkdir(parents=True, exist_ok=True)
+    
+    files_restored = 0
+    for relative_path, info in target['files'].items():
+        member = f"data/{relative_path}"
+        source = next((zip_file for zip_file, _ in chain if member in zip_file.NameToInfo), None)
+        if source is None:
+            raise ValueError(f"Fichier absent de la chaîne de sauvegardes : {relative_path}")
+        
+        target_path = _restore_target(data_dir, relative_path)
+        if target_path is None:
+            continue
+        # Copie par blocs, hash vérifié avant de remplacer le fichier
+        with source.open(member) as content:
+            try:
+                persistence.atomic_write_stream(target_path, content, expected_sha256=info['sha256'])
+            except ValueError:
+                raise ValueError(f"Contenu corrompu : {relative_path}")
+        files_restored += 1
+    
+    return files_restored, target
+
+# ============================================================================
+# TÂCHE DE FOND
+# ============================================================================
+# Les sauvegardes automatiques ne sont plus créées dans le clic de
+# l'utilisateur : trigger_auto_backup dépose une demande et un unique thread
+# de fond (partagé par toutes les sessions du serveur) crée la sauvegarde.
+# Les demandes reçues pendant COALESCE_SECONDS sont regroupées en une seule
+# sauvegarde ; une demande reçue pendant la création en déclenche une
+# nouvelle ensuite (qui ne contiendra que les modifications restantes). Le
+# ZIP reste sur disque ; backup_status() expose l'état aux sessions.
+
+# Fenêtre de regroupement des demandes (secondes)
+COALESCE_SECONDS = 2.0
+
+# Nombre de raisons gardées pour une même sauvegarde
+MAX_REASONS = 10
+
+_worker_condition = threading.Condition()
+_worker_thread = None
+_pending_reasons = []
+_status = {
+    'state': 'idle',        # 'idle', 'pending' ou 'running'
+    'requested_at': None,   # dernière demande
+    'last': None,           # dernière sauvegarde créée (entrée du catalogue + 'reasons')
+    'error': None,          # dernière erreur : {'message', 'at'}
+}
+
+def _backup_worker():
+    """Boucle du thread de fond : attend les demandes, les regroupe, sauvegarde"""
+    global _pending_reasons
+    while True:
+        with _worker_condition:
+            while not _pending_reasons:
+                _worker_condition.wait()
+            
+            # Regrouper les demandes arrivant dans la fenêtre
+            deadline = time.monotonic() + COALESCE_SECONDS
+            while (remaining := deadline - time.monotonic()) > 0:
+                _worker_condition.wait(remaining)
+            
+            reasons, _pending_reasons = _pending_reasons, []
+            _status['state'] = 'running'
+        
+        entry = None
+        error = None
+        try:
+            entry = create_snapshot('automatic')
+        except Exception as e:
+            error = {'message': str(e), 'at': datetime.now()}
+        
+        with _worker_condition:
+            if entry is not None:
+                entry.pop('files', None)
+                _status['last'] = dict(entry, reasons=reasons, completed_at=datetime.now())
+            _status['error'] = error
+            _status['state'] = 'pending' if _pending_reasons else 'idle'
+            _worker_condition.notify_all()
+
+def request_backup(reason):
+    """
+    Demande une sauvegarde automatique au thread de fond (retour immédiat)
+    
+    Args:
+        reason: Raison de la sauvegarde
+    """
+    global _worker_thread
+    with _worker_condition:
+        if reason not in _pending_reasons and len(_pending_reasons) < MAX_REASONS:
+            _pending_reasons.append(reason)
+        _status['requested_at'] = datetime.now()
+        if _status['state'] == 'idle':
+            _status['state'] = 'pending'
+        
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_backup_worker, name='auto-backup', daemon=True)
+            _worker_thread.start()
+        _worker_condition.notify_all()
+
+def backup_status():
+    """État des sauvegardes automatiques (copie : 'state', 'requested_at', 'last', 'error')"""
+    with _worker_condition:
+        return dict(_status)
+
+def wait_for_backups(timeout=None):
+    """
+    Attend la fin des sauvegardes demandées
+    
+    Returns:
+        bool: True si plus aucune sauvegarde n'est en attente ou en cours
+    """
+    with _worker_condition:
+        return _worker_condition.wait_for(lambda: _status['state'] == 'idle', timeout)
+
+# ============================================================================
+# SAUVEGARDE AUTOMATIQUE
+# ============================================================================
 
 class AutoBackup:
     """Gestionnaire de sauvegardes automatiques"""
@@ -40,51 +708,22 @@ class AutoBackup:
     @staticmethod
     def create_auto_backup():
         """
-        Crée une sauvegarde automatique
+        Crée immédiatement une sauvegarde automatique (incrémentale depuis la précédente)
         
         Returns:
-            tuple: (BytesIO: backup_zip, int: files_count, str: filename)
+            dict: entrée du catalogue, None si rien n'a changé
         """
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            data_dir = Path(".greenlog_data")
-            files_added = 0
-            
-            if data_dir.exists():
-                for pkl_file in data_dir.glob("*.pkl"):
-                    try:
-                        with open(pkl_file, 'rb') as f:
-                            data = f.read()
-                        
-                        zip_file.writestr(f"data/{pkl_file.name}", data)
-                        files_added += 1
-                    except Exception:
-                        pass
-            
-            # Métadonnées
-            metadata = {
-                'export_date': datetime.now().isoformat(),
-                'version': 'pilot by GREENLOG v1.0',
-                'files_count': files_added,
-                'backup_type': 'automatic',
-                'data_directory': '.greenlog_data'
-            }
-            
-            zip_file.writestr('metadata.json', json.dumps(metadata, indent=2))
-        
-        zip_buffer.seek(0)
-        filename = f"pilot_AUTO_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        entry = create_snapshot('automatic')
         
         # Mettre à jour le timestamp
         st.session_state.last_auto_backup = datetime.now()
         
-        return zip_buffer, files_added, filename
+        return entry
     
     @staticmethod
     def trigger_auto_backup(reason="Modification importante détectée"):
         """
-        Déclenche une sauvegarde automatique et affiche la notification
+        Demande une sauvegarde automatique (créée en tâche de fond)
         
         Args:
             reason: Raison de la sauvegarde
@@ -94,69 +733,83 @@ class AutoBackup:
             return False
         
         try:
-            backup_zip, files_count, filename = AutoBackup.create_auto_backup()
-            
-            if files_count > 0:
-                # Stocker la sauvegarde dans session_state pour téléchargement
-                st.session_state.pending_auto_backup = {
-                    'zip': backup_zip,
-                    'filename': filename,
-                    'files_count': files_count,
-                    'reason': reason,
-                    'timestamp': datetime.now()
-                }
-                
-                return True
-            
-        except Exception as e:
+            request_backup(reason)
+        except Exception:
             # Silencieusement ignorer les erreurs de sauvegarde auto
             return False
         
-        return False
+        # Notification attendue pour cette session
+        st.session_state.auto_backup_requested_at = datetime.now()
+        st.session_state.last_auto_backup = datetime.now()
+        return True
     
     @staticmethod
     def show_auto_backup_notification():
         """
-        Affiche la notification de sauvegarde automatique si disponible
+        Affiche l'état de la sauvegarde automatique demandée par cette session
+        (en cours, disponible au téléchargement ou en erreur)
         """
-        if 'pending_auto_backup' in st.session_state:
-            backup_info = st.session_state.pending_auto_backup
-            
-            # Créer une notification persistante en haut de page
+        AutoBackup.cleanup_old_session_backups()
+        
+        requested_at = st.session_state.get('auto_backup_requested_at')
+        if requested_at is None:
+            return
+        
+        status = backup_status()
+        last = status['last']
+        error = status['error']
+        
+        if status['state'] != 'idle':
+            st.caption("⏳ Sauvegarde automatique en cours...")
+        
+        if error is not None and error['at'] >= requested_at:
+            st.warning(f"⚠️ Sauvegarde automatique impossible : {error['message']}")
+        
+        if last is None or last['completed_at'] < requested_at or last['id'] == st.session_state.get('auto_backup_dismissed'):
+            return
+        
+        zip_path = snapshot_path(last)
+        if not zip_path.exists():
+            return
+        
+        # Toast une seule fois par sauvegarde
+        if st.session_state.get('auto_backup_toasted') != last['id']:
             st.toast("💾 Sauvegarde automatique créée !", icon="✅")
+            st.session_state.auto_backup_toasted = last['id']
+        
+        with st.container():
+            col1, col2, col3 = st.columns([3, 2, 1])
             
-            with st.container():
-                col1, col2, col3 = st.columns([3, 2, 1])
-                
-                with col1:
-                    st.info(f"""
-                    💾 **Sauvegarde automatique disponible**
-                    
-                    {backup_info['reason']} - {backup_info['files_count']} fichier(s)
-                    """)
+            with col1:
+                if last['kind'] == 'delta':
+                    detail = f"incrémentale, {last['added_count']} fichier(s) modifié(s) - à restaurer avec la sauvegarde complète {last['base']} et les suivantes"
+                else:
+                    detail = f"complète, {last['added_count']} fichier(s)"
+                st.info(f"""
+                💾 **Sauvegarde automatique disponible**
                 
-                with col2:
-                    st.download_button(
-                        label="📥 Télécharger",
-                        data=backup_info['zip'],
-                        file_name=backup_info['filename'],
-                        mime="application/zip",
-                        key=f"auto_backup_{backup_info['timestamp'].timestamp()}"
-                    )
-                
-                with col3:
-                    if st.button("✕ Ignorer", key="dismiss_auto_backup"):
-                        del st.session_state.pending_auto_backup
-                        st.rerun()
+                {', '.join(last['reasons'])} - {detail}
+                """)
+            
+            with col2:
+                st.download_button(
+                    label="📥 Télécharger",
+                    data=zip_path.read_bytes,  # lu au clic seulement
+                    file_name=last['filename'],
+                    mime="application/zip",
+                    key=f"auto_backup_{last['id']}"
+                )
+            
+            with col3:
+                if st.button("✕ Ignorer", key="dismiss_auto_backup"):
+                    st.session_state.auto_backup_dismissed = last['id']
+                    st.rerun()
     
     @staticmethod
     def cleanup_old_session_backups():
-        """Nettoie les anciennes sauvegardes en session"""
-        # Garde seulement la dernière
-        keys_to_remove = [k for k in st.session_state.keys() 
-                         if k.startswith('auto_backup_') and k != 'pending_auto_backup']
-        for key in keys_to_remove:
-            del st.session_state[key]
+        """Libère les sauvegardes gardées en session par les versions précédentes (ZIP en mémoire)"""
+        if 'pending_auto_backup' in st.session_state:
+            del st.session_state['pending_auto_backup']
 
 
 def trigger_backup_after_save(module_name, action_description):
@@ -0,0 +1,164 @@
+"""
+Moteur d'export Excel en flux
+Écriture openpyxl en mode write_only : chaque ligne est stylée au moment où
+elle est écrite et les largeurs de colonnes sont calculées sur le DataFrame,
+sans classeur complet en mémoire
+"""
+
+import weakref
+from io import BytesIO
+from copy import copy
+from collections import namedtuple
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment
+from openpyxl.utils import get_column_letter
+
+# Nombre de lignes converties à la fois (NaN → cellule vide)
+CHUNK_ROWS = 10_000
+
+# Style d'une cellule (attributs None = style par défaut)
+CellStyle = namedtuple('CellStyle', ['fill', 'font', 'alignment'], defaults=(None, None, None))
+
+# Couleurs GREENLOG
+BLEU_GREENLOG = PatternFill(start_color='2D3E50', end_color='2D3E50', fill_type='solid')
+VERT_CLAIR = PatternFill(start_color='E8F5F1', end_color='E8F5F1', fill_type='solid')
+
+HEADER_STYLE = CellStyle(
+    fill=BLEU_GREENLOG,
+    font=Font(bold=True, color='FFFFFF', size=11),
+    alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+)
+
+# Styles déjà enregistrés, par classeur : {id(CellStyle): (CellStyle, StyleArray)}
+_style_arrays = weakref.WeakKeyDictionary()
+
+# ==================== CLASSEUR ====================
+
+def new_workbook():
+    """Classeur en écriture seule (feuilles écrites en flux, dans l'ordre de création)"""
+    return Workbook(write_only=True)
+
+def save_workbook(wb):
+    """Enregistrer le classeur dans un BytesIO prêt à être lu"""
+    output = BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def _style_array(ws, style):
+    """
+    Identifiants de style openpyxl d'un CellStyle, enregistrés une seule fois
+    par classeur (l'affectation fill/font/alignment cellule par cellule
+    recherche le style dans les tables du classeur à chaque fois)
+    """
+    cache = _style_arrays.setdefault(ws.parent, {})
+    entry = cache.get(id(style))
+    if entry is None:
+        template = WriteOnlyCell(ws)
+        if style.fill is not None:
+            template.fill = style.fill
+        if style.font is not None:
+            template.font = style.font
+        if style.alignment is not None:
+            template.alignment = style.alignment
+        entry = cache[id(style)] = (style, template._style)
+    return entry[1]
+
+def styled_cell(ws, value, style=None):
+    """Cellule write_only portant un style (valeur brute si aucun style)"""
+    if style is None:
+        return value
+    cell = WriteOnlyCell(ws, value=value)
+    style_array = copy(_style_array(ws, style))
+    if cell.has_style:
+        style_array.numFmtId = cell._style.numFmtId  # format date/heure posé par la valeur
+    cell._style = style_array
+    return cell
+
+def styled_row(ws, values, styles=None):
+    """
+    Ligne prête pour ws.append
+    
+    Args:
+        values: valeurs de la ligne
+        styles: un CellStyle pour toute la ligne, ou une liste (un style ou None par colonne)
+    """
+    if styles is None:
+        return list(values)
+    if isinstance(styles, CellStyle):
+        return [styled_cell(ws, value, styles) for value in values]
+    return [styled_cell(ws, value, style) for value, style in zip(values, styles)]
+
+# ==================== LARGEURS DE COLONNES ====================
+
+def _text_lengths(series):
+    """Longueur du texte affiché par cellule (0 pour une cellule vide, nulle ou fausse)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        lengths = series.dt.strftime('%Y-%m-%d %H:%M:%S').str.len()
+        filled = series.notna()
+    else:
+        lengths = series.astype(str).str.len()
+        filled = series.notna() & (series != '') & (series != 0)
+    return lengths.where(filled, 0)
+
+def column_widths(df, max_width, header=True):
+    """
+    Largeur de chaque colonne : texte le plus long (en-tête compris) + 2, plafonnée
+    
+    Returns:
+        Liste de largeurs, une par colonne de df
+    """
+    widths = []
+    for position, column in enumerate(df.columns):
+        series = df.iloc[:, position]
+        max_length = int(_text_lengths(series).max()) if len(series) > 0 else 0
+        if header:
+            max_length = max(max_length, len(str(column)))
+        widths.append(min(max_length + 2, max_width))
+    return widths
+
+def set_column_widths(ws, widths):
+    """Appliquer des largeurs (liste dans l'ordre des colonnes ou dict lettre → largeur)"""
+    if not isinstance(widths, dict):
+        widths = {get_column_letter(idx): width for idx, width in enumerate(widths, 1)}
+    for column_letter, width in widths.items():
+        ws.column_dimensions[column_letter].width = width
+
+# ==================== FEUILLES DE DONNÉES ====================
+
+def _iter_values(df):
+    """Lignes du DataFrame par blocs, valeurs manquantes remplacées par None"""
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+def write_dataframe(ws, df, header_style=HEADER_STYLE, row_style=None,
+                    max_width=50, widths=None, freeze_panes='A2'):
+    """
+    Écrire un DataFrame (en-tête + lignes) dans une feuille write_only
+    
+    Largeurs et volet figé sont posés avant la première ligne (le mode
+    write_only les écrit en tête de feuille).
+    
+    Args:
+        ws: feuille créée par un classeur new_workbook()
+        df: DataFrame à écrire (sans index)
+        header_style: CellStyle de la ligne d'en-tête
+        row_style: fonction (numéro de ligne Excel, valeurs) → CellStyle, liste
+            de styles par colonne ou None ; appelée à l'écriture de chaque ligne
+        max_width: plafond des largeurs calculées
+        widths: largeurs imposées (liste ou dict lettre → largeur) à la place du calcul
+        freeze_panes: cellule du volet figé (None = aucun)
+    """
+    set_column_widths(ws, column_widths(df, max_width) if widths is None else widths)
+    if freeze_panes:
+        ws.freeze_panes = freeze_panes
+    
+    ws.append(styled_row(ws, [str(column) for column in df.columns], header_style))
+    
+    for row_idx, values in enumerate(_iter_values(df), 2):
+        styles = row_style(row_idx, values) if row_style is not None else None
+        ws.append(styled_row(ws, values, styles))
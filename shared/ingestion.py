@@ -0,0 +1,163 @@
+"""
+Exécuteur d'ingestion
+Lecture parallèle de plusieurs fichiers (factures, fichiers logisticiens)
+dans des processus séparés
+"""
+
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import types
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from shared import persistence
+
+# Nombre maximum de processus de lecture
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Format de retour des résultats (buffers numpy hors flux, sans compression)
+TRANSFER_CODEC = "pickle5"
+
+# Démarrage des processus de lecture : jamais de fork du serveur Streamlit
+# (multi-thread, un fork copierait des verrous détenus par d'autres threads).
+# 'forkserver' quand il existe : chaque processus est forké depuis un
+# serveur mono-thread où ce module (et pandas) est déjà importé
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Modules importés une fois dans le serveur 'forkserver' (jamais '__main__')
+FORKSERVER_PRELOAD = ["shared.ingestion"]
+
+# Pool partagé par le processus, créé au premier besoin (un par taille)
+_executors = {}
+_executors_lock = threading.Lock()
+
+# Remplacement de sys.modules['__main__'] pendant le démarrage d'un processus
+_main_lock = threading.Lock()
+
+def _file_payload(file):
+    """Nom et contenu d'un fichier uploadé (les UploadedFile ne passent pas entre processus)"""
+    file.seek(0)
+    data = file.read()
+    file.seek(0)
+    return getattr(file, 'name', ''), data
+
+def _parse_in_worker(parser, name, data):
+    """Exécuté dans un processus de lecture : parse puis sérialise le résultat"""
+    file = BytesIO(data)
+    file.name = name
+    return persistence.encode_entry(parser(file), TRANSFER_CODEC)
+
+def _picklable(parser):
+    """Une fonction locale ou lambda ne peut pas être envoyée aux processus"""
+    try:
+        pickle.dumps(parser)
+        return True
+    except Exception:
+        return False
+
+class _IngestionExecutor(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor dont les processus ne réimportent pas le script
+    principal
+    
+    Sous Streamlit, __main__ est app.py (sans garde __name__) : un processus
+    démarré en 'spawn'/'forkserver' le réexécuterait entièrement
+    (set_page_config, chargement des logisticiens, sauvegarde auto...).
+    Pendant le démarrage, multiprocessing lit un __main__ vide.
+    """
+    
+    def _spawn_process(self):
+        with _main_lock:
+            main_module = sys.modules['__main__']
+            placeholder = types.ModuleType('__main__')
+            sys.modules['__main__'] = placeholder
+            try:
+                super()._spawn_process()
+            finally:
+                # Un rerun Streamlit a pu installer son propre __main__ entre-temps
+                if sys.modules.get('__main__') is placeholder:
+                    sys.modules['__main__'] = main_module
+
+def _get_executor(max_workers):
+    """Pool de lecture partagé (processus démarrés à la demande, réutilisés)"""
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            context = multiprocessing.get_context(START_METHOD)
+            if START_METHOD == "forkserver":
+                context.set_forkserver_preload(FORKSERVER_PRELOAD)
+            executor = _IngestionExecutor(max_workers=max_workers, mp_context=context)
+            _executors[max_workers] = executor
+        return executor
+
+def _discard_executor(max_workers, executor):
+    """Oublie un pool cassé : le prochain appel en recrée un"""
+    with _executors_lock:
+        if _executors.get(max_workers) is executor:
+            del _executors[max_workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _parse_serial(parser, files, return_exceptions):
+    results = []
+    for file in files:
+        try:
+            file.seek(0)
+            results.append(parser(file))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+def parse_files(parser, files, max_workers=None, return_exceptions=False):
+    """
+    Parse plusieurs fichiers en parallèle, résultats dans l'ordre des fichiers
+    
+    Chaque fichier est relu dans un processus du pool partagé (démarré une
+    fois par processus, sans réexécuter app.py) sous la forme d'un BytesIO
+    portant son nom ; le résultat (DataFrame, tuple, liste...) revient en
+    pickle protocole 5. Avec un seul fichier, lecture directe dans le
+    processus courant.
+    
+    Args:
+        parser: fonction parser(fichier) définie au niveau d'un module
+            (elle doit être importable par les processus de lecture)
+        files: fichiers uploadés (les None sont ignorés)
+        max_workers: nombre de processus (défaut MAX_WORKERS)
+        return_exceptions: True → l'exception d'un fichier est renvoyée à sa
+            place dans les résultats au lieu d'être levée
+    
+    Returns:
+        list: un résultat par fichier
+    """
+    files = [f for f in files if f is not None]
+    pool_size = max_workers or MAX_WORKERS
+    
+    if min(pool_size, len(files)) <= 1 or not _picklable(parser):
+        return _parse_serial(parser, files, return_exceptions)
+    
+    payloads = [_file_payload(f) for f in files]
+    executor = _get_executor(pool_size)
+    
+    try:
+        futures = [executor.submit(_parse_in_worker, parser, name, data) for name, data in payloads]
+        
+        results = []
+        for future in futures:
+            try:
+                results.append(persistence.decode_entry(future.result(), TRANSFER_CODEC))
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+    except BrokenProcessPool as e:
+        # Processus de lecture indisponibles : lecture dans le processus courant
+        _discard_executor(pool_size, executor)
+        print(f"Lecture parallèle impossible, lecture séquentielle: {e}")
+        return _parse_serial(parser, files, return_exceptions)
@@ -0,0 +1,123 @@
+"""
+Moteur de correspondance en cascade
+Jointures vectorisées successives sur des clés de référence nettoyées
+"""
+
+import numpy as np
+import pandas as pd
+
+def build_key_table(right, right_keys, columns, keep='last'):
+    """
+    Table clé → colonnes à partir d'une ou plusieurs colonnes de clés
+    
+    Plusieurs colonnes de clés partagent le même espace de clés, comme un
+    dictionnaire rempli ligne par ligne puis colonne par colonne : avec
+    keep='last', la dernière écriture (ligne, puis colonne) l'emporte.
+    Les clés vides ou manquantes sont ignorées.
+    
+    Args:
+        right: DataFrame de référence
+        right_keys: nom de colonne ou liste de colonnes de clés (ordre = priorité d'écriture)
+        columns: colonnes de `right` à rapatrier
+        keep: 'first' ou 'last' pour une clé présente plusieurs fois
+    
+    Returns:
+        DataFrame ['key', 'source_row'] + columns, une ligne par clé
+    """
+    if isinstance(right_keys, str):
+        right_keys = [right_keys]
+    right_keys = [k for k in right_keys if k in right.columns]
+    
+    if not right_keys or len(right) == 0:
+        return pd.DataFrame(columns=['key', 'source_row'] + list(columns))
+    
+    n_rows = len(right)
+    keys = np.concatenate([right[k].to_numpy(dtype=object) for k in right_keys])
+    rows = np.tile(np.arange(n_rows), len(right_keys))
+    fields = np.repeat(np.arange(len(right_keys)), n_rows)
+    
+    table = pd.DataFrame({'key': keys, 'source_row': rows, 'order': rows * len(right_keys) + fields})
+    table = table[table['key'].notna() & (table['key'] != '')]
+    table = table.sort_values('order', kind='stable').drop_duplicates('key', keep=keep)
+    
+    source = table['source_row'].to_numpy()
+    result = pd.DataFrame({'key': table['key'].to_numpy(), 'source_row': source})
+    for column in columns:
+        result[column] = right[column].to_numpy(dtype=object)[source]
+    return result
+
+def lookup_keys(keys, table, columns):
+    """
+    Recherche vectorisée d'une série de clés dans une table build_key_table
+    
+    Returns:
+        DataFrame aligné sur l'index de `keys` : 'found' (bool), 'source_row'
+        et les colonnes demandées (None si non trouvé)
+    """
+    keys = pd.Series(keys)
+    matched = pd.DataFrame({'key': keys.to_numpy(dtype=object)}).merge(
+        table[['key', 'source_row'] + list(columns)], on='key', how='left', indicator=True
+    )
+    matched.index = keys.index
+    
+    result = pd.DataFrame({'found': (matched['_merge'] == 'both').to_numpy()}, index=keys.index)
+    result['source_row'] = matched['source_row']
+    for column in columns:
+        values = matched[column].to_numpy(dtype=object)
+        result[column] = np.where(result['found'].to_numpy(), values, None)
+    return result
+
+def cascade_join(left, right, stages, columns, accept=None, keep='last'):
+    """
+    Correspondance en cascade : chaque étape joint uniquement les lignes
+    encore non trouvées aux étapes précédentes
+    
+    Args:
+        left: DataFrame à enrichir (index unique)
+        right: DataFrame de référence
+        stages: liste ordonnée de (nom, clé gauche, clé(s) droite(s))
+        columns: colonnes de `right` à rapatrier
+        accept: fonction (DataFrame des correspondances) → masque booléen ;
+            une correspondance refusée laisse la ligne aux étapes suivantes
+        keep: priorité en cas de clé en double côté `right` (voir build_key_table)
+    
+    Returns:
+        DataFrame aligné sur l'index de `left` avec 'stage' (nom de l'étape
+        retenue, None si aucune), 'source_row' et les colonnes demandées
+    """
+    result = pd.DataFrame(index=left.index)
+    result['stage'] = None
+    result['source_row'] = np.nan
+    for column in columns:
+        result[column] = None
+    
+    remaining = pd.Series(True, index=left.index)
+    tables = {}
+    
+    for name, left_key, right_keys in stages:
+        if not remaining.any():
+            break
+        if left_key not in left.columns:
+            continue
+        
+        # Une table par jeu de clés droites (partagée entre étapes)
+        table_key = (right_keys,) if isinstance(right_keys, str) else tuple(right_keys)
+        if table_key not in tables:
+            tables[table_key] = build_key_table(right, right_keys, columns, keep=keep)
+        table = tables[table_key]
+        matched = lookup_keys(left.loc[remaining, left_key], table, columns)
+        
+        hit = matched['found']
+        if accept is not None:
+            hit = hit & pd.Series(accept(matched), index=matched.index).astype(bool)
+        hit_index = matched.index[hit.to_numpy()]
+        if len(hit_index) == 0:
+            continue
+        
+        result.loc[hit_index, 'stage'] = name
+        result.loc[hit_index, 'source_row'] = matched.loc[hit_index, 'source_row']
+        for column in columns:
+            result.loc[hit_index, column] = matched.loc[hit_index, column]
+        remaining.loc[hit_index] = False
+    
+    return result
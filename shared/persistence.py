@@ -6,16 +6,723 @@ Version 2.1 - Février 2026
 
 import pickle
 import os
+import re
+import json
+import shutil
+import hashlib
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 from io import BytesIO
 
 # Dossier de sauvegarde
 SAVE_DIR = Path(".greenlog_data")
 
+# Stockages par clé (un dossier par structure, un fichier par entrée)
+LIBRARY_STORE = "library"
+LOGISTICIENS_STORE = "logisticiens_library"
+MANIFEST_NAME = "manifest.json"
+
+# Contenus de fichiers uploadés, adressés par SHA-256 (stockés une seule fois)
+BLOB_DIR = "blobs"
+
 def init_save_dir():
     """Initialise le dossier de sauvegarde"""
     SAVE_DIR.mkdir(exist_ok=True)
 
+def _trigger_auto_backup(module_name, action_description):
+    """Déclenche la sauvegarde automatique si activée (silencieux hors Streamlit)"""
+    try:
+        import streamlit as st
+        if st.session_state.get('auto_backup_enabled', False):
+            from shared.auto_backup import trigger_backup_after_save
+            trigger_backup_after_save(module_name, action_description)
+    except:
+        pass
+
+# ============================================================================
+# ÉCRITURE ATOMIQUE
+# ============================================================================
+# Toute écriture passe par un fichier temporaire du même dossier, vidé sur
+# disque (fsync) puis renommé (os.replace, atomique) : un arrêt en cours
+# d'écriture laisse l'ancien fichier intact, jamais un fichier tronqué.
+
+def _fsync_dir(directory):
+    """Rend durable le renommage dans un dossier (sans effet sous Windows)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(filepath, data):
+    """Écrit des bytes dans filepath de façon atomique"""
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    _fsync_dir(filepath.parent)
+    invalidate_cache(filepath)
+
+# Taille des blocs pour les copies en flux (jamais un fichier entier en mémoire)
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class HashingWriter:
+    """Flux d'écriture qui calcule SHA-256 et taille de ce qui le traverse"""
+    
+    def __init__(self, target):
+        self.target = target
+        self.size = 0
+        self._hash = hashlib.sha256()
+    
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self.target.write(data)
+    
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+def atomic_write_stream(filepath, stream, expected_sha256=None):
+    """
+    Écrit le contenu d'un flux dans filepath de façon atomique, par blocs
+    
+    Args:
+        filepath: fichier cible
+        stream: flux binaire lisible (membre de ZIP, fichier ouvert...)
+        expected_sha256: hash attendu ; en cas d'écart le fichier cible
+            n'est pas touché et ValueError est levée
+    
+    Returns:
+        str: SHA-256 du contenu écrit
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=filepath.parent, prefix=f".{filepath.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer = HashingWriter(f)
+            shutil.copyfileobj(stream, writer, COPY_CHUNK_SIZE)
+            if expected_sha256 is not None and writer.hexdigest() != expected_sha256:
+                raise ValueError(f"Contenu corrompu pour {filepath.name} (hash différent)")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    _fsync_dir(filepath.parent)
+    invalidate_cache(filepath)
+    return writer.hexdigest()
+
+def atomic_pickle_dump(obj, filepath):
+    """pickle.dump atomique"""
+    atomic_write_bytes(filepath, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+# ============================================================================
+# CACHE PARTAGÉ ENTRE SESSIONS
+# ============================================================================
+# Toutes les sessions Streamlit d'un même serveur partagent ce processus :
+# un fichier désérialisé une fois est servi aux autres sessions tant que son
+# (mtime, taille) n'a pas changé. Les écritures de ce module invalident
+# l'entrée ; une écriture d'un autre processus change le mtime. Les valeurs
+# en cache ne sont jamais rendues telles quelles aux appelants mais via
+# _session_copy (copies superficielles sous copy-on-write, les données
+# restent partagées ; copies complètes avec un pandas sans copy-on-write).
+
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # taille cumulée (sur disque) des fichiers en cache
+
+_cache = OrderedDict()  # chemin absolu → ((mtime_ns, taille), valeur)
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+
+# Compteur d'écritures de ce processus (voir cached_until_write)
+_write_generation = 0
+
+def invalidate_cache(filepath=None):
+    """Oublie un fichier du cache (ou tout le cache si filepath est None)"""
+    global _cache_bytes, _write_generation
+    with _cache_lock:
+        _write_generation += 1
+        if filepath is None:
+            _cache.clear()
+            _cache_bytes = 0
+            return
+        entry = _cache.pop(os.path.abspath(filepath), None)
+        if entry is not None:
+            _cache_bytes -= entry[0][1]
+
+def cached_file_load(filepath, loader):
+    """
+    Charge un fichier via loader(bytes), résultat partagé entre sessions
+    
+    La valeur retournée est partagée : ne pas la modifier.
+    """
+    global _cache_bytes
+    key = os.path.abspath(filepath)
+    stat = os.stat(key)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            _cache.move_to_end(key)
+            return entry[1]
+    
+    with open(key, 'rb') as f:
+        value = loader(f.read())
+    
+    with _cache_lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= previous[0][1]
+        if stamp[1] <= CACHE_MAX_BYTES:
+            _cache[key] = (stamp, value)
+            _cache_bytes += stamp[1]
+            while _cache_bytes > CACHE_MAX_BYTES:
+                _, (old_stamp, _) = _cache.popitem(last=False)
+                _cache_bytes -= old_stamp[1]
+    return value
+
+def cached_until_write(fn):
+    """
+    Décorateur pour les résumés affichés à chaque rerun (compteurs de la
+    page d'accueil) : le résultat est gardé en mémoire jusqu'à la prochaine
+    écriture de ce processus, sans aucun accès disque entre-temps. Une
+    écriture d'un autre processus n'est vue qu'après une écriture locale :
+    à réserver à des valeurs d'affichage, immuables.
+    """
+    memo = {}
+    
+    def wrapper():
+        generation = _write_generation
+        if memo.get('generation') != generation:
+            memo['value'] = fn()
+            memo['generation'] = generation
+        return memo['value']
+    
+    wrapper.__doc__ = fn.__doc__
+    return wrapper
+
+def _copy_on_write():
+    """Vrai si pandas applique le copy-on-write (toujours à partir de pandas 3)"""
+    import pandas as pd
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+def frame_copy(frame):
+    """
+    Copie d'un DataFrame/Series partagé (cache) rendue à une session
+    
+    Superficielle sous copy-on-write ; complète sinon (pandas 2 : une
+    modification en place, df.loc[...] = ..., atteindrait le cache et donc
+    les autres sessions).
+    """
+    return frame.copy(deep=not _copy_on_write())
+
+def _session_copy(value):
+    """
+    Copie propre à l'appelant d'une valeur en cache
+    
+    dict/list recopiés, DataFrame/Series via frame_copy (copie superficielle
+    sous copy-on-write : une modification ne touche pas le cache).
+    """
+    if isinstance(value, dict):
+        return {k: _session_copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_session_copy(v) for v in value]
+    if hasattr(value, 'copy') and type(value).__name__ in ('DataFrame', 'Series'):
+        return frame_copy(value)
+    return value
+
+# ============================================================================
+# VERROUS INTER-PROCESSUS
+# ============================================================================
+# Plusieurs sessions (onglets, utilisateurs) partagent .greenlog_data.
+# data_lock(nom) pose un verrou fcntl sur .greenlog_data/.locks/<nom>.lock :
+# partagé pour les lectures (non bloquantes entre elles), exclusif pour les
+# lecture-modification-écriture. Réentrant dans un même thread ; un verrou
+# partagé ne peut pas être promu en exclusif. Ordre d'acquisition :
+# BLOB_DIR puis stockages. Sans fcntl (Windows), les verrous sont inactifs.
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCK_DIR = ".locks"
+INDEX_LOCK = "logisticiens_index"
+
+_held_locks = threading.local()
+
+@contextmanager
+def data_lock(name, exclusive=True):
+    """
+    Verrou lecteurs/écrivain sur une structure de .greenlog_data
+    
+    Args:
+        name: nom de la structure (ex: LIBRARY_STORE, BLOB_DIR)
+        exclusive: True pour écrire, False pour lire
+    """
+    held = getattr(_held_locks, 'modes', None)
+    if held is None:
+        held = _held_locks.modes = {}
+    
+    if name in held:
+        if exclusive and not held[name]:
+            raise RuntimeError(f"Verrou partagé '{name}' non promouvable en exclusif")
+        yield
+        return
+    
+    if fcntl is None:
+        held[name] = exclusive
+        try:
+            yield
+        finally:
+            del held[name]
+        return
+    
+    lock_dir = SAVE_DIR / LOCK_DIR
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with open(lock_dir / f"{name}.lock", 'a+b') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        held[name] = exclusive
+        try:
+            yield
+        finally:
+            del held[name]
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+# ============================================================================
+# FORMATS DE SÉRIALISATION DES ENTRÉES
+# ============================================================================
+# 'pickle'        : pickle brut (format historique)
+# 'pickle5'       : pickle protocole 5, buffers numpy hors flux, non compressé
+#                   (transfert entre processus, voir shared/ingestion.py)
+# 'pickle5-zstd'  : 'pickle5' compressé zstd
+# 'parquet-zstd'  : DataFrames en Parquet (dictionnaire + zstd), reste en
+#                   pickle, l'ensemble compressé zstd. Les DataFrames que
+#                   Parquet refuse (types mixtes) restent en pickle.
+# Les formats compressés reposent sur pyarrow (installé avec streamlit) ;
+# sans pyarrow, retour automatique à 'pickle'.
+
+# Format des analyses archivées (bibliothèque) - modifiable
+LIBRARY_CODEC = "pickle5-zstd"
+
+ENTRY_CODECS = ("pickle", "pickle5", "pickle5-zstd", "parquet-zstd")
+
+_PARQUET_FRAME = "__parquet_frame__"
+
+def _codec_available(codec):
+    if codec in ("pickle", "pickle5"):
+        return True
+    try:
+        import pyarrow as pa
+        return pa.Codec.is_available("zstd")
+    except ImportError:
+        return False
+
+def _store_codec(store_name):
+    """Format d'écriture d'un stockage (les analyses archivées sont compressées)"""
+    codec = LIBRARY_CODEC if store_name == LIBRARY_STORE else "pickle"
+    return codec if _codec_available(codec) else "pickle"
+
+def _zstd_compress(raw):
+    import pyarrow as pa
+    return struct.pack('<Q', len(raw)) + pa.compress(raw, codec="zstd", asbytes=True)
+
+def _zstd_decompress(payload):
+    import pyarrow as pa
+    (size,) = struct.unpack_from('<Q', payload)
+    return pa.decompress(memoryview(payload)[8:], decompressed_size=size, codec="zstd", asbytes=True)
+
+def _pickle5_frames(value):
+    """pickle protocole 5 → [flux principal, buffer1, ...] préfixés par leurs tailles"""
+    buffers = []
+    main = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+    parts = [main] + [buffer.raw() for buffer in buffers]
+    header = struct.pack('<I', len(parts)) + b''.join(struct.pack('<Q', len(part)) for part in parts)
+    return header + b''.join(parts)
+
+def _pickle5_unframe(raw):
+    (count,) = struct.unpack_from('<I', raw)
+    sizes = struct.unpack_from(f'<{count}Q', raw, 4)
+    offset = 4 + 8 * count
+    parts = []
+    for size in sizes:
+        # bytearray : tableaux numpy modifiables après chargement
+        parts.append(bytearray(raw[offset:offset + size]))
+        offset += size
+    return pickle.loads(parts[0], buffers=parts[1:])
+
+def _frames_to_parquet(value):
+    """Remplace récursivement les DataFrames par leur version Parquet"""
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+        try:
+            buffer = BytesIO()
+            value.to_parquet(buffer, compression="zstd")
+            return {_PARQUET_FRAME: buffer.getvalue()}
+        except Exception:
+            return value
+    if isinstance(value, dict):
+        return {k: _frames_to_parquet(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_frames_to_parquet(v) for v in value]
+    return value
+
+def _frames_from_parquet(value):
+    if isinstance(value, dict):
+        if len(value) == 1 and _PARQUET_FRAME in value:
+            import pandas as pd
+            return pd.read_parquet(BytesIO(value[_PARQUET_FRAME]))
+        return {k: _frames_from_parquet(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_frames_from_parquet(v) for v in value]
+    return value
+
+def encode_entry(value, codec="pickle"):
+    """Sérialise une entrée de stockage dans le format demandé"""
+    if codec == "pickle5":
+        return _pickle5_frames(value)
+    if codec == "pickle5-zstd":
+        return _zstd_compress(_pickle5_frames(value))
+    if codec == "parquet-zstd":
+        return _zstd_compress(pickle.dumps(_frames_to_parquet(value), protocol=pickle.HIGHEST_PROTOCOL))
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def decode_entry(payload, codec="pickle"):
+    """Relit une entrée sérialisée par encode_entry"""
+    if codec == "pickle5":
+        return _pickle5_unframe(payload)
+    if codec == "pickle5-zstd":
+        return _pickle5_unframe(_zstd_decompress(payload))
+    if codec == "parquet-zstd":
+        return _frames_from_parquet(pickle.loads(_zstd_decompress(payload)))
+    return pickle.loads(payload)
+
+# ============================================================================
+# STOCKAGE PAR CLÉ
+# ============================================================================
+# Chaque structure (bibliothèque, bibliothèque logisticiens, données module)
+# est un dossier de SAVE_DIR contenant un fichier .pkl par entrée et un
+# manifest.json {clé: {'file', 'sha256', 'size', 'codec', 'meta'}}. Écrire ou
+# supprimer une entrée ne touche que son fichier et le manifeste. 'meta'
+# (optionnel) porte les métadonnées légères lisibles sans charger l'entrée.
+#
+# Le manifeste est le point de validation : une nouvelle version d'entrée est
+# écrite sous un nouveau nom, le manifeste est remplacé atomiquement, puis
+# seulement l'ancienne version est supprimée. Après un arrêt brutal, le
+# manifeste désigne toujours des fichiers complets (ancienne ou nouvelle
+# version) ; les fichiers orphelins sont nettoyés à la synchronisation suivante.
+
+def _store_dir(store_name):
+    return SAVE_DIR / store_name
+
+def _store_exists(store_name):
+    return (_store_dir(store_name) / MANIFEST_NAME).exists()
+
+def _entry_filename(key, sha256):
+    """Nom de fichier sûr pour une version d'entrée (clé + contenu)"""
+    slug = re.sub(r'[^A-Za-z0-9_-]', '_', key)[:60]
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]
+    return f"{slug}_{digest}_{sha256[:8]}.pkl"
+
+def _load_store_manifest(store_name):
+    manifest_path = _store_dir(store_name) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_store_manifest(store_name, manifest):
+    payload = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+    atomic_write_bytes(_store_dir(store_name) / MANIFEST_NAME, payload)
+
+def _store_files(store_name, manifest=None):
+    """Fichiers valides d'un stockage (manifeste + entrées référencées)"""
+    if manifest is None:
+        manifest = _load_store_manifest(store_name)
+    store_dir = _store_dir(store_name)
+    return [store_dir / MANIFEST_NAME] + [store_dir / info['file'] for info in manifest.values()]
+
+def _unlink_store_files(store_name, filenames):
+    store_dir = _store_dir(store_name)
+    for filename in filenames:
+        entry_path = store_dir / filename
+        if entry_path.exists():
+            entry_path.unlink()
+        invalidate_cache(entry_path)
+
+def _write_store_entry(store_name, key, value, manifest, meta=None, obsolete=None):
+    """
+    Écrit une entrée si son contenu a changé
+    
+    Args:
+        obsolete: liste complétée avec le fichier de l'ancienne version,
+            à supprimer une fois le manifeste enregistré
+    
+    Returns:
+        bool: True si le manifeste a changé (fichier réécrit ou meta modifiée)
+    """
+    codec = _store_codec(store_name)
+    payload = encode_entry(value, codec)
+    digest = hashlib.sha256(payload).hexdigest()
+    
+    current = manifest.get(key)
+    store_dir = _store_dir(store_name)
+    if current and current['sha256'] == digest and (store_dir / current['file']).exists():
+        if meta is not None and current.get('meta') != meta:
+            current['meta'] = meta
+            return True
+        return False
+    
+    filename = _entry_filename(key, digest)
+    atomic_write_bytes(store_dir / filename, payload)
+    if current and current['file'] != filename and obsolete is not None:
+        obsolete.append(current['file'])
+    
+    manifest[key] = {'file': filename, 'sha256': digest, 'size': len(payload), 'codec': codec}
+    if meta is not None:
+        manifest[key]['meta'] = meta
+    return True
+
+def _read_store_entry(store_name, key, manifest=None):
+    with data_lock(store_name, exclusive=False):
+        if manifest is None:
+            manifest = _load_store_manifest(store_name)
+        info = manifest.get(key)
+        if info is None:
+            return None
+        codec = info.get('codec', 'pickle')
+        value = cached_file_load(
+            _store_dir(store_name) / info['file'],
+            lambda payload: decode_entry(payload, codec)
+        )
+        return _session_copy(value)
+
+def _delete_store_entry(store_name, key, manifest, obsolete):
+    info = manifest.pop(key, None)
+    if info is not None:
+        obsolete.append(info['file'])
+
+def _load_store(store_name):
+    """
+    Charge toutes les entrées d'un stockage → dict {clé: valeur}
+    
+    Une entrée illisible est ignorée (et signalée) sans perdre les autres.
+    """
+    with data_lock(store_name, exclusive=False):
+        manifest = _load_store_manifest(store_name)
+        entries = {}
+        for key in manifest:
+            try:
+                entries[key] = _read_store_entry(store_name, key, manifest)
+            except Exception as e:
+                print(f"Erreur lecture {store_name}/{key}: {e}")
+        return entries
+
+def _save_store(store_name, entries, meta_fn=None):
+    """
+    Synchronise un stockage avec un dict complet {clé: valeur}
+    
+    Seules les entrées modifiées sont réécrites, les entrées absentes
+    sont supprimées.
+    
+    Args:
+        meta_fn: fonction (clé, valeur) → dict de métadonnées pour le manifeste
+    """
+    init_save_dir()
+    with data_lock(store_name):
+        manifest = _load_store_manifest(store_name)
+        obsolete = []
+        
+        for key in [k for k in manifest if k not in entries]:
+            _delete_store_entry(store_name, key, manifest, obsolete)
+        
+        for key, value in entries.items():
+            meta = meta_fn(key, value) if meta_fn else None
+            _write_store_entry(store_name, key, value, manifest, meta, obsolete)
+        
+        _save_store_manifest(store_name, manifest)
+        
+        # Anciennes versions + orphelins laissés par une écriture interrompue
+        valid = {p.name for p in _store_files(store_name, manifest)}
+        _unlink_store_files(store_name, [
+            p.name for p in _store_dir(store_name).iterdir()
+            if p.is_file() and p.name not in valid
+        ])
+
+def _save_store_entry(store_name, key, value, meta=None):
+    """Écrit une seule entrée d'un stockage"""
+    init_save_dir()
+    with data_lock(store_name):
+        manifest = _load_store_manifest(store_name)
+        obsolete = []
+        if _write_store_entry(store_name, key, value, manifest, meta, obsolete):
+            _save_store_manifest(store_name, manifest)
+            _unlink_store_files(store_name, obsolete)
+
+def _store_metadata(store_name, meta_fn):
+    """
+    Métadonnées de toutes les entrées, lues depuis le seul manifeste
+    
+    Les entrées écrites sans 'meta' sont complétées une fois (lecture de
+    l'entrée) puis le manifeste est réenregistré.
+    
+    Returns:
+        dict {clé: meta}
+    """
+    with data_lock(store_name, exclusive=False):
+        manifest = _load_store_manifest(store_name)
+    
+    if any('meta' not in info for info in manifest.values()):
+        with data_lock(store_name):
+            manifest = _load_store_manifest(store_name)
+            missing = [key for key, info in manifest.items() if 'meta' not in info]
+            for key in missing:
+                manifest[key]['meta'] = meta_fn(key, _read_store_entry(store_name, key, manifest))
+            if missing:
+                _save_store_manifest(store_name, manifest)
+    return {key: info['meta'] for key, info in manifest.items()}
+
+def _remove_store_entries(store_name, keys):
+    """
+    Supprime des entrées d'un stockage
+    
+    Args:
+        keys: liste de clés, ou fonction clé → bool appliquée au manifeste
+            relu sous le verrou exclusif (pas de vue périmée)
+    """
+    with data_lock(store_name):
+        manifest = _load_store_manifest(store_name)
+        if callable(keys):
+            keys = [key for key in manifest if keys(key)]
+        obsolete = []
+        for key in keys:
+            _delete_store_entry(store_name, key, manifest, obsolete)
+        _save_store_manifest(store_name, manifest)
+        _unlink_store_files(store_name, obsolete)
+
+def _delete_store(store_name):
+    with data_lock(store_name):
+        store_dir = _store_dir(store_name)
+        if store_dir.exists():
+            shutil.rmtree(store_dir)
+    invalidate_cache()
+
+def _migrate_legacy_pickle(store_name, legacy_filename, to_entries, meta_fn=None):
+    """
+    Importe un ancien fichier .pkl monolithique dans le stockage par clé
+    
+    Le fichier ancien (ex: restauré depuis une sauvegarde antérieure)
+    remplace le contenu du stockage puis est supprimé.
+    """
+    legacy_path = SAVE_DIR / legacy_filename
+    if not legacy_path.exists():
+        return
+    try:
+        with data_lock(store_name):
+            # Une autre session a pu migrer entre-temps
+            if not legacy_path.exists():
+                return
+            with open(legacy_path, 'rb') as f:
+                legacy_data = pickle.load(f)
+            _save_store(store_name, to_entries(legacy_data or {}), meta_fn)
+            legacy_path.unlink()
+        print(f"✅ Migré vers stockage par clé: {legacy_filename}")
+    except Exception as e:
+        print(f"Erreur migration {legacy_filename}: {e}")
+
+# ============================================================================
+# CONTENUS DE FICHIERS (adressés par contenu)
+# ============================================================================
+# Les bytes des fichiers uploadés sont stockés une seule fois dans
+# blobs/<2 premiers caractères>/<sha256>.bin ; les sauvegardes (fichiers
+# partagés, fichiers module, bibliothèque logisticiens) ne gardent que le
+# hash. Un même classeur logisticien n'occupe ainsi qu'un seul fichier.
+
+def _blob_path(digest):
+    return SAVE_DIR / BLOB_DIR / digest[:2] / f"{digest}.bin"
+
+def put_blob(data):
+    """
+    Stocke des bytes dans le stockage par contenu
+    
+    Returns:
+        str: hash SHA-256 (référence du contenu)
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = _blob_path(digest)
+    if not blob_path.exists():
+        atomic_write_bytes(blob_path, data)
+    return digest
+
+def get_blob(digest):
+    """Relit des bytes depuis leur hash SHA-256"""
+    return cached_file_load(_blob_path(digest), lambda payload: payload)
+
+def _referenced_blobs():
+    """Hashs référencés par les fichiers partagés, module et logisticiens"""
+    refs = set()
+    
+    pickles = [SAVE_DIR / "shared_logisticiens.pkl"] + list(SAVE_DIR.glob("*_files.pkl"))
+    for filepath in pickles:
+        if not filepath.exists():
+            continue
+        save_data = cached_file_load(filepath, pickle.loads)
+        refs.update(value['blob'] for value in save_data.values() if 'blob' in value)
+    
+    for meta in _store_metadata(LOGISTICIENS_STORE, _logisticien_meta).values():
+        if meta.get('blob'):
+            refs.add(meta['blob'])
+    return refs
+
+def collect_unused_blobs():
+    """
+    Supprime les contenus qui ne sont plus référencés
+    
+    Returns:
+        int: nombre de contenus supprimés
+    """
+    blob_root = SAVE_DIR / BLOB_DIR
+    if not blob_root.exists():
+        return 0
+    with data_lock(BLOB_DIR):
+        try:
+            refs = _referenced_blobs()
+        except Exception as e:
+            # Référence illisible : ne rien supprimer
+            print(f"Erreur inventaire contenus: {e}")
+            return 0
+        
+        removed = 0
+        for blob_path in blob_root.glob("*/*.bin"):
+            if blob_path.stem not in refs:
+                blob_path.unlink()
+                invalidate_cache(blob_path)
+                removed += 1
+        return removed
+
 # ============================================================================
 # FICHIERS LOGISTICIENS PARTAGÉS
 # ============================================================================
@@ -33,24 +740,25 @@ def save_shared_logisticiens(data):
     try:
         init_save_dir()
         
-        # Préparer les données pour sauvegarde (convertir files en bytes)
-        save_data = {}
-        for key, value in data.items():
-            if 'file' in value:
-                # Lire le contenu du fichier
-                file_obj = value['file']
-                file_obj.seek(0)  # Retour au début
-                file_bytes = file_obj.read()
+        # Verrou partagé : le nettoyage des contenus attend la fin de l'écriture
+        with data_lock(BLOB_DIR, exclusive=False):
+            # Préparer les données pour sauvegarde (contenu → stockage par hash)
+            save_data = {}
+            for key, value in data.items():
+                if 'file' in value:
+                    # Lire le contenu du fichier
+                    file_obj = value['file']
+                    file_obj.seek(0)  # Retour au début
+                    file_bytes = file_obj.read()
                 
-                save_data[key] = {
-                    'name': value['name'],
-                    'file_bytes': file_bytes,
-                    'uploaded_at': value['uploaded_at']
-                }
+                    save_data[key] = {
+                        'name': value['name'],
+                        'blob': put_blob(file_bytes),
+                        'uploaded_at': value['uploaded_at']
+                    }
         
-        filepath = SAVE_DIR / "shared_logisticiens.pkl"
-        with open(filepath, 'wb') as f:
-            pickle.dump(save_data, f)
+            atomic_pickle_dump(save_data, SAVE_DIR / "shared_logisticiens.pkl")
+        collect_unused_blobs()
         return True
     except Exception as e:
         print(f"Erreur sauvegarde fichiers partagés : {e}")
@@ -68,13 +776,13 @@ def load_shared_logisticiens():
     try:
         filepath = SAVE_DIR / "shared_logisticiens.pkl"
         if filepath.exists():
-            with open(filepath, 'rb') as f:
-                save_data = pickle.load(f)
+            save_data = cached_file_load(filepath, pickle.loads)
             
             # Reconvertir bytes en file objects
             loaded_data = {}
             for key, value in save_data.items():
-                file_obj = BytesIO(value['file_bytes'])
+                file_bytes = get_blob(value['blob']) if 'blob' in value else value['file_bytes']
+                file_obj = BytesIO(file_bytes)
                 file_obj.name = value['name']  # Ajouter le nom
                 
                 loaded_data[key] = {
@@ -106,28 +814,22 @@ def save_module_files(module_name, files_dict):
     try:
         init_save_dir()
         
-        # Préparer les données (convertir files en bytes)
-        save_data = {}
-        for key, file_obj in files_dict.items():
-            if file_obj is not None:
-                file_obj.seek(0)
-                save_data[key] = {
-                    'name': file_obj.name,
-                    'bytes': file_obj.read()
-                }
+        with data_lock(BLOB_DIR, exclusive=False):
+            # Préparer les données (contenu → stockage par hash)
+            save_data = {}
+            for key, file_obj in files_dict.items():
+                if file_obj is not None:
+                    file_obj.seek(0)
+                    save_data[key] = {
+                        'name': file_obj.name,
+                        'blob': put_blob(file_obj.read())
+                    }
         
-        filepath = SAVE_DIR / f"{module_name}_files.pkl"
-        with open(filepath, 'wb') as f:
-            pickle.dump(save_data, f)
+            atomic_pickle_dump(save_data, SAVE_DIR / f"{module_name}_files.pkl")
+        collect_unused_blobs()
         
         # Déclencher sauvegarde automatique si activée
-        try:
-            import streamlit as st
-            if st.session_state.get('auto_backup_enabled', False):
-                from shared.auto_backup import trigger_backup_after_save
-                trigger_backup_after_save(module_name, f'Fichiers {module_name} uploadés')
-        except:
-            pass
+        _trigger_auto_backup(module_name, f'Fichiers {module_name} uploadés')
         
         return True
     except Exception as e:
@@ -150,13 +852,12 @@ def load_module_files(module_name):
     try:
         filepath = SAVE_DIR / f"{module_name}_files.pkl"
         if filepath.exists():
-            with open(filepath, 'rb') as f:
-                save_data = pickle.load(f)
+            save_data = cached_file_load(filepath, pickle.loads)
             
             # Reconvertir bytes en file objects
             loaded_files = {}
             for key, data in save_data.items():
-                file_obj = BytesIO(data['bytes'])
+                file_obj = BytesIO(get_blob(data['blob']) if 'blob' in data else data['bytes'])
                 file_obj.name = data['name']
                 loaded_files[key] = file_obj
             
@@ -169,23 +870,26 @@ def load_module_files(module_name):
 # DONNÉES TRAITÉES PAR MODULE
 # ============================================================================
 
+def _module_data_store(module_name):
+    return f"{module_name}_data"
+
 def save_module_data(module_name, data):
-    """Sauvegarde les données traitées d'un module"""
+    """Sauvegarde les données traitées d'un module
+    
+    Une entrée par clé du dict (ex: 'synthese', 'detail', 'stats') :
+    seules les clés modifiées sont réécrites.
+    """
     try:
-        init_save_dir()
-        filepath = SAVE_DIR / f"{module_name}_data.pkl"
-        with open(filepath, 'wb') as f:
-            pickle.dump(data, f)
+        entries = data if isinstance(data, dict) else {'_value': data}
+        _save_store(_module_data_store(module_name), entries)
+        
+        # Ancien format monolithique remplacé
+        legacy_path = SAVE_DIR / f"{module_name}_data.pkl"
+        if legacy_path.exists():
+            legacy_path.unlink()
         
         # Déclencher sauvegarde automatique si activée
-        try:
-            import streamlit as st
-            if st.session_state.get('auto_backup_enabled', False):
-                from shared.auto_backup import trigger_backup_after_save
-                trigger_backup_after_save(module_name, f'Données {module_name} modifiées')
-        except:
-            # Silencieusement ignorer si pas dans contexte Streamlit
-            pass
+        _trigger_auto_backup(module_name, f'Données {module_name} modifiées')
         
         return True
     except Exception as e:
@@ -195,10 +899,14 @@ def save_module_data(module_name, data):
 def load_module_data(module_name):
     """Charge les données traitées d'un module"""
     try:
-        filepath = SAVE_DIR / f"{module_name}_data.pkl"
-        if filepath.exists():
-            with open(filepath, 'rb') as f:
-                return pickle.load(f)
+        store_name = _module_data_store(module_name)
+        _migrate_legacy_pickle(store_name, f"{module_name}_data.pkl",
+                               lambda data: data if isinstance(data, dict) else {'_value': data})
+        if _store_exists(store_name):
+            data = _load_store(store_name)
+            if set(data) == {'_value'}:
+                return data['_value']
+            return data
     except Exception as e:
         print(f"Erreur chargement données module {module_name} : {e}")
     return None
@@ -220,6 +928,8 @@ def delete_module_data(module_name):
             data_path = SAVE_DIR / f"{module_name}_data.pkl"
             if data_path.exists():
                 data_path.unlink()
+            _delete_store(_module_data_store(module_name))
+            collect_unused_blobs()
         
         return True
     except Exception as e:
@@ -229,24 +939,33 @@ def delete_module_data(module_name):
 def delete_all_saved_data():
     """
     Supprime toutes les sauvegardes SAUF :
-    - Bibliothèque des analyses (library.pkl)
-    - Bibliothèque logisticiens (logisticiens_library.pkl)
+    - Bibliothèque des analyses (library/)
+    - Bibliothèque logisticiens (logisticiens_library/ + index)
     - Indemnisations (géré séparément)
     """
     try:
         if SAVE_DIR.exists():
-            # Fichiers à préserver
+            # Fichiers et stockages à préserver
             preserve_files = {
-                'library.pkl',              # Bibliothèque analyses
-                'logisticiens_library.pkl'  # Bibliothèque logisticiens
+                'library.pkl',              # Bibliothèque analyses (ancien format)
+                'logisticiens_library.pkl', # Bibliothèque logisticiens (ancien format)
+                'logisticiens_index.pkl',   # Index des références logisticiens
+                LIBRARY_STORE,              # Bibliothèque analyses
+                LOGISTICIENS_STORE          # Bibliothèque logisticiens
             }
             
-            for file in SAVE_DIR.glob("*.pkl"):
-                if file.name not in preserve_files:
+            for file in SAVE_DIR.iterdir():
+                if file.name in preserve_files:
+                    print(f"✅ Préservé: {file.name}")
+                elif file.is_dir() and _store_exists(file.name):
+                    shutil.rmtree(file)
+                    print(f"🗑️ Supprimé: {file.name}/")
+                elif file.suffix == '.pkl':
                     file.unlink()
                     print(f"🗑️ Supprimé: {file.name}")
-                else:
-                    print(f"✅ Préservé: {file.name}")
+            
+            # Contenus encore référencés par la bibliothèque logisticiens conservés
+            collect_unused_blobs()
         return True
     except Exception as e:
         print(f"Erreur suppression totale : {e}")
@@ -261,20 +980,73 @@ def get_saved_files_info():
     info = {
         'has_shared': (SAVE_DIR / "shared_logisticiens.pkl").exists(),
         'has_retours_files': (SAVE_DIR / "retours_files.pkl").exists(),
-        'has_retours_data': (SAVE_DIR / "retours_data.pkl").exists(),
+        'has_retours_data': _store_exists(_module_data_store('retours')),
         'has_dpd_files': (SAVE_DIR / "dpd_files.pkl").exists(),
-        'has_dpd_data': (SAVE_DIR / "dpd_data.pkl").exists(),
+        'has_dpd_data': _store_exists(_module_data_store('dpd')),
         'has_mondial_relay_files': (SAVE_DIR / "mondial_relay_files.pkl").exists(),
-        'has_mondial_relay_data': (SAVE_DIR / "mondial_relay_data.pkl").exists(),
+        'has_mondial_relay_data': _store_exists(_module_data_store('mondial_relay')),
         'has_colissimo_files': (SAVE_DIR / "colissimo_files.pkl").exists(),
-        'has_colissimo_data': (SAVE_DIR / "colissimo_data.pkl").exists(),
+        'has_colissimo_data': _store_exists(_module_data_store('colissimo')),
     }
     return info
 
+def list_data_files():
+    """
+    Liste tous les fichiers persistés (pour sauvegarde/diagnostic)
+    
+    Returns:
+        list[Path]: .pkl de premier niveau + contenu des stockages par clé
+        + contenus de fichiers (blobs/)
+    """
+    if not SAVE_DIR.exists():
+        return []
+    
+    files = list(SAVE_DIR.glob("*.pkl"))
+    for store_dir in SAVE_DIR.iterdir():
+        if store_dir.is_dir() and _store_exists(store_dir.name):
+            files.extend(p for p in _store_files(store_dir.name) if p.exists())
+    files.extend((SAVE_DIR / BLOB_DIR).glob("*/*.bin"))
+    return sorted(files)
+
 # ============================================================================
 # BIBLIOTHÈQUE DE FICHIERS
 # ============================================================================
 
+def _library_entries(library_data):
+    """{'YYYY_MM': {transporteur: [...]}} → {'YYYY_MM/transporteur': [...]}"""
+    return {
+        f"{period_key}/{transporteur}": analyses
+        for period_key, transporteurs in library_data.items()
+        for transporteur, analyses in transporteurs.items()
+    }
+
+def _analysis_summary(analyse):
+    """Résumé d'une analyse archivée (catalogue, sans les DataFrames)"""
+    match_rate = analyse.get('match_rate', 'N/A')
+    if isinstance(match_rate, (int, float)):
+        match_rate = float(match_rate)
+    elif match_rate is not None:
+        match_rate = str(match_rate)
+    return {
+        'analyzed_at': analyse.get('analyzed_at'),
+        'nb_rows': int(analyse.get('nb_rows') or 0),
+        'match_rate': match_rate,
+        'partners': [str(p) for p in analyse.get('partners') or []],
+        'date_range': analyse.get('date_range')
+    }
+
+def _library_meta(key, analyses):
+    """Métadonnées catalogue d'une entrée période/transporteur"""
+    period_key, transporteur = key.split('/', 1)
+    return {
+        'period': period_key,
+        'transporteur': transporteur,
+        'analyses': [_analysis_summary(a) for a in analyses or []]
+    }
+
+def _migrate_legacy_library():
+    _migrate_legacy_pickle(LIBRARY_STORE, "library.pkl", _library_entries, _library_meta)
+
 def save_library(library_data):
     """
     Sauvegarde la bibliothèque de fichiers
@@ -295,21 +1067,15 @@ def save_library(library_data):
                 ]
             }
         }
+    
+    Une entrée par période/transporteur : seules les entrées modifiées
+    sont réécrites.
     """
     try:
-        init_save_dir()
-        filepath = SAVE_DIR / "library.pkl"
-        with open(filepath, 'wb') as f:
-            pickle.dump(library_data, f)
+        _save_store(LIBRARY_STORE, _library_entries(library_data), _library_meta)
         
         # Déclencher sauvegarde automatique si activée
-        try:
-            import streamlit as st
-            if st.session_state.get('auto_backup_enabled', False):
-                from shared.auto_backup import trigger_backup_after_save
-                trigger_backup_after_save('bibliotheque', 'Analyse archivée dans bibliothèque')
-        except:
-            pass
+        _trigger_auto_backup('bibliotheque', 'Analyse archivée dans bibliothèque')
         
         return True
     except Exception as e:
@@ -324,21 +1090,105 @@ def load_library():
         Dict ou None si pas de sauvegarde
     """
     try:
-        filepath = SAVE_DIR / "library.pkl"
-        if filepath.exists():
-            with open(filepath, 'rb') as f:
-                return pickle.load(f)
-        return None
+        _migrate_legacy_library()
+        if not _store_exists(LIBRARY_STORE):
+            return None
+        
+        library = {}
+        for key, analyses in _load_store(LIBRARY_STORE).items():
+            period_key, transporteur = key.split('/', 1)
+            library.setdefault(period_key, {})[transporteur] = analyses
+        return library
     except Exception as e:
         print(f"Erreur chargement bibliothèque: {e}")
         return None
 
+def load_library_entry(period_key, transporteur):
+    """
+    Charge les analyses d'une seule période/transporteur
+    
+    Returns:
+        list (analyses, la plus récente en premier) ou None
+    """
+    try:
+        _migrate_legacy_library()
+        return _read_store_entry(LIBRARY_STORE, f"{period_key}/{transporteur}")
+    except Exception as e:
+        print(f"Erreur chargement bibliothèque {period_key}/{transporteur}: {e}")
+        return None
+
+def load_library_catalogue():
+    """
+    Catalogue de la bibliothèque, lu depuis le seul manifeste
+    
+    Aucun DataFrame n'est désérialisé : utiliser load_library_analysis()
+    pour matérialiser une analyse.
+    
+    Returns:
+        Dict {'YYYY_MM': {transporteur: [{'analyzed_at', 'nb_rows',
+        'match_rate', 'partners', 'date_range'}]}} (vide si pas de sauvegarde)
+    """
+    try:
+        _migrate_legacy_library()
+        catalogue = {}
+        for meta in _store_metadata(LIBRARY_STORE, _library_meta).values():
+            catalogue.setdefault(meta['period'], {})[meta['transporteur']] = meta['analyses']
+        return catalogue
+    except Exception as e:
+        print(f"Erreur catalogue bibliothèque: {e}")
+        return {}
+
+def load_library_analysis(period_key, transporteur, index):
+    """
+    Charge une seule analyse archivée (avec ses DataFrames)
+    
+    Args:
+        index: position dans le catalogue (0 = la plus récente)
+    
+    Returns:
+        dict de l'analyse ou None
+    """
+    analyses = load_library_entry(period_key, transporteur)
+    if not analyses or index >= len(analyses):
+        return None
+    return analyses[index]
+
+def save_library_entry(period_key, transporteur, analyses):
+    """Sauvegarde les analyses d'une seule période/transporteur"""
+    try:
+        _migrate_legacy_library()
+        key = f"{period_key}/{transporteur}"
+        _save_store_entry(LIBRARY_STORE, key, analyses, _library_meta(key, analyses))
+        
+        # Déclencher sauvegarde automatique si activée
+        _trigger_auto_backup('bibliotheque', 'Analyse archivée dans bibliothèque')
+        
+        return True
+    except Exception as e:
+        print(f"Erreur sauvegarde bibliothèque {period_key}/{transporteur}: {e}")
+        return False
+
+def delete_library_period(period_key):
+    """Supprime toutes les analyses d'une période"""
+    try:
+        _migrate_legacy_library()
+        _remove_store_entries(LIBRARY_STORE, lambda key: key.split('/', 1)[0] == period_key)
+        
+        # Déclencher sauvegarde automatique si activée
+        _trigger_auto_backup('bibliotheque', f'Période {period_key} supprimée')
+        
+        return True
+    except Exception as e:
+        print(f"Erreur suppression période {period_key}: {e}")
+        return False
+
 def delete_library():
     """Supprime la bibliothèque complète"""
     try:
         filepath = SAVE_DIR / "library.pkl"
         if filepath.exists():
             filepath.unlink()
+        _delete_store(LIBRARY_STORE)
         return True
     except Exception as e:
         print(f"Erreur suppression bibliothèque: {e}")
@@ -348,6 +1198,41 @@ def delete_library():
 # BIBLIOTHÈQUE LOGISTICIENS (Cumulative)
 # ============================================================================
 
+def _logisticien_meta(period_key, entry):
+    """Métadonnées d'une période logisticien (manifeste, sans le contenu)"""
+    return {
+        'filename': entry['filename'],
+        'size': int(entry['size']),
+        'uploaded_at': entry['uploaded_at'],
+        'year': int(entry['year']),
+        'month': int(entry['month']),
+        'blob': entry.get('blob')
+    }
+
+def _logisticien_to_store(entry):
+    """Entrée logisticien → entrée stockée (contenu remplacé par son hash)"""
+    if 'content' not in entry:
+        return entry
+    stored = {k: v for k, v in entry.items() if k != 'content'}
+    stored['blob'] = put_blob(entry['content'])
+    return stored
+
+def _logisticien_from_store(entry):
+    """Entrée stockée → entrée logisticien (contenu relu depuis son hash)"""
+    if entry is None or 'blob' not in entry:
+        return entry
+    loaded = {k: v for k, v in entry.items() if k != 'blob'}
+    loaded['content'] = get_blob(entry['blob'])
+    return loaded
+
+def _migrate_legacy_logisticiens():
+    with data_lock(BLOB_DIR, exclusive=False):
+        _migrate_legacy_pickle(
+            LOGISTICIENS_STORE, "logisticiens_library.pkl",
+            lambda data: {key: _logisticien_to_store(entry) for key, entry in data.items()},
+            _logisticien_meta
+            )
+
 def save_logisticiens_library(library_data):
     """
     Sauvegarde la bibliothèque de fichiers logisticiens
@@ -363,21 +1248,17 @@ def save_logisticiens_library(library_data):
                 'month': int
             }
         }
+    
+    Une entrée par période : seules les périodes modifiées sont réécrites.
     """
     try:
-        init_save_dir()
-        filepath = SAVE_DIR / "logisticiens_library.pkl"
-        with open(filepath, 'wb') as f:
-            pickle.dump(library_data, f)
+        with data_lock(BLOB_DIR, exclusive=False):
+            entries = {key: _logisticien_to_store(entry) for key, entry in library_data.items()}
+            _save_store(LOGISTICIENS_STORE, entries, _logisticien_meta)
+        collect_unused_blobs()
         
         # Déclencher sauvegarde automatique si activée
-        try:
-            import streamlit as st
-            if st.session_state.get('auto_backup_enabled', False):
-                from shared.auto_backup import trigger_backup_after_save
-                trigger_backup_after_save('logisticiens', 'Fichier logisticien ajouté')
-        except:
-            pass
+        _trigger_auto_backup('logisticiens', 'Fichier logisticien ajouté')
         
         return True
     except Exception as e:
@@ -392,26 +1273,129 @@ def load_logisticiens_library():
         Dict ou None
     """
     try:
-        filepath = SAVE_DIR / "logisticiens_library.pkl"
-        if filepath.exists():
-            with open(filepath, 'rb') as f:
-                return pickle.load(f)
-        return None
+        _migrate_legacy_logisticiens()
+        if not _store_exists(LOGISTICIENS_STORE):
+            return None
+        return {
+            key: _logisticien_from_store(entry)
+            for key, entry in _load_store(LOGISTICIENS_STORE).items()
+        }
     except Exception as e:
         print(f"Erreur chargement bibliothèque logisticiens: {e}")
         return None
 
+def list_logisticiens_entries():
+    """
+    Liste les périodes de la bibliothèque logisticiens sans charger les fichiers
+    
+    Lecture du seul manifeste (quelques Ko, quelle que soit la taille
+    de la bibliothèque).
+    
+    Returns:
+        Dict {'YYYY_MM': {'filename', 'size', 'uploaded_at', 'year', 'month'}}
+    """
+    try:
+        _migrate_legacy_logisticiens()
+        return _store_metadata(LOGISTICIENS_STORE, _logisticien_meta)
+    except Exception as e:
+        print(f"Erreur liste bibliothèque logisticiens: {e}")
+        return {}
+
+@cached_until_write
+def count_logisticiens_entries():
+    """Nombre de périodes de la bibliothèque logisticiens (sans relecture du manifeste entre deux écritures)"""
+    return len(list_logisticiens_entries())
+
+def load_logisticiens_entry(period_key):
+    """
+    Charge une seule période de la bibliothèque logisticiens
+    
+    Returns:
+        Dict de l'entrée ou None
+    """
+    try:
+        _migrate_legacy_logisticiens()
+        return _logisticien_from_store(_read_store_entry(LOGISTICIENS_STORE, period_key))
+    except Exception as e:
+        print(f"Erreur chargement logisticien {period_key}: {e}")
+        return None
+
+def save_logisticiens_entry(period_key, entry):
+    """Sauvegarde une seule période de la bibliothèque logisticiens"""
+    try:
+        _migrate_legacy_logisticiens()
+        with data_lock(BLOB_DIR, exclusive=False):
+            stored = _logisticien_to_store(entry)
+            _save_store_entry(LOGISTICIENS_STORE, period_key, stored, _logisticien_meta(period_key, stored))
+        collect_unused_blobs()
+        
+        # Déclencher sauvegarde automatique si activée
+        _trigger_auto_backup('logisticiens', 'Fichier logisticien ajouté')
+        
+        return True
+    except Exception as e:
+        print(f"Erreur sauvegarde logisticien {period_key}: {e}")
+        return False
+
+def delete_logisticiens_entry(period_key):
+    """Supprime une seule période de la bibliothèque logisticiens"""
+    try:
+        _migrate_legacy_logisticiens()
+        _remove_store_entries(LOGISTICIENS_STORE, [period_key])
+        collect_unused_blobs()
+        return True
+    except Exception as e:
+        print(f"Erreur suppression logisticien {period_key}: {e}")
+        return False
+
 def delete_logisticiens_library():
-    """Supprime la bibliothèque logisticiens"""
+    """Supprime la bibliothèque logisticiens (et son index)"""
     try:
-        filepath = SAVE_DIR / "logisticiens_library.pkl"
-        if filepath.exists():
-            filepath.unlink()
+        for filename in ("logisticiens_library.pkl", "logisticiens_index.pkl"):
+            filepath = SAVE_DIR / filename
+            if filepath.exists():
+                filepath.unlink()
+        _delete_store(LOGISTICIENS_STORE)
+        collect_unused_blobs()
         return True
     except Exception as e:
         print(f"Erreur suppression bibliothèque logisticiens: {e}")
         return False
 
+def save_logisticiens_index(index_data):
+    """
+    Sauvegarde l'index des références logisticiens
+    
+    Args:
+        index_data: Dict {
+            'YYYY_MM': DataFrame ['key', 'field', 'row']
+        }
+    """
+    try:
+        init_save_dir()
+        with data_lock(INDEX_LOCK):
+            atomic_pickle_dump(index_data, SAVE_DIR / "logisticiens_index.pkl")
+        return True
+    except Exception as e:
+        print(f"Erreur sauvegarde index logisticiens: {e}")
+        return False
+
+def load_logisticiens_index():
+    """
+    Charge l'index des références logisticiens
+    
+    Returns:
+        Dict ou None
+    """
+    try:
+        filepath = SAVE_DIR / "logisticiens_index.pkl"
+        if filepath.exists():
+            return _session_copy(cached_file_load(filepath, pickle.loads))
+        return None
+    except Exception as e:
+        print(f"Erreur chargement index logisticiens: {e}")
+        return None
+
 def _save_to_library(transporteur, df, data_dict, period_year, period_month, 
                      date_min, date_max, match_rate="N/A"):
     """
@@ -419,20 +1403,9 @@ def _save_to_library(transporteur, df, data_dict, period_year, period_month,
     """
     from datetime import datetime
     
-    # Charger la bibliothèque
-    library = load_library()
-    if library is None:
-        library = {}
-    
     # Créer la clé de période
     period_key = f"{period_year}_{period_month:02d}"
     
-    if period_key not in library:
-        library[period_key] = {}
-    
-    if transporteur not in library[period_key]:
-        library[period_key][transporteur] = []
-    
     # Extraire les partenaires si disponible
     partners = []
     partner_cols = [col for col in df.columns if 'partenaire' in col.lower()]
@@ -451,13 +1424,18 @@ def _save_to_library(transporteur, df, data_dict, period_year, period_month,
         'match_rate': match_rate
     }
     
-    # Ajouter à la bibliothèque (max 3 analyses par période/transporteur)
-    library[period_key][transporteur].insert(0, analysis_entry)
-    if len(library[period_key][transporteur]) > 3:
-        library[period_key][transporteur] = library[period_key][transporteur][:3]
-    
-    # Sauvegarder
-    save_library(library)
+    # Relire / insérer / réécrire sous verrou exclusif : deux archivages
+    # simultanés (autres sessions) s'ajoutent au lieu de s'écraser
+    with data_lock(LIBRARY_STORE):
+        analyses = load_library_entry(period_key, transporteur) or []
+        
+        # Ajouter à la bibliothèque (max 3 analyses par période/transporteur)
+        analyses.insert(0, analysis_entry)
+        if len(analyses) > 3:
+            analyses = analyses[:3]
+        
+        # Sauvegarder (seule cette entrée est réécrite)
+        save_library_entry(period_key, transporteur, analyses)
     
     print(f"✅ Archivé dans: {period_key}")
     print("="*60)
@@ -577,51 +1555,26 @@ def auto_archive_analysis(transporteur, df, data_dict, date_column='Date'):
         # ÉTAPE 2 : CHARGER FICHIERS LOGISTICIENS
         # ============================================================
         
-        from modules.logisticiens_library import load_logisticien_files_for_analysis
+        from modules.logisticiens_library import get_all_available_periods, match_references
         
-        log_files = load_logisticien_files_for_analysis(nb_months=6)  # 6 mois pour être sûr
+        nb_periods = len(get_all_available_periods()[:6])  # 6 mois pour être sûr
         
-        if len(log_files) == 0:
+        if nb_periods == 0:
             print(f"⚠️ Aucun fichier logisticien dans la bibliothèque")
             print(f"🔄 Fallback: utilisation date facture")
             return _fallback_date_detection(df, data_dict, transporteur, date_column)
         
-        print(f"✅ {len(log_files)} fichier(s) logisticien chargés")
-        
-        # ============================================================
-        # ÉTAPE 3 : FUSIONNER FICHIERS LOGISTICIENS
-        # ============================================================
-        
-        all_log_data = []
-        for log_file in log_files:
-            try:
-                log_file.seek(0)
-                df_log_temp = pd.read_excel(log_file, sheet_name='Facturation préparation')
-                all_log_data.append(df_log_temp)
-            except Exception as e:
-                print(f"⚠️ Erreur lecture fichier: {str(e)}")
-        
-        if not all_log_data:
-            print(f"⚠️ Impossible de lire les fichiers logisticiens")
-            print(f"🔄 Fallback: utilisation date facture")
-            return _fallback_date_detection(df, data_dict, transporteur, date_column)
-        
-        df_log = pd.concat(all_log_data, ignore_index=True)
-        print(f"✅ Fichiers logisticiens fusionnés: {len(df_log)} lignes")
+        print(f"✅ {nb_periods} fichier(s) logisticien disponibles")
         
         # ============================================================
-        # ÉTAPE 4 : MATCHING TRACKING → DATE COMMANDE
+        # ÉTAPE 3 : MATCHING TRACKING → DATE COMMANDE
         # ============================================================
         
-        # Nettoyer les trackings (enlever espaces, mettre en string)
-        df['_tracking_clean'] = df[tracking_col].astype(str).str.strip().str.replace('.0', '', regex=False)
-        df_log['_tracking_clean'] = df_log['Numéro de tracking'].astype(str).str.strip().str.replace('.0', '', regex=False)
-        
-        # Merger pour récupérer les dates de commande
-        df_merged = df.merge(
-            df_log[['_tracking_clean', 'Date de la commande']],
-            on='_tracking_clean',
-            how='left'
+        # Index des références logisticiens (même normalisation que les
+        # modules transporteurs, période la plus récente prioritaire)
+        df_merged = match_references(
+            df[tracking_col], fields=('tracking',), nb_months=6,
+            columns=['Date de la commande']
         )
         
         # Statistiques matching
@@ -637,7 +1590,7 @@ def auto_archive_analysis(transporteur, df, data_dict, date_column='Date'):
             return _fallback_date_detection(df, data_dict, transporteur, date_column)
         
         # ============================================================
-        # ÉTAPE 5 : DÉTECTION PÉRIODE SELON DATES COMMANDE
+        # ÉTAPE 4 : DÉTECTION PÉRIODE SELON DATES COMMANDE
         # ============================================================
         
         # Convertir en datetime
@@ -677,7 +1630,7 @@ def auto_archive_analysis(transporteur, df, data_dict, date_column='Date'):
             print(f"✅ PÉRIODE (fallback date max): {period_month:02d}/{period_year}")
         
         # ============================================================
-        # ÉTAPE 6 : SAUVEGARDE DANS BIBLIOTHÈQUE
+        # ÉTAPE 5 : SAUVEGARDE DANS BIBLIOTHÈQUE
         # ============================================================
         
         return _save_to_library(transporteur, df, data_dict, period_year, period_month,
@@ -0,0 +1,9 @@
+"""
+Configuration pytest : racine du dépôt dans le chemin d'import
+(modules/ et shared/ sont importés comme dans app.py)
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
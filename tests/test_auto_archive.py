@@ -0,0 +1,47 @@
+"""
+Auto-archivage : détection de période par les trackings logisticiens,
+avec la même normalisation des références que les modules transporteurs
+"""
+
+import io
+
+import pandas as pd
+import pytest
+
+from shared import persistence
+from modules import logisticiens_library
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(persistence, 'SAVE_DIR', tmp_path / '.greenlog_data')
+    monkeypatch.setattr(logisticiens_library, '_dataframe_cache', {})
+    monkeypatch.setattr(logisticiens_library, '_lookup_cache', {})
+    persistence.invalidate_cache()
+    persistence.init_save_dir()
+    
+    saved = {}
+    def save_to_library(transporteur, df, data_dict, year, month, date_min, date_max, match_rate):
+        saved.update(year=year, month=month, match_rate=match_rate, columns=list(df.columns))
+        return (True, year, month)
+    monkeypatch.setattr(persistence, '_save_to_library', save_to_library)
+    
+    yield saved
+    persistence.invalidate_cache()
+
+def test_reference_avec_point(library):
+    # '12.05' ne doit pas devenir '125' (autre commande, autre période)
+    df_log = pd.DataFrame({
+        'Numéro de tracking': ['12.05', 123456.0, '125', '126'],
+        'Date de la commande': pd.to_datetime(['2025-03-10', '2025-03-11', '2024-11-01', '2024-11-02']),
+    })
+    file = io.BytesIO(b'contenu')
+    file.name = 'logisticien.xlsx'
+    assert logisticiens_library.save_logisticien_file(file, 2025, 3, df=df_log)
+    
+    # Index dupliqué, références texte / numériques
+    df = pd.DataFrame({'Tracking': ['12.05', '123456', ' 12.05 ', 125.0], 'Montant': [1, 2, 3, 4]}, index=[0, 0, 1, 1])
+    
+    assert persistence.auto_archive_analysis('DPD', df, {}) == (True, 2025, 3)
+    assert library['match_rate'] == '100.0%'
+    # La facture archivée n'est pas modifiée
+    assert library['columns'] == ['Tracking', 'Montant']
@@ -0,0 +1,155 @@
+"""
+Méthode 3 Colissimo (code postal + date) : la jointure as-of
+correspondance_cp_date_batch donne la même expédition que l'ancienne
+recherche ligne par ligne
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.colissimo import correspondance_cp_date, correspondance_cp_date_batch
+
+def reference_cp_date(cp_retour, date_retour, df_log):
+    """Ancienne implémentation, un retour à la fois (référence)"""
+    try:
+        if pd.isna(cp_retour) or pd.isna(date_retour):
+            return None
+        
+        cp_str = str(int(cp_retour)) if isinstance(cp_retour, float) else str(cp_retour)
+        date_retour_dt = pd.to_datetime(date_retour, errors='coerce')
+        
+        if pd.isna(date_retour_dt):
+            return None
+        
+        matches = df_log[
+            (df_log['Code postal destination'].astype(str).str.strip() == cp_str) &
+            (df_log['Date_Expedition'] < date_retour_dt)
+        ]
+        
+        if len(matches) > 0:
+            matches_sorted = matches.sort_values('Date_Expedition', ascending=False)
+            row = matches_sorted.iloc[0]
+            
+            return {
+                'partenaire': row.get('Nom du partenaire', 'NON IDENTIFIÉ'),
+                'commande': str(row.get('Numéro de commande d\'origine', '')),
+                'tracking_aller': row.get('Tracking_Clean', ''),
+                'methode': 'CP + Date'
+            }
+    except:
+        pass
+    
+    return None
+
+CPS = ['75001', '69003', '13008', '33000', '59000']
+
+def random_log(rng, n, cp_kind):
+    cps = rng.choice(CPS, n)
+    if cp_kind == 'int':
+        cps = cps.astype(int)
+    elif cp_kind == 'text':
+        cps = np.array([f" {cp} " if i % 3 == 0 else cp for i, cp in enumerate(cps)], dtype=object)
+    # Peu de dates distinctes : nombreuses égalités (CP, date)
+    dates = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 20, n), unit='D')
+    dates = pd.Series(dates)
+    dates[rng.random(n) < 0.05] = pd.NaT
+    return pd.DataFrame({
+        'Code postal destination': cps,
+        'Date_Expedition': dates.astype('datetime64[ns]'),
+        'Nom du partenaire': [f"P{i % 7}" for i in range(n)],
+        "Numéro de commande d'origine": np.arange(n) + 1000,  # identifie la ligne retenue
+        'Tracking_Clean': [f"TRK{i:05d}" for i in range(n)],
+    })
+
+def random_returns(rng, n):
+    cps = []
+    dates = []
+    for _ in range(n):
+        cp = rng.choice(CPS + ['99999'])
+        kind = rng.integers(0, 5)
+        cps.append([int(cp), float(cp), cp, np.nan, f"{cp}.0"][kind])
+        day = int(rng.integers(-2, 24))
+        date = pd.Timestamp('2025-01-01') + pd.Timedelta(days=day)
+        dates.append([
+            date, date.strftime('%Y-%m-%d'), date.strftime('%d/%m/%Y'),
+            'pas une date', None, pd.NaT, date + pd.Timedelta(hours=12)
+        ][rng.integers(0, 7)])
+    return pd.Series(cps, dtype=object), pd.Series(dates, dtype=object)
+
+def matches(result):
+    return None if result is None else (result['partenaire'], result['commande'], result['tracking_aller'], result['methode'])
+
+def log_row(df_log, commande):
+    """Ligne du logisticien identifiée par son numéro de commande (unique)"""
+    position = int(np.flatnonzero(df_log["Numéro de commande d'origine"].astype(str) == commande)[0])
+    return position, df_log.iloc[position]
+
+def assert_same_match(batch_row, expected, df_log):
+    """
+    Même ligne que la référence ; à date égale (même CP, même date),
+    l'ancien tri quicksort descendant n'était pas stable : l'ordre entre
+    ex aequo n'est pas garanti, la jointure retient la première ligne
+    """
+    assert batch_row['found']
+    got = (batch_row['partenaire'], batch_row['commande'], batch_row['tracking_aller'], 'CP + Date')
+    if got == matches(expected):
+        return
+    
+    position, row = log_row(df_log, batch_row['commande'])
+    _, expected_row = log_row(df_log, expected['commande'])
+    assert row['Date_Expedition'] == expected_row['Date_Expedition']
+    cp_log = df_log['Code postal destination'].astype(str).str.strip()
+    assert cp_log.iloc[position] == str(expected_row['Code postal destination']).strip()
+    tied = np.flatnonzero(
+        (cp_log == cp_log.iloc[position]) & (df_log['Date_Expedition'] == row['Date_Expedition'])
+    )
+    assert position == tied[0]
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+@pytest.mark.parametrize("cp_kind", ['int', 'float', 'text'])
+@pytest.mark.parametrize("seed", range(5))
+def test_parite_aleatoire(cp_kind, seed):
+    rng = np.random.default_rng(seed)
+    df_log = random_log(rng, 200, cp_kind)
+    if cp_kind == 'float':
+        df_log['Code postal destination'] = df_log['Code postal destination'].astype(float)
+    cps, dates = random_returns(rng, 150)
+    
+    batch = correspondance_cp_date_batch(cps, dates, df_log)
+    assert list(batch.index) == list(cps.index)
+    for i in cps.index:
+        expected = reference_cp_date(cps[i], dates[i], df_log)
+        single = correspondance_cp_date(cps[i], dates[i], df_log)
+        if expected is None:
+            assert not batch.loc[i, 'found'], (cps[i], dates[i])
+            assert single is None
+        else:
+            assert_same_match(batch.loc[i], expected, df_log)
+            # Version un retour à la fois : même moteur, même ligne
+            assert matches(single) == (batch.loc[i, 'partenaire'], batch.loc[i, 'commande'], batch.loc[i, 'tracking_aller'], 'CP + Date')
+
+def test_egalite_premiere_ligne():
+    df_log = pd.DataFrame({
+        'Code postal destination': ['75001', '75001', '75001'],
+        'Date_Expedition': pd.to_datetime(['2025-01-05', '2025-01-05', '2025-01-01']),
+        'Nom du partenaire': ['A', 'B', 'C'],
+        "Numéro de commande d'origine": [1, 2, 3],
+        'Tracking_Clean': ['T1', 'T2', 'T3'],
+    })
+    cps = pd.Series(['75001', 75001.0], dtype=object)
+    dates = pd.Series(['2025-01-10', '2025-01-05'], dtype=object)
+    batch = correspondance_cp_date_batch(cps, dates, df_log)
+    assert list(batch['commande']) == ['1', '3']
+    for i in cps.index:
+        assert batch.loc[i, 'commande'] == reference_cp_date(cps[i], dates[i], df_log)['commande']
+
+def test_colonnes_manquantes():
+    df_log = pd.DataFrame({'Code postal destination': ['75001'], 'Date_Expedition': pd.to_datetime(['2025-01-01'])})
+    cps = pd.Series(['75001'], dtype=object)
+    dates = pd.Series(['2025-02-01'], dtype=object)
+    row = correspondance_cp_date_batch(cps, dates, df_log).iloc[0]
+    expected = reference_cp_date(cps[0], dates[0], df_log)
+    assert row['found']
+    assert (row['partenaire'], row['commande'], row['tracking_aller']) == (
+        expected['partenaire'], expected['commande'], expected['tracking_aller'])
@@ -0,0 +1,218 @@
+"""
+Consolidation de l'export global : _carrier_lines + consolidate_carrier_lines
+donnent le même tableau par tracking que l'ancienne collecte ligne par
+ligne (iterrows + dictionnaire)
+"""
+
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import export_global
+
+COST_COLUMNS = ['DPD', 'Mondial_Relay', 'Colissimo', 'Chronopost', 'Colis_Prive']
+
+class SessionState(dict):
+    __getattr__ = dict.__getitem__
+
+def _collect(all_data, df, partenaires_filter, cost_col, cost, tracking_col='Numéro de tracking',
+             partner_col='Nom du partenaire', commande_col="Numéro de commande d'origine",
+             date_col='Date de la commande'):
+    for _, row in df.iterrows():
+        tracking = str(row.get(tracking_col, ''))
+        partner = row.get(partner_col, 'Non attribué')
+        
+        if partenaires_filter and partner not in partenaires_filter:
+            continue
+        
+        if tracking not in all_data:
+            all_data[tracking] = {
+                'Partenaire': partner,
+                'Tracking': tracking,
+                'Num_Commande': row.get(commande_col, ''),
+                'Date': row.get(date_col, ''),
+            }
+        
+        all_data[tracking][cost_col] = cost(row)
+
+def reference_consolidation(state, partenaires_filter=None):
+    """Ancienne collecte (un dictionnaire par tracking), référence"""
+    all_data = {}
+    
+    if state.get('dpd_data'):
+        _collect(all_data, state['dpd_data']['df_with_taxes'], partenaires_filter,
+                 'DPD', lambda row: row.get('Montant total TTC', 0))
+    
+    if state.get('mondial_relay_data'):
+        _collect(all_data, state['mondial_relay_data']['df'], partenaires_filter,
+                 'Mondial_Relay', lambda row: row.get('Total avec taxe', 0))
+    
+    if state.get('colissimo_data'):
+        _collect(all_data, state['colissimo_data']['df_matched'], partenaires_filter,
+                 'Colissimo', lambda row: 0)
+    
+    if state.get('chronopost_data'):
+        def ecart_positif(row):
+            ecart = row.get('Difference_Prix', 0)
+            return ecart if ecart > 0 else 0
+        
+        _collect(all_data, state['chronopost_data']['df'], partenaires_filter, 'Chronopost', ecart_positif,
+                 tracking_col='Tracking', partner_col='Partenaire',
+                 commande_col='Num_Commande_Origine', date_col='Date')
+        
+        if 'df_surplus' in state['chronopost_data']:
+            df_surplus = state['chronopost_data']['df_surplus']
+            surplus_by_tracking = df_surplus.groupby('Tracking')['Montant_Surplus'].sum().to_dict()
+            for tracking, surplus in surplus_by_tracking.items():
+                tracking_str = str(tracking)
+                if tracking_str in all_data:
+                    current = all_data[tracking_str].get('Chronopost', 0)
+                    all_data[tracking_str]['Chronopost'] = current + surplus
+    
+    if state.get('colis_prive_data'):
+        _collect(all_data, state['colis_prive_data']['df'], partenaires_filter,
+                 'Colis_Prive', lambda row: row.get('Majoration service', 0))
+    
+    if not all_data:
+        return None
+    return pd.DataFrame.from_dict(all_data, orient='index')
+
+def consolidated(monkeypatch, state, partenaires_filter=None):
+    """Tableau produit par create_consolidated_export avant la mise en forme Excel"""
+    captured = {}
+    consolidate = export_global.consolidate_carrier_lines
+    
+    def capture(carrier_lines, chronopost_surplus=None):
+        captured['df'] = consolidate(carrier_lines, chronopost_surplus)
+        return None
+    
+    warnings = []
+    monkeypatch.setattr(export_global, 'consolidate_carrier_lines', capture)
+    monkeypatch.setattr(export_global, 'st', types.SimpleNamespace(
+        session_state=SessionState(state), warning=warnings.append
+    ))
+    assert export_global.create_consolidated_export(partenaires_filter) is None
+    assert warnings == []
+    return captured['df']
+
+def assert_same_table(result, expected):
+    if expected is None:
+        assert result is None
+        return
+    
+    assert list(result.index) == list(expected.index)
+    columns = ['Partenaire', 'Tracking', 'Num_Commande', 'Date'] + [c for c in COST_COLUMNS if c in expected.columns]
+    assert [c for c in columns if c in result.columns] == columns
+    for column in columns:
+        for tracking, got, want in zip(expected.index, result[column], expected[column]):
+            if pd.isna(want):
+                assert pd.isna(got), (column, tracking, got)
+            else:
+                assert got == want, (column, tracking, got, want)
+
+PARTNERS = np.array(['ALPHA', 'BETA', 'GAMMA', None, np.nan], dtype=object)
+
+def random_state(rng, n):
+    def trackings(size):
+        # Petit réservoir : doublons dans un même transporteur et entre transporteurs
+        return [f"TRK{v}" for v in rng.integers(0, n, size)]
+    
+    def costs(size):
+        values = rng.normal(5, 8, size).round(2)
+        values[rng.random(size) < 0.1] = np.nan
+        return values
+    
+    def base(size):
+        return pd.DataFrame({
+            'Numéro de tracking': trackings(size),
+            'Nom du partenaire': rng.choice(PARTNERS, size),
+            "Numéro de commande d'origine": [f"CMD{v}" for v in rng.integers(0, 10**6, size)],
+            'Date de la commande': pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 300, size), unit='D'),
+        })
+    
+    dpd = base(n)
+    dpd['Montant total TTC'] = costs(n)
+    mr = base(n)
+    mr['Total avec taxe'] = costs(n)
+    col = base(n // 2)
+    chrono = pd.DataFrame({
+        'Tracking': trackings(n),
+        'Partenaire': rng.choice(PARTNERS, n),
+        'Num_Commande_Origine': rng.integers(0, 10**6, n),
+        'Date': '2025-02-01',
+        'Difference_Prix': costs(n),
+    })
+    surplus = pd.DataFrame({
+        'Tracking': [f"TRK{v}" for v in rng.integers(0, 2 * n, n // 2)],
+        'Montant_Surplus': rng.normal(3, 1, n // 2).round(2),
+    })
+    # Colis Privé sans numéro de commande : valeur par défaut ''
+    cp = base(n // 2).drop(columns=["Numéro de commande d'origine"])
+    cp['Majoration service'] = costs(len(cp))
+    
+    return {
+        'dpd_data': {'df_with_taxes': dpd},
+        'mondial_relay_data': {'df': mr},
+        'colissimo_data': {'df_matched': col},
+        'chronopost_data': {'df': chrono, 'df_surplus': surplus},
+        'colis_prive_data': {'df': cp},
+    }
+
+@pytest.mark.parametrize("partenaires_filter", [None, ['ALPHA', 'GAMMA']], ids=['tous', 'filtre'])
+@pytest.mark.parametrize("seed", range(4))
+def test_parite_aleatoire(monkeypatch, seed, partenaires_filter):
+    state = random_state(np.random.default_rng(seed), 60)
+    
+    expected = reference_consolidation(state, partenaires_filter)
+    assert_same_table(consolidated(monkeypatch, state, partenaires_filter), expected)
+
+@pytest.mark.parametrize("partenaires_filter", [None, ['ALPHA']], ids=['tous', 'filtre'])
+def test_colonnes_manquantes(monkeypatch, partenaires_filter):
+    # DPD sans partenaire ni coût, Mondial Relay sans date
+    dpd = pd.DataFrame({'Numéro de tracking': ['A', 'B', 'A'], "Numéro de commande d'origine": ['1', '2', '3']})
+    mr = pd.DataFrame({
+        'Numéro de tracking': ['B', 'C', 'C'],
+        'Nom du partenaire': ['ALPHA', np.nan, 'ALPHA'],
+        'Total avec taxe': [1.5, np.nan, 2.5],
+    })
+    state = {'dpd_data': {'df_with_taxes': dpd}, 'mondial_relay_data': {'df': mr}}
+    
+    expected = reference_consolidation(state, partenaires_filter)
+    assert_same_table(consolidated(monkeypatch, state, partenaires_filter), expected)
+
+@pytest.mark.parametrize("partenaires_filter", [None, ['ALPHA']], ids=['tous', 'filtre'])
+def test_surplus_chronopost(monkeypatch, partenaires_filter):
+    # Surplus sur un tracking DPD seul, un tracking Chronopost, un tracking
+    # Colis Privé (collecté après Chronopost) et un tracking inconnu
+    dpd = pd.DataFrame({
+        'Numéro de tracking': ['D1', 'X'], 'Nom du partenaire': ['ALPHA', 'BETA'],
+        'Montant total TTC': [10.0, 4.0],
+    })
+    chrono = pd.DataFrame({
+        'Tracking': ['X', 'C1', 'C1'], 'Partenaire': ['BETA', 'ALPHA', 'ALPHA'],
+        'Difference_Prix': [2.0, -1.0, np.nan],
+    })
+    surplus = pd.DataFrame({
+        'Tracking': ['D1', 'C1', 'C1', 'P1', 'INCONNU', 'X'],
+        'Montant_Surplus': [1.0, 2.0, 0.5, 3.0, 9.0, 0.25],
+    })
+    cp = pd.DataFrame({'Numéro de tracking': ['P1'], 'Nom du partenaire': ['ALPHA'], 'Majoration service': [7.0]})
+    state = {
+        'dpd_data': {'df_with_taxes': dpd},
+        'chronopost_data': {'df': chrono, 'df_surplus': surplus},
+        'colis_prive_data': {'df': cp},
+    }
+    
+    expected = reference_consolidation(state, partenaires_filter)
+    result = consolidated(monkeypatch, state, partenaires_filter)
+    assert_same_table(result, expected)
+    assert result.loc['D1', 'Chronopost'] == 1.0
+    assert pd.isna(result.loc['P1', 'Chronopost'])
+
+def test_aucune_donnee(monkeypatch):
+    state = {'dpd_data': {'df_with_taxes': pd.DataFrame({'Numéro de tracking': ['A'], 'Nom du partenaire': ['BETA']})}}
+    
+    assert reference_consolidation(state, ['ALPHA']) is None
+    assert consolidated(monkeypatch, state, ['ALPHA']) is None
@@ -0,0 +1,59 @@
+"""
+Lecture parallèle : les processus du pool ne réexécutent pas le script
+principal (app.py sous Streamlit, sans garde __name__)
+"""
+
+import io
+import sys
+import types
+
+import pandas as pd
+import pytest
+
+from shared import ingestion
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(ingestion, '_executors', {})
+    yield
+    for executor in ingestion._executors.values():
+        executor.shutdown(wait=True)
+
+def csv_file(name, n):
+    file = io.BytesIO(pd.DataFrame({'a': range(n)}).to_csv(index=False).encode())
+    file.name = name
+    return file
+
+def test_worker_ne_reexecute_pas_le_script_principal(tmp_path, monkeypatch, fresh_pool):
+    marker = tmp_path / "app_executed"
+    script = tmp_path / "app.py"
+    script.write_text(f"open({str(marker)!r}, 'a').write('x')\n")
+    
+    # Comme sous Streamlit : __main__ est un module portant le chemin d'app.py
+    fake_main = types.ModuleType('__main__')
+    fake_main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, '__main__', fake_main)
+    
+    results = ingestion.parse_files(pd.read_csv, [csv_file('a.csv', 3), csv_file('b.csv', 5)], max_workers=2)
+    
+    assert [len(df) for df in results] == [3, 5]
+    assert not marker.exists()
+    assert sys.modules['__main__'] is fake_main
+
+def test_pool_reutilise(fresh_pool):
+    files = [csv_file('a.csv', 2), csv_file('b.csv', 4)]
+    
+    first = ingestion.parse_files(pd.read_csv, files, max_workers=2)
+    executor = ingestion._executors[2]
+    second = ingestion.parse_files(pd.read_csv, files, max_workers=2)
+    
+    assert [len(df) for df in first] == [len(df) for df in second] == [2, 4]
+    assert ingestion._executors[2] is executor
+
+def test_exceptions_par_fichier(fresh_pool):
+    bad = io.BytesIO(b'\x00\x01')
+    bad.name = 'bad.xlsx'
+    
+    results = ingestion.parse_files(pd.read_excel, [bad, bad], max_workers=2, return_exceptions=True)
+    
+    assert all(isinstance(r, Exception) for r in results)
@@ -0,0 +1,59 @@
+"""
+Normalisation vectorisée des références logisticiens
+(parité avec clean_tracking_number, valeur par valeur)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.dpd import clean_tracking_number
+from modules.logisticiens_library import normalize_references
+
+def expected(values):
+    return [clean_tracking_number(value) for value in values]
+
+@pytest.mark.parametrize("values, wanted", [
+    # Au-delà de 2^63 : pas de retour à -9223372036854775808
+    (pd.Series([1.5e19]), ['15000000000000000000']),
+    (pd.Series([12345678901234567890], dtype=object), ['12345678901234567890']),
+    (pd.Series([2.0 ** 63]), ['9223372036854775808']),
+    # inf : conservé en texte, sans interrompre le reste de la colonne
+    (pd.Series([np.inf, 123456.0, -np.inf]), ['inf', '123456', '-inf']),
+    (pd.Series([np.float64(np.inf), 'ABC'], dtype=object), ['inf', 'ABC']),
+    # Flottant non entier : tronqué comme int() dans clean_tracking_number
+    (pd.Series([123.7, -5.0]), ['123', '-5']),
+])
+def test_references_hors_int64(values, wanted):
+    assert list(normalize_references(values)) == wanted
+    assert list(normalize_references(values)) == expected(values)
+
+def test_colonne_mixte():
+    values = pd.Series([42, 3.0, ' X12 ', None, np.nan, '', np.int64(7), 1.5e19], dtype=object)
+    assert list(normalize_references(values)) == expected(values)
+
+@pytest.mark.parametrize("dtype, values", [
+    ('int64', [1, -2, 2 ** 62]),
+    ('uint64', [2 ** 64 - 1, 0]),
+    ('float64', [123456.0, np.nan, 9.5e18, 1e20]),
+    ('bool', [True, False]),
+])
+def test_colonnes_numeriques(dtype, values):
+    series = pd.Series(values, dtype=dtype)
+    assert list(normalize_references(series)) == expected(series)
+
+def test_index_conserve():
+    series = pd.Series([1.0, 'a', np.inf], index=[10, 5, 7], dtype=object)
+    result = normalize_references(series)
+    assert list(result.index) == [10, 5, 7]
+    assert result[7] == 'inf'
+
+def test_index_duplique():
+    # Périodes concaténées, factures filtrées : libellés d'index répétés
+    series = pd.Series([1.0, 'ab ', 2.5, None, 3, np.inf, 1.5e19], index=[0, 0, 1, 1, 2, 2, 2], dtype=object)
+    result = normalize_references(series)
+    assert list(result.index) == [0, 0, 1, 1, 2, 2, 2]
+    assert list(result) == expected(series) == ['1', 'ab', '2', '', '3', 'inf', '15000000000000000000']
+    
+    floats = pd.Series([4.0, np.nan, 5.0], index=['a', 'a', 'a'])
+    assert list(normalize_references(floats)) == ['4', '', '5']
@@ -0,0 +1,30 @@
+"""
+Copies rendues aux sessions depuis le cache partagé : une modification
+en place dans une session ne doit jamais atteindre le cache
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from shared import persistence
+
+@pytest.fixture(params=[True, False], ids=['copy_on_write', 'sans_copy_on_write'])
+def copy_on_write(request, monkeypatch):
+    monkeypatch.setattr(persistence, '_copy_on_write', lambda: request.param)
+    return request.param
+
+def test_session_copy_independante(copy_on_write):
+    cached = {'df': pd.DataFrame({'a': [1.0, 2.0], 'b': ['x', 'y']}), 'liste': [pd.Series([1, 2])]}
+    copy = persistence._session_copy(cached)
+    
+    copy['df'].loc[0, 'a'] = 99.0
+    copy['df']['b'] = copy['df']['b'].fillna('z')
+    copy['liste'][0].iloc[0] = 5
+    
+    assert cached['df']['a'].tolist() == [1.0, 2.0]
+    assert cached['liste'][0].tolist() == [1, 2]
+    if not copy_on_write:
+        # pandas 2 sans copy-on-write : aucune mémoire partagée avec le cache
+        fresh = persistence.frame_copy(cached['df'])
+        assert not np.shares_memory(fresh['a'].to_numpy(), cached['df']['a'].to_numpy())